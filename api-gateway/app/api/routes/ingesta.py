@@ -1,5 +1,14 @@
-from fastapi import APIRouter, HTTPException
-from app.orchestrator.docker_runner import DockerOrchestrator
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from typing import Optional
+from app.api.schemas import IngestionRequest
+from app.core.job_store import FINISHED_STATUSES, job_store
+from app.core.jobs import OWNER, job_runner
+from app.core.planner import planner
+from app.core.run_history import run_history
+from app.core.snapshot_cache import snapshot_cache
+from app.core.config import settings
+from app.orchestrator.docker_runner import DockerOrchestrator, memory_budget_bytes
+import asyncio
 import logging
 
 router = APIRouter(prefix="/api/ingesta", tags=["Ingesta"])
@@ -8,6 +17,101 @@ router = APIRouter(prefix="/api/ingesta", tags=["Ingesta"])
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SOURCES = ("mongodb", "mysql", "postgresql")
+LABELS = {"mongodb": "MongoDB", "mysql": "MySQL", "postgresql": "PostgreSQL"}
+
+
+def _cached_result(source: str, max_age: Optional[int]):
+    """Respuesta con el último snapshot de la fuente si es suficientemente reciente."""
+    if max_age is None:
+        return None
+    cached = snapshot_cache.fresh_result(source, max_age)
+    if cached is None:
+        return None
+    logger.info(f"Reutilizando snapshot de {source} con {cached['age_seconds']}s de antigüedad")
+    return {
+        "status": "success",
+        "database": source,
+        "result": cached["result"],
+        "cached": True,
+        "published_at": cached["published_at"],
+    }
+
+
+def _record_run(source: str, result: dict):
+    """Guarda la ejecución en el historial y agrega al resultado las regresiones detectadas."""
+    try:
+        registro = run_history.record(source, result)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el historial de {source}: {str(e)}")
+        return
+
+    if registro["regressions"]:
+        for table, motivo in registro["regressions"].items():
+            logger.warning(f"Regresión de rendimiento en {source}/{table}: {motivo}")
+        result["regressions"] = registro["regressions"]
+
+
+async def _submit_job(kind: str, source: str, work, params: Optional[dict], lock: Optional[str],
+                      wait: bool, response: Response):
+    """
+    Registra el trabajo en el job store y, con wait, espera su resultado. Si otra
+    réplica ya ejecuta el mismo lock, la petición se une a ese trabajo.
+    """
+    job, joined = await job_runner.submit(kind, source, work, params, lock)
+    if job is None:
+        raise HTTPException(status_code=409, detail=f"El lock {lock} está tomado por otra réplica; reintenta")
+    if joined:
+        logger.info(f"{kind} de {source} ya en curso en {job['owner']}: se une al trabajo {job['id']}")
+    if wait:
+        job = await job_runner.wait(job["id"], settings.JOB_WAIT_TIMEOUT_SECONDS)
+
+    if job["status"] == "success":
+        return {**job["result"], "job_id": job["id"], "joined": joined}
+    if job["status"] in FINISHED_STATUSES:
+        raise HTTPException(status_code=500, detail=job.get("error") or "Error desconocido")
+    response.status_code = 202
+    return {**job, "joined": joined}
+
+
+async def _run_ingestion(source: str, response: Response, body: Optional[IngestionRequest],
+                         max_age: Optional[int], wait: bool):
+    try:
+        queries = body.to_env() if body else None
+        cached = _cached_result(source, max_age) if queries is None else None
+        if cached is not None:
+            return cached
+
+        async def work():
+            logger.info(f"Iniciando ingesta de {LABELS[source]}...")
+            orchestrator = DockerOrchestrator()
+            result = await getattr(orchestrator, f"run_{source}_script")(queries)
+            if queries is None:
+                _record_run(source, result)
+
+            if result["status"] == "error":
+                logger.error(f"Error en ingesta {LABELS[source]}: {result.get('error')}")
+                return result
+
+            # Un export filtrado no es el snapshot completo de sus tablas
+            if queries is None:
+                snapshot_cache.publish(source, result["result"])
+            logger.info(f"Ingesta de {LABELS[source]} completada exitosamente")
+            return result
+
+        # Una sola ingesta completa por fuente a la vez entre todas las réplicas
+        lock = f"ingesta:{source}" if queries is None else None
+        return await _submit_job("ingesta", source, work, {"queries": queries}, lock, wait, response)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error inesperado en {LABELS[source]}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error inesperado: {str(e)}"
+        )
+
 
 @router.get("/health")
 async def health_check():
@@ -30,99 +134,230 @@ async def health_check():
 
 
 @router.post("/mongodb")
-async def run_mongodb_ingestion():
+async def run_mongodb_ingestion(response: Response, body: Optional[IngestionRequest] = None,
+                                max_age: Optional[int] = Query(None, ge=0), wait: bool = Query(True)):
     """
     Ejecuta el script de ingesta de MongoDB en un contenedor efímero.
 
+    Args:
+        max_age: Si se indica, y la última ingesta exitosa tiene como máximo
+            max_age segundos, se retorna ese resultado sin lanzar un contenedor
+        body: Columnas y filtros por tabla; solo se exportan esas tablas, filtradas
+            en la base de origen (no usa max_age ni publica el último snapshot)
+        wait: Si es False, responde 202 con el trabajo sin esperar a que termine
+            (consultar en GET /api/ingesta/jobs/{job_id})
+
     Returns:
         Resultado de la ingesta con URLs de archivos en S3
     """
-    try:
-        logger.info("Iniciando ingesta de MongoDB...")
-        orchestrator = DockerOrchestrator()
-        result = await orchestrator.run_mongodb_script()
+    return await _run_ingestion("mongodb", response, body, max_age, wait)
 
-        if result["status"] == "error":
-            logger.error(f"Error en ingesta MongoDB: {result.get('error')}")
-            raise HTTPException(
-                status_code=500,
-                detail=result.get("error", "Error desconocido")
-            )
 
-        logger.info("Ingesta de MongoDB completada exitosamente")
-        return result
+@router.post("/mysql")
+async def run_mysql_ingestion(response: Response, body: Optional[IngestionRequest] = None,
+                              max_age: Optional[int] = Query(None, ge=0), wait: bool = Query(True)):
+    """
+    Ejecuta el script de ingesta de MySQL en un contenedor efímero.
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error inesperado en MongoDB: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error inesperado: {str(e)}"
-        )
+    Args:
+        max_age: Si se indica, y la última ingesta exitosa tiene como máximo
+            max_age segundos, se retorna ese resultado sin lanzar un contenedor
+        body: Columnas y filtros por tabla; solo se exportan esas tablas, filtradas
+            en la base de origen (no usa max_age ni publica el último snapshot)
+        wait: Si es False, responde 202 con el trabajo sin esperar a que termine
+            (consultar en GET /api/ingesta/jobs/{job_id})
+
+    Returns:
+        Resultado de la ingesta con URLs de archivos en S3
+    """
+    return await _run_ingestion("mysql", response, body, max_age, wait)
 
 
-@router.post("/mysql")
-async def run_mysql_ingestion():
+@router.post("/postgresql")
+async def run_postgresql_ingestion(response: Response, body: Optional[IngestionRequest] = None,
+                                   max_age: Optional[int] = Query(None, ge=0), wait: bool = Query(True)):
     """
-    Ejecuta el script de ingesta de MySQL en un contenedor efímero.
+    Ejecuta el script de ingesta de PostgreSQL en un contenedor efímero.
+
+    Args:
+        max_age: Si se indica, y la última ingesta exitosa tiene como máximo
+            max_age segundos, se retorna ese resultado sin lanzar un contenedor
+        body: Columnas y filtros por tabla; solo se exportan esas tablas, filtradas
+            en la base de origen (no usa max_age ni publica el último snapshot)
+        wait: Si es False, responde 202 con el trabajo sin esperar a que termine
+            (consultar en GET /api/ingesta/jobs/{job_id})
 
     Returns:
         Resultado de la ingesta con URLs de archivos en S3
     """
+    return await _run_ingestion("postgresql", response, body, max_age, wait)
+
+
+@router.post("/{source}/plan")
+async def plan_ingestion(source: str, apply: bool = Query(True)):
+    """
+    Estima filas, bytes y duración por tabla con estadísticas de catálogo de la fuente
+    (pg_class, information_schema.TABLES o collStats, sin leer filas) y el rendimiento
+    histórico, y elige la estrategia de cada tabla: single, chunked, parallel o sharded.
+
+    Args:
+        apply: Si es True, las siguientes ingestas de la fuente usan el plan hasta que
+            vence (PLAN_MAX_AGE_SECONDS)
+    """
+    if source not in SOURCES:
+        raise HTTPException(status_code=404, detail=f"Fuente desconocida: {source}")
     try:
-        logger.info("Iniciando ingesta de MySQL...")
         orchestrator = DockerOrchestrator()
-        result = await orchestrator.run_mysql_script()
-
-        if result["status"] == "error":
-            logger.error(f"Error en ingesta MySQL: {result.get('error')}")
-            raise HTTPException(
-                status_code=500,
-                detail=result.get("error", "Error desconocido")
+        stats = await orchestrator.collect_catalog_stats(source)
+        if stats["status"] == "error" or "tablas" not in stats["result"]:
+            result = stats.get("result") or {}
+            error = stats.get("error") or result.get("error") or (
+                "la salida estándar del contenedor no es JSON" if "output" in result else "resultado sin estadísticas"
             )
+            logger.error(f"Error leyendo estadísticas de {source}: {error}")
+            raise HTTPException(status_code=500, detail=f"No se pudieron leer las estadísticas: {error}")
 
-        logger.info("Ingesta de MySQL completada exitosamente")
-        return result
+        history = run_history.throughput(source, window=settings.HISTORY_BASELINE_RUNS)
+        plan = planner.build(source, stats["result"]["tablas"], history, memory_budget_bytes(source))
+        if apply:
+            planner.save(plan)
+            logger.info(f"Plan de {source} aplicado: {planner.table_strategies(plan)}, shards: {plan['shard_table']}")
+        return {**plan, "applied": apply}
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error inesperado en MySQL: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error inesperado: {str(e)}"
-        )
+        logger.error(f"Error inesperado planificando {source}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 
-@router.post("/postgresql")
-async def run_postgresql_ingestion():
+@router.get("/{source}/plan")
+async def get_plan(source: str):
+    """Plan vigente de la fuente (el que usarán las siguientes ingestas)."""
+    if source not in SOURCES:
+        raise HTTPException(status_code=404, detail=f"Fuente desconocida: {source}")
+    plan = planner.current(source)
+    if plan is None:
+        raise HTTPException(status_code=404, detail=f"No hay un plan vigente de {source}")
+    return plan
+
+
+@router.delete("/{source}/plan")
+async def delete_plan(source: str):
+    """Descarta el plan vigente: las ingestas vuelven a la configuración por defecto."""
+    if source not in SOURCES:
+        raise HTTPException(status_code=404, detail=f"Fuente desconocida: {source}")
+    return {"source": source, "deleted": planner.clear(source)}
+
+
+@router.post("/compaction")
+async def run_compaction(response: Response, tables: Optional[str] = None, dry_run: bool = Query(False),
+                         wait: bool = Query(True)):
     """
-    Ejecuta el script de ingesta de PostgreSQL en un contenedor efímero.
+    Compacta los exports de cada tabla: une el último snapshot completo (o los exports
+    delta pendientes sobre la versión anterior) en un Parquet, reescribe el puntero
+    <tabla>/_latest.json y borra los archivos reemplazados con más de
+    COMPACTION_RETENTION_DAYS días. Pensado para ejecutarse periódicamente (cron).
 
-    Returns:
-        Resultado de la ingesta con URLs de archivos en S3
+    Args:
+        tables: Tablas separadas por coma (por defecto COMPACTION_TABLES o todas)
+        dry_run: Si es True, solo reporta qué se compactaría y borraría
+        wait: Si es False, responde 202 con el trabajo sin esperar a que termine
     """
     try:
-        logger.info("Iniciando ingesta de PostgreSQL...")
-        orchestrator = DockerOrchestrator()
-        result = await orchestrator.run_postgresql_script()
+        table_list = [t.strip() for t in tables.split(",") if t.strip()] if tables else None
 
-        if result["status"] == "error":
-            logger.error(f"Error en ingesta PostgreSQL: {result.get('error')}")
-            raise HTTPException(
-                status_code=500,
-                detail=result.get("error", "Error desconocido")
-            )
+        async def work():
+            orchestrator = DockerOrchestrator()
+            result = await orchestrator.run_compaction(table_list, dry_run)
+            if result["status"] == "error":
+                logger.error(f"Error en compactación: {result.get('error')}")
+                return result
+
+            for table, info in result["result"].items():
+                if isinstance(info, dict) and "error" in info:
+                    logger.warning(f"Compactación de {table} falló: {info['error']}")
+            return result
 
-        logger.info("Ingesta de PostgreSQL completada exitosamente")
-        return result
+        # Una compactación a la vez: dos réplicas reescribiendo los punteros se pisarían
+        lock = "compaction" if not dry_run else None
+        return await _submit_job("compaction", "compaction", work, {"tables": table_list, "dry_run": dry_run},
+                                 lock, wait, response)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error inesperado en PostgreSQL: {str(e)}")
+        logger.error(f"Error inesperado en compactación: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+
+
+@router.get("/jobs")
+async def list_jobs(source: Optional[str] = None, limit: int = Query(20, ge=1, le=1000)):
+    """Trabajos más recientes (de cualquier réplica), opcionalmente de una fuente o "compaction"."""
+    if source is not None and source not in SOURCES + ("compaction",):
+        raise HTTPException(status_code=404, detail=f"Fuente desconocida: {source}")
+    try:
+        return {"owner": OWNER, "jobs": await asyncio.to_thread(job_store.list_jobs, source, limit)}
+    except Exception as e:
+        logger.error(f"Error leyendo trabajos: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error leyendo trabajos: {str(e)}")
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0)):
+    """
+    Estado y resultado de un trabajo, sin importar qué réplica lo ejecuta.
+
+    Args:
+        wait: Segundos que se espera a que termine antes de responder (long polling)
+    """
+    job = await job_runner.wait(job_id, wait) if wait else await job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo desconocido: {job_id}")
+    return job
+
+
+@router.get("/history")
+async def get_run_history(
+    source: Optional[str] = None,
+    table: Optional[str] = None,
+    window: int = Query(100, ge=1, le=10000),
+    limit: int = Query(20, ge=1, le=1000),
+):
+    """
+    Historial de ejecuciones: percentiles p50/p90/p99 de duración, registros/s, bytes y
+    registros por tabla (sobre las últimas `window` ejecuciones exitosas) y las últimas
+    `limit` ejecuciones con las regresiones detectadas.
+    """
+    if source is not None and source not in SOURCES:
+        raise HTTPException(status_code=404, detail=f"Fuente desconocida: {source}")
+    try:
+        return run_history.summary(source=source, table=table, window=window, limit=limit)
+    except Exception as e:
+        logger.error(f"Error leyendo historial: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error leyendo historial: {str(e)}")
+
+
+@router.get("/{source}/{table}/latest")
+async def get_latest_snapshot(source: str, table: str, request: Request, response: Response):
+    """
+    Retorna los metadatos del último snapshot publicado de una tabla (URL, registros,
+    fecha) sin ejecutar una ingesta. Soporta If-None-Match para respuestas 304.
+    """
+    if source not in SOURCES:
+        raise HTTPException(status_code=404, detail=f"Fuente desconocida: {source}")
+
+    snapshot = snapshot_cache.get(source, table)
+    if snapshot is None:
         raise HTTPException(
-            status_code=500,
-            detail=f"Error inesperado: {str(e)}"
-        )
\ No newline at end of file
+            status_code=404,
+            detail=f"No hay snapshot publicado de {source}/{table}; ejecuta POST /api/ingesta/{source}"
+        )
+
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if snapshot["etag"] in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers={"ETag": snapshot["etag"]})
+
+    response.headers["ETag"] = snapshot["etag"]
+    response.headers["Cache-Control"] = "no-cache"
+    return {key: value for key, value in snapshot.items() if key != "etag"}
@@ -0,0 +1,59 @@
+from pydantic import BaseModel, Field, StrictBool, StrictInt, StringConstraints, model_validator
+from typing import Any, Dict, List, Literal, Optional, Union
+from typing_extensions import Annotated
+
+# Nombres de tabla y columna: identificadores simples; con punto solo subcampos de MongoDB
+Identifier = Annotated[str, StringConstraints(pattern=r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$",
+                                              max_length=128)]
+Scalar = Union[StrictBool, StrictInt, float, str]
+
+MAX_IN_VALUES = 1000
+
+
+class ColumnFilter(BaseModel):
+    """
+    Predicado simple sobre una columna:
+    - eq / ne: igualdad o desigualdad (value null equivale a IS NULL / IS NOT NULL)
+    - gt / gte / lt / lte: comparación con un valor
+    - in: pertenencia a una lista de valores
+    - between: rango cerrado [value[0], value[1]]
+    - last_days: ventana de fechas de los últimos `value` días (UTC)
+    """
+    column: Identifier
+    op: Literal["eq", "ne", "gt", "gte", "lt", "lte", "in", "between", "last_days"]
+    value: Union[Scalar, List[Scalar], None] = None
+
+    @model_validator(mode="after")
+    def check_value(self) -> "ColumnFilter":
+        if self.op == "in":
+            if not isinstance(self.value, list) or not 0 < len(self.value) <= MAX_IN_VALUES:
+                raise ValueError(f"'in' requiere una lista de 1 a {MAX_IN_VALUES} valores")
+        elif self.op == "between":
+            if not isinstance(self.value, list) or len(self.value) != 2:
+                raise ValueError("'between' requiere una lista [desde, hasta]")
+        elif self.op == "last_days":
+            if isinstance(self.value, bool) or not isinstance(self.value, int) or self.value <= 0:
+                raise ValueError("'last_days' requiere un número entero de días mayor a 0")
+        elif isinstance(self.value, list):
+            raise ValueError(f"'{self.op}' requiere un valor simple")
+        elif self.value is None and self.op not in ("eq", "ne"):
+            raise ValueError(f"'{self.op}' requiere un valor")
+        return self
+
+
+class TableQuery(BaseModel):
+    """Columnas y filtros a aplicar en la base de origen para una tabla o colección."""
+    columns: Optional[List[Identifier]] = Field(None, min_length=1)
+    filters: List[ColumnFilter] = Field(default_factory=list, max_length=20)
+
+
+class IngestionRequest(BaseModel):
+    """
+    Cuerpo opcional de los POST de ingesta. Solo se exportan las tablas indicadas,
+    con sus columnas y filtros resueltos por la base de datos de origen.
+    """
+    tables: Dict[Identifier, TableQuery] = Field(..., min_length=1)
+
+    def to_env(self) -> Dict[str, Any]:
+        """Consultas por tabla para la variable TABLE_QUERIES de los contenedores."""
+        return {name: query.model_dump(exclude_none=True) for name, query in self.tables.items()}
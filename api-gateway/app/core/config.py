@@ -9,6 +9,14 @@ class Settings(BaseSettings):
     MONGO_USER: str
     MONGO_PASSWORD: str
     MONGO_DATABASE: str
+    # Lecturas paralelas por rangos de _id (1 = un solo cursor)
+    MONGO_PARALLEL_WORKERS: int = 1
+    # Serialización: "json" (arreglo) o "ndjson"; JSON compacto sin indentación
+    # ("parquet" solo con MONGO_READER=arrow)
+    MONGO_OUTPUT_FORMAT: str = "json"
+    MONGO_JSON_COMPACT: bool = False
+    # Lector: "dict" (pymongo) o "arrow" (pymongoarrow, BSON decodificado a columnas)
+    MONGO_READER: str = "dict"
 
     # MySQL
     MYSQL_HOST: str
@@ -16,6 +24,11 @@ class Settings(BaseSettings):
     MYSQL_USER: str
     MYSQL_PASSWORD: str
     MYSQL_DATABASE: str
+    # Réplicas de lectura: "host1:3306,host2:3306" (opcional)
+    MYSQL_REPLICA_HOSTS: Optional[str] = None
+    MYSQL_MAX_REPLICA_LAG: int = 30
+    # Tablas exportadas solo como cambios (hash por fila), separadas por coma
+    MYSQL_DELTA_TABLES: Optional[str] = None
 
     # PostgreSQL
     POSTGRES_HOST: str
@@ -23,14 +36,116 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DATABASE: str
+    # Réplicas de lectura: "host1:5432,host2:5432" (opcional)
+    POSTGRES_REPLICA_HOSTS: Optional[str] = None
+    POSTGRES_MAX_REPLICA_LAG: int = 30
+    # Tablas exportadas solo como cambios (hash por fila), separadas por coma
+    POSTGRES_DELTA_TABLES: Optional[str] = None
+    # Dataset derivado compras_detalle (Parquet), opcionalmente con precios del export de productos
+    POSTGRES_COMPRAS_DETALLE: bool = False
+    POSTGRES_COMPRAS_DETALLE_PRECIOS: bool = False
+    # Columna presente en compra_productos y compra_cantidades que ordena las líneas de
+    # cada compra (p. ej. un id serial); obligatoria para emparejar producto y cantidad
+    POSTGRES_COMPRAS_DETALLE_ORDER_COLUMN: Optional[str] = None
+
+    # Extracción SQL: motor "arrow" (columnar) o "pandas"; formato "csv" o "parquet"
+    SQL_EXTRACT_ENGINE: str = "arrow"
+    SQL_OUTPUT_FORMAT: str = "csv"
+
+    # Perfiles de recursos por fuente para los contenedores de scripts.
+    # Memoria en formato Docker ("512m", "2g"); CPUs como fracción (1.5 = 1.5 CPUs);
+    # tmpfs opcional para /tmp ("1g"). Sin tmpfs, el volcado a disco usa la capa del contenedor;
+    # con tmpfs, lo volcado ocupa memoria del contenedor y se descuenta del presupuesto.
+    MONGO_MEM_LIMIT: Optional[str] = "2g"
+    MONGO_CPUS: Optional[float] = 1.0
+    MONGO_TMPFS_SIZE: Optional[str] = None
+    MYSQL_MEM_LIMIT: Optional[str] = "2g"
+    MYSQL_CPUS: Optional[float] = 1.0
+    MYSQL_TMPFS_SIZE: Optional[str] = None
+    POSTGRES_MEM_LIMIT: Optional[str] = "2g"
+    POSTGRES_CPUS: Optional[float] = 1.0
+    POSTGRES_TMPFS_SIZE: Optional[str] = None
+    # Fracción del límite de memoria que cada buffer de tabla puede ocupar antes de volcar a disco
+    SCRIPT_MEMORY_BUDGET_RATIO: float = 0.25
+    # Latencia objetivo de cada lote de lectura (los scripts ajustan el tamaño del lote)
+    SCRIPT_BATCH_TARGET_SECONDS: float = 2.0
+
+    # Reparto de una tabla grande entre varios contenedores en paralelo (shards por
+    # rango de clave, o de _id en MongoDB). El resto de tablas va en el contenedor normal.
+    MONGO_SHARD_TABLE: Optional[str] = None
+    MONGO_SHARD_COUNT: int = 1
+    MYSQL_SHARD_TABLE: Optional[str] = None
+    MYSQL_SHARD_COUNT: int = 1
+    POSTGRES_SHARD_TABLE: Optional[str] = None
+    POSTGRES_SHARD_COUNT: int = 1
+    # Reintentos de cada shard fallido (se reintenta solo ese shard)
+    SHARD_MAX_RETRIES: int = 2
 
     # AWS S3
     AWS_BUCKET_NAME: str
     AWS_REGION: Optional[str] = "us-east-1"
+    # Almacenamiento de exports: "s3" (AWS o emulador compatible vía AWS_ENDPOINT_URL) o "local"
+    STORAGE_BACKEND: str = "s3"
+    AWS_ENDPOINT_URL: Optional[str] = None
+    # Ruta del host que se monta en los scripts cuando STORAGE_BACKEND=local
+    LOCAL_STORAGE_HOST_PATH: Optional[str] = "/var/lib/pharmavida-ingesta"
+    # Subidas multiparte con checkpoint (reanudables) y antigüedad máxima de una subida pendiente
+    RESUMABLE_UPLOADS: bool = False
+    CHECKPOINT_MAX_AGE_HOURS: int = 24
 
     # Docker Network (opcional)
     DOCKER_NETWORK: Optional[str] = "bridge"
 
+    # Historial de ejecuciones (SQLite) y detección de regresiones de rendimiento
+    HISTORY_DB_PATH: str = "/data/history/ingesta_history.db"
+    # Ejecuciones previas de cada tabla que forman la línea base
+    HISTORY_BASELINE_RUNS: int = 10
+    HISTORY_MIN_BASELINE_RUNS: int = 3
+    # Caída de registros/s o aumento de duración (fracción) que se marca como regresión
+    HISTORY_REGRESSION_THRESHOLD: float = 0.3
+
+    # Planificador (POST /api/ingesta/{source}/plan): estima filas, bytes y duración por
+    # tabla con estadísticas de catálogo y el rendimiento histórico, y elige la estrategia
+    # que usan las siguientes ingestas mientras el plan no venza.
+    PLAN_MAX_AGE_SECONDS: int = 3600
+    # Registros/s supuestos para tablas sin historial
+    PLAN_DEFAULT_ROWS_PER_S: float = 20000
+    # Memoria en pandas respecto del tamaño en disco de la tabla
+    PLAN_MEMORY_FACTOR: float = 3.0
+    # Duración estimada a partir de la cual se lee en rangos paralelos (MongoDB) o en shards
+    PLAN_PARALLEL_SECONDS: float = 120
+    PLAN_SHARD_SECONDS: float = 600
+    PLAN_MAX_WORKERS: int = 4
+    PLAN_MAX_SHARDS: int = 8
+
+    # Compactación (POST /api/ingesta/compaction): une por tabla el último snapshot o los
+    # exports delta en un Parquet, actualiza el puntero <tabla>/_latest.json y borra los
+    # archivos reemplazados con más de COMPACTION_RETENTION_DAYS días.
+    # Tablas separadas por coma; sin valor, todas las carpetas del bucket
+    COMPACTION_TABLES: Optional[str] = None
+    COMPACTION_RETENTION_DAYS: float = 7
+    # Versiones compactadas que se conservan siempre (la vigente y las anteriores)
+    COMPACTION_KEEP_VERSIONS: int = 2
+    COMPACTION_MEM_LIMIT: Optional[str] = "2g"
+    COMPACTION_CPUS: Optional[float] = 1.0
+    COMPACTION_TMPFS_SIZE: Optional[str] = None
+
+    # Estado compartido entre réplicas del gateway (workers de uvicorn o nodos): trabajos
+    # y sus resultados, locks por fuente, plan vigente y último snapshot publicado.
+    # "sqlite": archivo compartido por los workers de un nodo; "redis": varios nodos (JOB_STORE_URL)
+    JOB_STORE_BACKEND: str = "sqlite"
+    JOB_STORE_PATH: str = "/data/history/ingesta_jobs.db"
+    JOB_STORE_URL: Optional[str] = None
+    # Vigencia del lock de una ingesta; la réplica que la ejecuta lo renueva cada tercio
+    # del plazo y, si muere, vence y otra réplica puede volver a lanzarla
+    RUN_LOCK_TTL_SECONDS: float = 60
+    # Tiempo que se conservan los trabajos terminados
+    JOB_RETENTION_SECONDS: int = 604800
+    # Espera máxima de una petición con wait=true antes de responder 202 con el trabajo en curso
+    JOB_WAIT_TIMEOUT_SECONDS: float = 3600
+    # Intervalo de consulta del estado de un trabajo que corre en otra réplica
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,400 @@
+from abc import ABC, abstractmethod
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+from app.core.config import settings
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    import redis
+except ImportError:  # Solo se requiere con JOB_STORE_BACKEND=redis
+    redis = None
+
+# Estados de un trabajo; los terminales no cambian más
+FINISHED_STATUSES = ("success", "error", "lost")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    heartbeat_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_source ON jobs(source, created_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    job_id TEXT,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore(ABC):
+    """
+    Estado compartido entre réplicas del gateway (workers de uvicorn o nodos):
+    - trabajos: estado y resultado de cada ejecución, consultables desde cualquier réplica
+    - leases: locks con vencimiento (un dueño a la vez); si la réplica dueña muere,
+      el lock se libera solo al vencer
+    - valores con TTL: plan vigente y último snapshot publicado de cada fuente
+    """
+
+    def create_job(self, kind: str, source: str, owner: str, params: Optional[Dict[str, Any]] = None,
+                   job_id: Optional[str] = None) -> Dict[str, Any]:
+        job = {
+            "id": job_id or uuid.uuid4().hex,
+            "kind": kind,
+            "source": source,
+            "status": "running",
+            "owner": owner,
+            "params": params,
+            "result": None,
+            "error": None,
+            "created_at": _now(),
+            "heartbeat_at": _now(),
+            "finished_at": None,
+        }
+        self._save_job(job)
+        return job
+
+    def finish_job(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+                   error: Optional[str] = None) -> bool:
+        """
+        Pasa el trabajo a un estado terminal; False si no se cambió. Cualquier réplica
+        puede marcar "lost" un trabajo sin heartbeat, así que el cambio es condicional:
+        "lost" solo reemplaza un trabajo en curso, y el resultado de la réplica dueña
+        reemplaza un "lost" pero nunca otro "success" o "error".
+        """
+        unless = FINISHED_STATUSES if status == "lost" else ("success", "error")
+        return self.update_job(job_id, unless=unless, status=status, result=result, error=error,
+                               finished_at=_now())
+
+    def heartbeat(self, job_id: str) -> None:
+        self.update_job(job_id, heartbeat_at=_now())
+
+    @abstractmethod
+    def _save_job(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_job(self, job_id: str, unless: tuple = (), **fields) -> bool:
+        """
+        Actualiza campos del trabajo de forma atómica, salvo que su estado esté en
+        unless; True si se actualizó.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_jobs(self, source: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Trabajos más recientes primero."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def acquire_lease(self, name: str, owner: str, job_id: Optional[str], ttl: float) -> bool:
+        """Toma el lock si está libre o vencido (no es reentrante); True si quedó a nombre de owner."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def renew_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Extiende el lock; False si ya no pertenece a owner."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def lease_holder(self, name: str) -> Optional[Dict[str, Any]]:
+        """Dueño vigente del lock: {'owner', 'job_id', 'expires_in_s'} o None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_value(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Guarda el valor; sin ttl no vence y con ttl <= 0 queda vencido (se borra)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_value(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_value(self, key: str) -> bool:
+        raise NotImplementedError
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Backend embebido en SQLite (modo WAL): sirve para un nodo con varios workers de
+    uvicorn que comparten el archivo, y para pruebas. Los leases usan el reloj local.
+    """
+
+    JSON_FIELDS = ("params", "result")
+
+    def __init__(self, db_path: str, retention_seconds: int):
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # El esquema se crea en el primer uso para no fallar al importar sin volumen
+        if not self._initialized:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                self._initialized = True
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for field in self.JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] is not None else None
+        return job
+
+    def _save_job(self, job):
+        corte = (datetime.now(timezone.utc) - timedelta(seconds=self.retention_seconds)).isoformat()
+        values = {key: json.dumps(value) if key in self.JSON_FIELDS and value is not None else value
+                  for key, value in job.items()}
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (corte,))
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(values)}) VALUES ({', '.join('?' for _ in values)})",
+                tuple(values.values()),
+            )
+
+    def update_job(self, job_id, unless=(), **fields):
+        values = {key: json.dumps(value) if key in self.JSON_FIELDS and value is not None else value
+                  for key, value in fields.items()}
+        query = f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in values)} WHERE id = ?"
+        if unless:
+            query += f" AND status NOT IN ({', '.join('?' for _ in unless)})"
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(query, (*values.values(), job_id, *unless))
+            return cursor.rowcount == 1
+
+    def get_job(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, source=None, limit=20):
+        query, params = "SELECT * FROM jobs", []
+        if source is not None:
+            query += " WHERE source = ?"
+            params.append(source)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, (*params, limit)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def acquire_lease(self, name, owner, job_id, ttl):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO leases (name, owner, job_id, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, job_id = excluded.job_id, "
+                "expires_at = excluded.expires_at WHERE leases.expires_at < ?",
+                (name, owner, job_id, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+
+    def renew_lease(self, name, owner, ttl):
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ? AND expires_at >= ?",
+                (time.time() + ttl, name, owner, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, name, owner):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def lease_holder(self, name):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT owner, job_id, expires_at FROM leases WHERE name = ? AND expires_at >= ?",
+                               (name, now)).fetchone()
+        if row is None:
+            return None
+        return {"owner": row["owner"], "job_id": row["job_id"], "expires_in_s": round(row["expires_at"] - now, 1)}
+
+    def put_value(self, key, value, ttl=None):
+        if ttl is not None and ttl <= 0:
+            self.delete_value(key)
+            return
+        expires_at = time.time() + ttl if ttl is not None else None
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(value, default=str), expires_at))
+
+    def get_value(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                               (key, time.time())).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def delete_value(self, key):
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute("DELETE FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                                  (key, time.time()))
+            return cursor.rowcount == 1
+
+
+class RedisJobStore(JobStore):
+    """
+    Backend en Redis para varios nodos. Los vencimientos los aplica el servidor
+    (SET NX PX), así que no dependen de que los relojes de las réplicas coincidan.
+    """
+
+    # Renovar o liberar solo si el lease sigue a nombre del mismo dueño (atómico en Redis)
+    RENEW_SCRIPT = """
+    local value = redis.call('GET', KEYS[1])
+    if value and cjson.decode(value)['owner'] == ARGV[1] then
+        return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    RELEASE_SCRIPT = """
+    local value = redis.call('GET', KEYS[1])
+    if value and cjson.decode(value)['owner'] == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str, retention_seconds: int, prefix: str = "ingesta"):
+        if redis is None:
+            raise RuntimeError("JOB_STORE_BACKEND=redis requiere el paquete redis (pip install redis)")
+        if not url:
+            raise RuntimeError("JOB_STORE_BACKEND=redis requiere JOB_STORE_URL (redis://host:6379/0)")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.retention_seconds = retention_seconds
+        self.prefix = prefix
+        self._renew = self.client.register_script(self.RENEW_SCRIPT)
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+
+    def _save_job(self, job):
+        created = datetime.fromisoformat(job["created_at"]).timestamp()
+        corte = time.time() - self.retention_seconds
+        with self.client.pipeline() as pipe:
+            pipe.set(self._key("job", job["id"]), json.dumps(job, default=str), ex=self.retention_seconds)
+            for index in (self._key("jobs"), self._key("jobs", job["source"])):
+                pipe.zadd(index, {job["id"]: created})
+                pipe.zremrangebyscore(index, "-inf", corte)
+            pipe.execute()
+
+    def update_job(self, job_id, unless=(), **fields):
+        # Lectura y escritura bajo WATCH: si otra réplica cambia el trabajo entre ambas, se reintenta
+        key = self._key("job", job_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    value = pipe.get(key)
+                    job = json.loads(value) if value else None
+                    if job is None or job["status"] in unless:
+                        pipe.unwatch()
+                        return False
+                    job.update(fields)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job, default=str), ex=self.retention_seconds)
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    continue
+
+    def get_job(self, job_id):
+        value = self.client.get(self._key("job", job_id))
+        return json.loads(value) if value else None
+
+    def list_jobs(self, source=None, limit=20):
+        index = self._key("jobs", source) if source is not None else self._key("jobs")
+        ids = self.client.zrevrange(index, 0, limit - 1)
+        if not ids:
+            return []
+        values = self.client.mget([self._key("job", job_id) for job_id in ids])
+        return [json.loads(value) for value in values if value]
+
+    def acquire_lease(self, name, owner, job_id, ttl):
+        value = json.dumps({"owner": owner, "job_id": job_id})
+        return bool(self.client.set(self._key("lease", name), value, nx=True, px=int(ttl * 1000)))
+
+    def renew_lease(self, name, owner, ttl):
+        return bool(self._renew(keys=[self._key("lease", name)], args=[owner, int(ttl * 1000)]))
+
+    def release_lease(self, name, owner):
+        self._release(keys=[self._key("lease", name)], args=[owner])
+
+    def lease_holder(self, name):
+        with self.client.pipeline() as pipe:
+            pipe.get(self._key("lease", name))
+            pipe.pttl(self._key("lease", name))
+            value, pttl = pipe.execute()
+        if not value:
+            return None
+        return {**json.loads(value), "expires_in_s": round(max(pttl, 0) / 1000, 1)}
+
+    def put_value(self, key, value, ttl=None):
+        if ttl is not None and ttl <= 0:
+            self.delete_value(key)
+            return
+        # En milisegundos como los leases: un ttl menor a un segundo no se trunca a 0
+        px = max(int(ttl * 1000), 1) if ttl is not None else None
+        self.client.set(self._key("kv", key), json.dumps(value, default=str), px=px)
+
+    def get_value(self, key):
+        value = self.client.get(self._key("kv", key))
+        return json.loads(value) if value else None
+
+    def delete_value(self, key):
+        return bool(self.client.delete(self._key("kv", key)))
+
+
+def get_job_store() -> JobStore:
+    """
+    Crea el backend configurado con JOB_STORE_BACKEND:
+        sqlite (por defecto): archivo JOB_STORE_PATH, compartido por los workers de un nodo
+        redis: servidor JOB_STORE_URL, compartido por varios nodos
+    """
+    backend = settings.JOB_STORE_BACKEND.lower()
+    if backend == "sqlite":
+        return SQLiteJobStore(settings.JOB_STORE_PATH, settings.JOB_RETENTION_SECONDS)
+    if backend == "redis":
+        return RedisJobStore(settings.JOB_STORE_URL, settings.JOB_RETENTION_SECONDS)
+    raise ValueError(f"JOB_STORE_BACKEND no soportado: {backend}")
+
+
+job_store = get_job_store()
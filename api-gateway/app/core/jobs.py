@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+from app.core.config import settings
+from app.core.job_store import FINISHED_STATUSES, JobStore, job_store
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Identifica a esta réplica (worker de uvicorn) como dueña de trabajos y locks
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobRunner:
+    """
+    Ejecuta ingestas como trabajos registrados en el job store.
+
+    Con lock (ingesta completa de una fuente, compactación) solo una réplica puede
+    ejecutarla a la vez: la que toma el lease lanza el contenedor y las peticiones
+    que llegan a cualquier réplica mientras tanto se unen a ese mismo trabajo en lugar
+    de lanzar otro. El lease se renueva mientras el trabajo corre; si la réplica muere,
+    vence y el trabajo queda como "lost" para quien lo consulte.
+    """
+
+    def __init__(self, store: JobStore, lease_ttl: float, poll_interval: float):
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, kind: str, source: str, work: Callable[[], Awaitable[Dict[str, Any]]],
+                     params: Optional[Dict[str, Any]] = None,
+                     lock: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Lanza `work` como trabajo en segundo plano.
+
+        Returns:
+            (trabajo, unido): unido es True si el lock ya lo tenía otro trabajo y se
+            retorna ese. (None, False) si el lock está tomado pero su trabajo no aparece.
+        """
+        job_id = uuid.uuid4().hex
+        for _ in range(5):
+            if lock is None or await asyncio.to_thread(self.store.acquire_lease, lock, OWNER, job_id,
+                                                       self.lease_ttl):
+                break
+            holder = await asyncio.to_thread(self.store.lease_holder, lock)
+            if holder is not None and holder.get("job_id"):
+                job = await asyncio.to_thread(self.store.get_job, holder["job_id"])
+                if job is not None:
+                    return job, True
+            # El dueño acaba de tomar o liberar el lease y su trabajo aún no es visible
+            await asyncio.sleep(0.1)
+        else:
+            return None, False
+
+        try:
+            job = await asyncio.to_thread(self.store.create_job, kind, source, OWNER, params, job_id)
+        except Exception:
+            if lock is not None:
+                await asyncio.to_thread(self.store.release_lease, lock, OWNER)
+            raise
+        task = asyncio.create_task(self._run(job_id, work, lock))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job, False
+
+    async def _run(self, job_id: str, work: Callable[[], Awaitable[Dict[str, Any]]],
+                   lock: Optional[str]) -> Dict[str, Any]:
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, lock))
+        try:
+            result = await work()
+            status = "error" if result.get("status") == "error" else "success"
+            await asyncio.to_thread(self.store.finish_job, job_id, status, result, result.get("error"))
+        except Exception as e:
+            logger.error(f"Trabajo {job_id} falló: {str(e)}")
+            await asyncio.to_thread(self.store.finish_job, job_id, "error", None, str(e))
+        finally:
+            heartbeat.cancel()
+            if lock is not None:
+                await asyncio.to_thread(self.store.release_lease, lock, OWNER)
+        return await asyncio.to_thread(self.store.get_job, job_id)
+
+    async def _heartbeat(self, job_id: str, lock: Optional[str]) -> None:
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await asyncio.to_thread(self.store.heartbeat, job_id)
+                if lock is not None and not await asyncio.to_thread(self.store.renew_lease, lock, OWNER,
+                                                                    self.lease_ttl):
+                    logger.warning(f"El lock {lock} del trabajo {job_id} venció antes de terminar")
+            except Exception as e:
+                logger.warning(f"No se pudo renovar el trabajo {job_id}: {str(e)}")
+
+    def _stale(self, job: Dict[str, Any]) -> bool:
+        """Trabajo en curso cuya réplica dejó de renovarlo (murió o quedó aislada)."""
+        heartbeat_at = datetime.fromisoformat(job["heartbeat_at"] or job["created_at"])
+        return (datetime.now(timezone.utc) - heartbeat_at).total_seconds() > 3 * self.lease_ttl
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado del trabajo; uno en curso sin heartbeat reciente se marca "lost"."""
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        if job is not None and job["status"] not in FINISHED_STATUSES and job_id not in self._tasks \
+                and self._stale(job):
+            error = f"La réplica {job['owner']} dejó de renovar el trabajo"
+            # Condicional: si la réplica dueña terminó después de leerlo, se conserva su resultado
+            await asyncio.to_thread(self.store.finish_job, job_id, "lost", None, error)
+            job = await asyncio.to_thread(self.store.get_job, job_id)
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Espera a que el trabajo termine (como máximo timeout segundos) y lo retorna;
+        si sigue en curso, retorna su estado actual. Cancelar la espera no cancela el trabajo.
+        """
+        task = self._tasks.get(job_id)
+        if task is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                return await self.get(job_id)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED_STATUSES or loop.time() >= deadline:
+                return job
+            await asyncio.sleep(min(self.poll_interval, max(0.0, deadline - loop.time())))
+
+
+job_runner = JobRunner(job_store, settings.RUN_LOCK_TTL_SECONDS, settings.JOB_POLL_INTERVAL_SECONDS)
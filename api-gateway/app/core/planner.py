@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
+from app.core.config import settings
+from app.core.job_store import JobStore, job_store
+import math
+
+# Fuentes que pueden leer una tabla en rangos paralelos dentro de un mismo contenedor
+PARALLEL_SOURCES = ("mongodb",)
+
+
+class IngestionPlanner:
+    """
+    Planificador de ingestas a partir de estadísticas de catálogo.
+
+    Con las filas y bytes estimados por la base de origen y el rendimiento histórico
+    de cada tabla (run_history), estima la duración y la memoria de la lectura y elige
+    una estrategia por tabla:
+    - single: una sola pasada en memoria
+    - chunked: lectura por lotes con volcado a disco
+    - parallel: rangos de _id leídos a la vez en el mismo contenedor (MongoDB)
+    - sharded: la tabla se reparte entre varios contenedores (una por fuente)
+
+    El último plan de cada fuente se guarda en el job store (compartido por todas las
+    réplicas del gateway) y lo aplican las ingestas siguientes hasta que vence
+    (PLAN_MAX_AGE_SECONDS).
+    """
+
+    def __init__(self, max_age_seconds: int, store: JobStore):
+        self.max_age_seconds = max_age_seconds
+        self.store = store
+
+    @staticmethod
+    def _estimate(stats: Dict[str, Any], history: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        filas = stats.get("filas")
+        bytes_datos = stats.get("bytes_datos")
+        if history:
+            rows_per_s, fuente = history["rows_per_s"], f"historial ({history['runs']} ejecuciones)"
+            # Sin estadística de filas, se deduce del tamaño y los bytes por registro exportado
+            if filas is None and bytes_datos and history.get("bytes_por_registro"):
+                filas = int(bytes_datos / history["bytes_por_registro"])
+        else:
+            rows_per_s, fuente = settings.PLAN_DEFAULT_ROWS_PER_S, "por defecto"
+
+        return {
+            "filas": filas,
+            "bytes": stats.get("bytes"),
+            "bytes_datos": bytes_datos,
+            "rows_per_s": round(rows_per_s, 1),
+            "rendimiento": fuente,
+            "duracion_estimada_s": round(filas / rows_per_s, 1) if filas is not None else None,
+            "memoria_estimada_bytes": int(bytes_datos * settings.PLAN_MEMORY_FACTOR) if bytes_datos else None,
+        }
+
+    @classmethod
+    def _choose(cls, source: str, estimate: Dict[str, Any], divisible: bool,
+                memory_budget: Optional[int]) -> Dict[str, Any]:
+        """Estrategia de una tabla sin considerar el límite de una tabla en shards por fuente."""
+        duracion = estimate["duracion_estimada_s"] or 0
+        memoria = estimate["memoria_estimada_bytes"] or 0
+
+        if divisible and duracion > settings.PLAN_SHARD_SECONDS:
+            shards = min(settings.PLAN_MAX_SHARDS, math.ceil(duracion / settings.PLAN_SHARD_SECONDS))
+            return {"strategy": "sharded", "shards": max(shards, 2),
+                    "motivo": f"duración estimada {duracion:.0f}s > {settings.PLAN_SHARD_SECONDS:.0f}s"}
+        return cls._choose_in_container(source, duracion, memoria, memory_budget)
+
+    @staticmethod
+    def _choose_in_container(source: str, duracion: float, memoria: int,
+                             memory_budget: Optional[int]) -> Dict[str, Any]:
+        if source in PARALLEL_SOURCES and duracion > settings.PLAN_PARALLEL_SECONDS:
+            workers = min(settings.PLAN_MAX_WORKERS, math.ceil(duracion / settings.PLAN_PARALLEL_SECONDS))
+            return {"strategy": "parallel", "workers": max(workers, 2),
+                    "motivo": f"duración estimada {duracion:.0f}s > {settings.PLAN_PARALLEL_SECONDS:.0f}s"}
+        if memory_budget and memoria > memory_budget:
+            return {"strategy": "chunked",
+                    "motivo": f"memoria estimada {memoria // 1024 ** 2} MB > "
+                              f"presupuesto {memory_budget // 1024 ** 2} MB"}
+        return {"strategy": "single", "motivo": "cabe en memoria en una sola pasada"}
+
+    def build(self, source: str, catalog: Dict[str, Any], history: Dict[str, Dict[str, Any]],
+              memory_budget: Optional[int]) -> Dict[str, Any]:
+        """
+        Arma el plan de una fuente.
+
+        Args:
+            source: Fuente (mongodb, mysql, postgresql)
+            catalog: Estadísticas por tabla del contenedor en modo CATALOG_STATS
+            history: Rendimiento por tabla de run_history.throughput
+            memory_budget: Presupuesto de memoria por tabla del contenedor (bytes)
+        """
+        created_at = datetime.now(timezone.utc)
+        tables: Dict[str, Dict[str, Any]] = {}
+        for table, stats in catalog.items():
+            if not isinstance(stats, dict) or "error" in stats:
+                tables[table] = {"error": stats.get("error") if isinstance(stats, dict) else str(stats)}
+                continue
+            estimate = self._estimate(stats, history.get(table))
+            tables[table] = {**estimate, **self._choose(source, estimate, stats.get("divisible", False),
+                                                          memory_budget)}
+
+        # El orquestador reparte una sola tabla por fuente: la más lenta; el resto se lee
+        # dentro del contenedor normal
+        sharded = sorted(
+            (table for table, info in tables.items() if info.get("strategy") == "sharded"),
+            key=lambda table: tables[table]["duracion_estimada_s"], reverse=True,
+        )
+        for table in sharded[1:]:
+            info = tables[table]
+            info.pop("shards")
+            info.update(self._choose_in_container(source, info["duracion_estimada_s"],
+                                                  info["memoria_estimada_bytes"] or 0, memory_budget))
+            info["motivo"] += f"; solo {sharded[0]} se reparte en shards"
+
+        duracion = 0.0
+        for info in tables.values():
+            estimada = info.get("duracion_estimada_s") or 0
+            divisor = info.get("shards") or info.get("workers") or 1
+            duracion += estimada / divisor
+
+        return {
+            "source": source,
+            "created_at": created_at.isoformat(),
+            "expires_at": (created_at + timedelta(seconds=self.max_age_seconds)).isoformat(),
+            "memory_budget_bytes": memory_budget,
+            "duracion_estimada_s": round(duracion, 1),
+            "shard_table": sharded[0] if sharded else None,
+            "tables": tables,
+        }
+
+    def save(self, plan: Dict[str, Any]) -> None:
+        self.store.put_value(f"plan:{plan['source']}", plan, ttl=self.max_age_seconds)
+
+    def current(self, source: str) -> Optional[Dict[str, Any]]:
+        """Plan vigente de la fuente, o None si no hay o ya venció."""
+        plan = self.store.get_value(f"plan:{source}")
+        if plan is None or datetime.fromisoformat(plan["expires_at"]) < datetime.now(timezone.utc):
+            return None
+        return plan
+
+    def clear(self, source: str) -> bool:
+        return self.store.delete_value(f"plan:{source}")
+
+    @staticmethod
+    def table_strategies(plan: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Estrategias para TABLE_STRATEGIES (la tabla en shards la gestiona el orquestador)."""
+        return {
+            table: {key: info[key] for key in ("strategy", "workers") if key in info}
+            for table, info in plan["tables"].items()
+            if info.get("strategy") in ("single", "chunked", "parallel")
+        }
+
+
+planner = IngestionPlanner(settings.PLAN_MAX_AGE_SECONDS, job_store)
@@ -0,0 +1,249 @@
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from app.core.config import settings
+import json
+import math
+import os
+import sqlite3
+import statistics
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duration_s REAL,
+    container_s REAL,
+    error TEXT,
+    regression TEXT
+);
+CREATE TABLE IF NOT EXISTS run_tables (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    source TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    registros INTEGER,
+    bytes INTEGER,
+    duracion_s REAL,
+    rows_per_s REAL,
+    regression TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_run_tables_table ON run_tables(source, table_name, run_id);
+CREATE INDEX IF NOT EXISTS idx_runs_source ON runs(source, id);
+"""
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentil por rango más cercano; None si no hay valores."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class RunHistory:
+    """
+    Historial persistente de ejecuciones en SQLite.
+
+    Guarda por cada ingesta los tiempos del contenedor y, por tabla, registros, bytes
+    y duración. Cada tabla se compara con la mediana de sus ejecuciones previas
+    exitosas para marcar regresiones de rendimiento.
+    """
+
+    def __init__(self, db_path: str, baseline_runs: int = 10, min_baseline_runs: int = 3,
+                 threshold: float = 0.3):
+        self.db_path = db_path
+        self.baseline_runs = baseline_runs
+        self.min_baseline_runs = min_baseline_runs
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # El esquema se crea en el primer uso para no fallar al importar sin volumen
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                conn.executescript(SCHEMA)
+            self._initialized = True
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _regression(self, current: Dict[str, Optional[float]], baseline: List[sqlite3.Row]) -> Optional[str]:
+        """Compara registros/s y duración con la mediana de la línea base."""
+        if len(baseline) < self.min_baseline_runs:
+            return None
+
+        motivos = []
+        rates = [row["rows_per_s"] for row in baseline if row["rows_per_s"]]
+        if current["rows_per_s"] is not None and len(rates) >= self.min_baseline_runs:
+            base_rate = statistics.median(rates)
+            if current["rows_per_s"] < base_rate * (1 - self.threshold):
+                motivos.append(f"registros/s {current['rows_per_s']:.0f} vs mediana {base_rate:.0f}")
+
+        durations = [row["duracion_s"] for row in baseline if row["duracion_s"] is not None]
+        if current["duracion_s"] is not None and len(durations) >= self.min_baseline_runs:
+            base_duration = statistics.median(durations)
+            if current["duracion_s"] > base_duration * (1 + self.threshold):
+                motivos.append(f"duración {current['duracion_s']:.1f}s vs mediana {base_duration:.1f}s")
+
+        return "; ".join(motivos) or None
+
+    def record(self, source: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Guarda una ejecución retornada por DockerOrchestrator y marca regresiones.
+
+        Returns:
+            Diccionario {"run_id", "regressions": {tabla: motivo}}
+        """
+        timings = result.get("timings", {})
+        tables = result.get("result") if result["status"] == "success" else {}
+        started_at = timings.get("started_at") or datetime.now(timezone.utc).isoformat()
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (source, started_at, status, duration_s, container_s, error) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (source, started_at, result["status"], timings.get("duration_s"),
+                 timings.get("container_s"), result.get("error")),
+            )
+            run_id = cursor.lastrowid
+
+            regressions = {}
+            for table, info in (tables or {}).items():
+                if not isinstance(info, dict):
+                    continue
+                if "error" in info:
+                    conn.execute(
+                        "INSERT INTO run_tables (run_id, source, table_name, status) VALUES (?, ?, ?, 'error')",
+                        (run_id, source, table),
+                    )
+                    continue
+
+                duracion = info.get("duracion_s")
+                registros = info.get("registros")
+                # En modo delta el rendimiento se mide sobre las filas leídas, no los cambios
+                leidos = info.get("leidos", registros)
+                current = {
+                    "duracion_s": duracion,
+                    "rows_per_s": leidos / duracion if leidos is not None and duracion else None,
+                }
+                baseline = conn.execute(
+                    "SELECT rows_per_s, duracion_s FROM run_tables "
+                    "WHERE source = ? AND table_name = ? AND status = 'success' "
+                    "ORDER BY run_id DESC LIMIT ?",
+                    (source, table, self.baseline_runs),
+                ).fetchall()
+                regression = self._regression(current, baseline)
+                if regression:
+                    regressions[table] = regression
+
+                conn.execute(
+                    "INSERT INTO run_tables (run_id, source, table_name, status, registros, bytes, "
+                    "duracion_s, rows_per_s, regression) VALUES (?, ?, ?, 'success', ?, ?, ?, ?, ?)",
+                    (run_id, source, table, registros, info.get("bytes"), duracion,
+                     current["rows_per_s"], regression),
+                )
+
+            if regressions:
+                conn.execute("UPDATE runs SET regression = ? WHERE id = ?",
+                             (json.dumps(regressions, ensure_ascii=False), run_id))
+
+        return {"run_id": run_id, "regressions": regressions}
+
+    def throughput(self, source: str, window: int = 10) -> Dict[str, Dict[str, Any]]:
+        """
+        Rendimiento reciente por tabla: mediana de registros/s y de bytes por registro
+        sobre las últimas `window` ejecuciones exitosas.
+        """
+        with self._lock, closing(self._connect()) as conn:
+            tables = [row[0] for row in conn.execute(
+                "SELECT DISTINCT table_name FROM run_tables WHERE source = ?", (source,)
+            )]
+            result = {}
+            for table in tables:
+                rows = conn.execute(
+                    "SELECT registros, bytes, rows_per_s FROM run_tables "
+                    "WHERE source = ? AND table_name = ? AND status = 'success' "
+                    "ORDER BY run_id DESC LIMIT ?",
+                    (source, table, window),
+                ).fetchall()
+                rates = [row["rows_per_s"] for row in rows if row["rows_per_s"]]
+                sizes = [row["bytes"] / row["registros"] for row in rows if row["bytes"] and row["registros"]]
+                if rates:
+                    result[table] = {
+                        "rows_per_s": statistics.median(rates),
+                        "bytes_por_registro": statistics.median(sizes) if sizes else None,
+                        "runs": len(rates),
+                    }
+        return result
+
+    def summary(self, source: Optional[str] = None, table: Optional[str] = None,
+                window: int = 100, limit: int = 20) -> Dict[str, Any]:
+        """
+        Percentiles por tabla sobre las últimas `window` ejecuciones exitosas y las
+        últimas `limit` ejecuciones con sus marcas de regresión.
+        """
+        filters, params = [], []
+        if source:
+            filters.append("source = ?")
+            params.append(source)
+        if table:
+            filters.append("table_name = ?")
+            params.append(table)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+
+        with self._lock, closing(self._connect()) as conn:
+            pairs = conn.execute(
+                f"SELECT DISTINCT source, table_name FROM run_tables {where} ORDER BY source, table_name",
+                params,
+            ).fetchall()
+
+            tables = []
+            for pair in pairs:
+                rows = conn.execute(
+                    "SELECT registros, bytes, duracion_s, rows_per_s, regression FROM run_tables "
+                    "WHERE source = ? AND table_name = ? AND status = 'success' "
+                    "ORDER BY run_id DESC LIMIT ?",
+                    (pair["source"], pair["table_name"], window),
+                ).fetchall()
+                errores = conn.execute(
+                    "SELECT COUNT(*) FROM run_tables WHERE source = ? AND table_name = ? AND status = 'error'",
+                    (pair["source"], pair["table_name"]),
+                ).fetchone()[0]
+
+                entry = {"source": pair["source"], "table": pair["table_name"], "runs": len(rows),
+                         "errores": errores, "regresiones": sum(1 for row in rows if row["regression"])}
+                for column in ("duracion_s", "rows_per_s", "bytes", "registros"):
+                    values = [row[column] for row in rows if row[column] is not None]
+                    entry[column] = {f"p{pct}": percentile(values, pct) for pct in (50, 90, 99)}
+                if rows and rows[0]["regression"]:
+                    entry["ultima_regresion"] = rows[0]["regression"]
+                tables.append(entry)
+
+            run_where = "WHERE source = ?" if source else ""
+            runs = conn.execute(
+                f"SELECT * FROM runs {run_where} ORDER BY id DESC LIMIT ?",
+                ([source] if source else []) + [limit],
+            ).fetchall()
+
+        return {
+            "tables": tables,
+            "runs": [
+                {**dict(run), "regression": json.loads(run["regression"]) if run["regression"] else None}
+                for run in runs
+            ],
+        }
+
+
+run_history = RunHistory(
+    settings.HISTORY_DB_PATH,
+    baseline_runs=settings.HISTORY_BASELINE_RUNS,
+    min_baseline_runs=settings.HISTORY_MIN_BASELINE_RUNS,
+    threshold=settings.HISTORY_REGRESSION_THRESHOLD,
+)
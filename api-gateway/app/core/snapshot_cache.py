@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from app.core.job_store import JobStore, job_store
+import hashlib
+import json
+
+
+class SnapshotCache:
+    """
+    Caché del último snapshot publicado por cada tabla.
+
+    Se alimenta con el resultado de cada ingesta exitosa, de modo que consultar el
+    archivo vigente de una tabla no requiere lanzar un contenedor ni listar el bucket.
+    Las tablas que terminaron con error conservan su snapshot anterior. Se guarda en el
+    job store para que todas las réplicas del gateway vean lo publicado por cualquiera.
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+
+    @staticmethod
+    def _etag(snapshot: Dict[str, Any]) -> str:
+        payload = json.dumps(snapshot, sort_keys=True, default=str).encode("utf-8")
+        return f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+
+    def publish(self, source: str, result: Dict[str, Any]) -> None:
+        """Registra las tablas publicadas por una ingesta exitosa."""
+        # El lock de la fuente garantiza una sola ingesta completa a la vez, así que
+        # leer y reescribir las tablas de la fuente no compite con otra réplica
+        published_at = datetime.now(timezone.utc)
+        tables = self.store.get_value(f"snapshots:{source}") or {}
+        for table, info in result.items():
+            if not isinstance(info, dict) or "error" in info:
+                continue
+            # Una tabla exportada en partes (shards o lectura paralela) se publica con
+            # su manifiesto como URL y la lista de partes aparte
+            snapshot = {
+                "source": source,
+                "table": table,
+                "url": info.get("url") or info.get("manifest"),
+                "registros": info.get("registros"),
+                "published_at": published_at.isoformat(),
+            }
+            if info.get("urls"):
+                snapshot["partes"] = info["urls"]
+            snapshot["etag"] = self._etag(snapshot)
+            tables[table] = snapshot
+        self.store.put_value(f"snapshots:{source}", tables)
+        self.store.put_value(f"run:{source}", {"published_at": published_at.isoformat(), "result": result})
+
+    def get(self, source: str, table: str) -> Optional[Dict[str, Any]]:
+        """Último snapshot conocido de una tabla, o None si no se ha publicado ninguno."""
+        return (self.store.get_value(f"snapshots:{source}") or {}).get(table)
+
+    def fresh_result(self, source: str, max_age: int) -> Optional[Dict[str, Any]]:
+        """
+        Resultado de la última ingesta de la fuente si tiene como máximo max_age
+        segundos y todas sus tablas se publicaron sin error; None en otro caso.
+        """
+        run = self.store.get_value(f"run:{source}")
+        if run is None:
+            return None
+
+        age = (datetime.now(timezone.utc) - datetime.fromisoformat(run["published_at"])).total_seconds()
+        if age > max_age:
+            return None
+        if any(not isinstance(info, dict) or "error" in info for info in run["result"].values()):
+            return None
+        return {
+            "result": run["result"],
+            "published_at": run["published_at"],
+            "age_seconds": int(age),
+        }
+
+
+snapshot_cache = SnapshotCache(job_store)
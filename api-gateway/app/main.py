@@ -31,6 +31,11 @@ async def root():
             "mongodb": "POST /api/ingesta/mongodb",
             "mysql": "POST /api/ingesta/mysql",
             "postgresql": "POST /api/ingesta/postgresql",
+            "latest": "GET /api/ingesta/{source}/{table}/latest",
+            "plan": "POST /api/ingesta/{source}/plan",
+            "compaction": "POST /api/ingesta/compaction",
+            "jobs": "GET /api/ingesta/jobs/{job_id}",
+            "history": "GET /api/ingesta/history",
             "health": "GET /api/ingesta/health"
         }
     }
@@ -1,14 +1,113 @@
+import asyncio
 import docker
 from docker.errors import ContainerError, ImageNotFound, APIError
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from app.core.config import settings
+from app.core.planner import planner
 import json
 import os
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Ruta dentro de los contenedores de scripts para STORAGE_BACKEND=local
+LOCAL_STORAGE_CONTAINER_PATH = "/data/ingesta"
+
+# Prefijo de configuración de cada fuente en Settings
+SETTINGS_PREFIX = {
+    "mongodb": "MONGO",
+    "mysql": "MYSQL",
+    "postgresql": "POSTGRES",
+    "compaction": "COMPACTION",
+}
+
+# Imagen de script de cada fuente
+IMAGES = {
+    "mongodb": "pharmavida-ingesta-mongodb:latest",
+    "mysql": "pharmavida-ingesta-mysql:latest",
+    "postgresql": "pharmavida-ingesta-postgresql:latest",
+    "compaction": "pharmavida-ingesta-compaction:latest",
+}
+
+MEMORY_UNITS = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def _parse_memory(value: str) -> int:
+    """Convierte un tamaño en formato Docker ("512m", "2g") a bytes."""
+    value = value.strip().lower()
+    if value[-1] in MEMORY_UNITS:
+        return int(float(value[:-1]) * MEMORY_UNITS[value[-1]])
+    return int(value)
+
+
+def memory_budget_bytes(database: str) -> Optional[int]:
+    """
+    Presupuesto de memoria por tabla de los contenedores de la fuente: (límite − tmpfs) × ratio.
+    Las páginas de un tmpfs se cargan al cgroup de memoria del contenedor, así que lo
+    que se vuelca ahí sigue contando contra mem_limit y se descuenta del presupuesto.
+    """
+    prefix = SETTINGS_PREFIX[database]
+    mem_limit = getattr(settings, f"{prefix}_MEM_LIMIT")
+    if not mem_limit:
+        return None
+    tmpfs_size = getattr(settings, f"{prefix}_TMPFS_SIZE")
+    disponible = _parse_memory(mem_limit) - (_parse_memory(tmpfs_size) if tmpfs_size else 0)
+    return int(max(disponible, 0) * settings.SCRIPT_MEMORY_BUDGET_RATIO)
+
+
+def _parse_docker_time(value: str):
+    """Convierte un timestamp de Docker (RFC 3339 con nanosegundos) a datetime."""
+    if not value or value.startswith("0001-"):
+        return None
+    value = value.rstrip("Z")
+    if "." in value:
+        base, fraction = value.split(".", 1)
+        value = f"{base}.{fraction[:6]}"
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def _container_timings(state: Dict[str, Any], started_at: datetime, inicio: float) -> Dict[str, Any]:
+    """Tiempos de una ejecución: total (incluye arranque y espera) y del proceso del contenedor."""
+    timings = {
+        "started_at": started_at.isoformat(),
+        "duration_s": round(time.perf_counter() - inicio, 3),
+        "container_s": None,
+    }
+    container_start = _parse_docker_time(state.get("StartedAt"))
+    container_end = _parse_docker_time(state.get("FinishedAt"))
+    if container_start and container_end:
+        timings["container_s"] = round((container_end - container_start).total_seconds(), 3)
+    return timings
+
+
+def _has_table_errors(result: Dict[str, Any]) -> bool:
+    """True si el contenedor falló o alguna de sus tablas terminó con error."""
+    if result["status"] != "success":
+        return True
+    return any(not isinstance(info, dict) or "error" in info for info in result["result"].values())
+
+
+def _merge_shards(shard_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combina los resultados por shard en un resultado por dataset con todas sus partes."""
+    merged = {}
+    for shard_result in shard_results:
+        for dataset, info in shard_result["result"].items():
+            entry = merged.setdefault(
+                dataset, {"urls": [], "registros": 0, "bytes": 0, "duracion_s": 0, "partes": 0}
+            )
+            entry["urls"].append(info.get("url"))
+            entry["registros"] += info.get("registros") or 0
+            entry["bytes"] += info.get("bytes") or 0
+            # Los shards corren en paralelo: la duración del dataset es la del más lento
+            entry["duracion_s"] = max(entry["duracion_s"], info.get("duracion_s") or 0)
+            entry["partes"] += 1
+            if "formato" in info:
+                entry["formato"] = info["formato"]
+    return merged
+
 
 class DockerOrchestrator:
     def __init__(self):
@@ -19,14 +118,29 @@ class DockerOrchestrator:
             raise RuntimeError(f"No se pudo conectar al Docker daemon: {str(e)}")
 
     def _get_common_env(self) -> Dict[str, str]:
-        """Variables de entorno comunes para AWS."""
-        return {
+        """Variables de entorno comunes para AWS y el backend de almacenamiento."""
+        env_vars = {
+            "STORAGE_BACKEND": settings.STORAGE_BACKEND,
             "AWS_BUCKET_NAME": settings.AWS_BUCKET_NAME,
             "AWS_REGION": settings.AWS_REGION,
             "AWS_PROFILE": "default",
             "AWS_SHARED_CREDENTIALS_FILE": "/root/.aws/credentials",
-            "AWS_CONFIG_FILE": "/root/.aws/config"
+            "AWS_CONFIG_FILE": "/root/.aws/config",
+            "RESUMABLE_UPLOADS": "1" if settings.RESUMABLE_UPLOADS else "0",
+            "CHECKPOINT_MAX_AGE_HOURS": str(settings.CHECKPOINT_MAX_AGE_HOURS),
         }
+        if settings.AWS_ENDPOINT_URL:
+            env_vars["AWS_ENDPOINT_URL"] = settings.AWS_ENDPOINT_URL
+        if settings.STORAGE_BACKEND == "local":
+            env_vars["LOCAL_STORAGE_PATH"] = LOCAL_STORAGE_CONTAINER_PATH
+        return env_vars
+
+    def _get_volumes(self) -> Dict[str, Any]:
+        """Volúmenes de los contenedores de scripts según el backend de almacenamiento."""
+        if settings.STORAGE_BACKEND == "local":
+            # Sin credenciales AWS: los exports se escriben en el disco del host
+            return {settings.LOCAL_STORAGE_HOST_PATH: {"bind": LOCAL_STORAGE_CONTAINER_PATH, "mode": "rw"}}
+        return self._get_aws_volume()
 
     def _get_aws_volume(self) -> Dict[str, Any]:
         """Monta el volumen de credenciales AWS desde el host."""
@@ -69,8 +183,43 @@ class DockerOrchestrator:
         # Montar la carpeta .aws del host en /root/.aws del contenedor (read-only)
         return {host_aws_path: {"bind": "/root/.aws", "mode": "ro"}}
 
+    def _get_resource_profile(self, database: str) -> Dict[str, Any]:
+        """
+        Construye los límites de recursos del contenedor y el presupuesto de memoria
+        que se pasa al script (MEMORY_BUDGET_MB) según el perfil de la fuente.
+        """
+        prefix = SETTINGS_PREFIX[database]
+        mem_limit = getattr(settings, f"{prefix}_MEM_LIMIT")
+        cpus = getattr(settings, f"{prefix}_CPUS")
+        tmpfs_size = getattr(settings, f"{prefix}_TMPFS_SIZE")
+
+        run_kwargs: Dict[str, Any] = {}
+        env_vars: Dict[str, str] = {"BATCH_TARGET_SECONDS": str(settings.SCRIPT_BATCH_TARGET_SECONDS)}
+
+        if mem_limit and tmpfs_size and _parse_memory(tmpfs_size) >= _parse_memory(mem_limit):
+            raise RuntimeError(
+                f"{prefix}_TMPFS_SIZE ({tmpfs_size}) debe ser menor que {prefix}_MEM_LIMIT ({mem_limit}): "
+                f"el tmpfs ocupa memoria del contenedor"
+            )
+        if mem_limit:
+            run_kwargs["mem_limit"] = mem_limit
+            # Sin swap: al superar el límite el contenedor muere con OOMKilled en vez de degradarse
+            run_kwargs["memswap_limit"] = mem_limit
+            budget_mb = int(memory_budget_bytes(database) / 1024 ** 2)
+            env_vars["MEMORY_BUDGET_MB"] = str(max(budget_mb, 1))
+        if cpus:
+            run_kwargs["nano_cpus"] = int(cpus * 1e9)
+        if tmpfs_size:
+            run_kwargs["tmpfs"] = {"/tmp": f"size={tmpfs_size}"}
+            env_vars["SPILL_DIR"] = "/tmp"
+
+        return {"run_kwargs": run_kwargs, "env_vars": env_vars}
+
     def _parse_container_output(self, output: bytes) -> Dict[str, Any]:
-        """Parsea la salida del contenedor."""
+        """
+        Parsea la salida estándar del contenedor (solo stdout: el progreso de los
+        scripts va a stderr). Si stdout trae más de una línea, el resultado es la última.
+        """
         try:
             output_str = output.decode('utf-8').strip()
             
@@ -78,7 +227,12 @@ class DockerOrchestrator:
             logger.debug(f"Output del contenedor: {output_str}")
             
             # Intentar parsear como JSON
-            return json.loads(output_str)
+            try:
+                return json.loads(output_str)
+            except json.JSONDecodeError:
+                if "\n" not in output_str:
+                    raise
+                return json.loads(output_str.splitlines()[-1])
         except json.JSONDecodeError:
             logger.warning(f"No se pudo parsear como JSON: {output_str}")
             return {"output": output_str}
@@ -89,12 +243,17 @@ class DockerOrchestrator:
     def _run_container(self, image: str, env_vars: Dict[str, str], database: str) -> Dict[str, Any]:
         """Método genérico para ejecutar contenedores con manejo de errores mejorado."""
         try:
-            volumes = self._get_aws_volume()
+            volumes = self._get_volumes()
+            profile = self._get_resource_profile(database)
+            env_vars = {**env_vars, **profile["env_vars"]}
             
             logger.info(f"Ejecutando contenedor {image}")
             logger.info(f"Red: {settings.DOCKER_NETWORK}")
             logger.info(f"Variables de entorno: {list(env_vars.keys())}")
+            logger.info(f"Recursos: {profile['run_kwargs']}")
             
+            started_at = datetime.now(timezone.utc)
+            inicio = time.perf_counter()
             # Ejecutar contenedor y capturar logs
             container = self.client.containers.run(
                 image=image,
@@ -102,19 +261,42 @@ class DockerOrchestrator:
                 network=settings.DOCKER_NETWORK,
                 remove=False,  # No remover automáticamente para poder ver logs
                 detach=True,
-                volumes=volumes
+                volumes=volumes,
+                **profile["run_kwargs"]
             )
             
             # Esperar a que termine
             result = container.wait()
             
-            # Obtener logs
+            # Obtener logs (stdout + stderr para diagnóstico; el resultado sale solo de stdout)
             logs = container.logs().decode('utf-8')
+            stdout = container.logs(stdout=True, stderr=False)
             logger.info(f"Logs del contenedor {database}:\n{logs}")
             
+            # Estado final (para detectar OOMKilled antes de remover)
+            container.reload()
+            state = container.attrs.get("State", {})
+            oom_killed = state.get("OOMKilled", False)
+            timings = _container_timings(state, started_at, inicio)
+            
             # Remover contenedor
             container.remove()
             
+            if oom_killed:
+                error_msg = (
+                    f"El contenedor fue terminado por falta de memoria (OOMKilled, "
+                    f"límite {profile['run_kwargs'].get('mem_limit')}). "
+                    f"Aumenta {SETTINGS_PREFIX[database]}_MEM_LIMIT o reduce SCRIPT_MEMORY_BUDGET_RATIO"
+                )
+                logger.error(f"{error_msg}\nLogs:\n{logs}")
+                return {
+                    "status": "error",
+                    "database": database,
+                    "error": error_msg,
+                    "logs": logs,
+                    "timings": timings
+                }
+            
             # Verificar código de salida
             if result['StatusCode'] != 0:
                 error_msg = f"El contenedor retornó código {result['StatusCode']}"
@@ -123,12 +305,13 @@ class DockerOrchestrator:
                     "status": "error",
                     "database": database,
                     "error": error_msg,
-                    "logs": logs
+                    "logs": logs,
+                    "timings": timings
                 }
             
             # Parsear resultado
-            parsed_result = self._parse_container_output(logs.encode('utf-8'))
-            return {"status": "success", "database": database, "result": parsed_result}
+            parsed_result = self._parse_container_output(stdout)
+            return {"status": "success", "database": database, "result": parsed_result, "timings": timings}
             
         except ImageNotFound:
             error_msg = f"Imagen {image} no encontrada. Ejecuta: docker build -t {image} ./scripts/{database}"
@@ -147,7 +330,160 @@ class DockerOrchestrator:
             logger.error(f"Error inesperado en {database}: {str(e)}", exc_info=True)
             return {"status": "error", "database": database, "error": f"Error inesperado: {str(e)}"}
 
-    async def run_mongodb_script(self) -> Dict[str, Any]:
+    async def _run(self, image: str, env_vars: Dict[str, str], database: str,
+                   queries: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta la fuente en un contenedor, o repartiendo su tabla de shard si está configurada.
+
+        Con queries (columnas y filtros por tabla) el contenedor exporta solo esas tablas,
+        filtradas en la base de origen; ese caso nunca se reparte en shards.
+        """
+        if queries:
+            return await asyncio.to_thread(
+                self._run_container, image, {**env_vars, "TABLE_QUERIES": json.dumps(queries)}, database
+            )
+
+        prefix = SETTINGS_PREFIX[database]
+        shard_table = getattr(settings, f"{prefix}_SHARD_TABLE")
+        shard_count = getattr(settings, f"{prefix}_SHARD_COUNT")
+
+        # Un plan vigente (POST /{source}/plan) fija la estrategia de cada tabla y la tabla en shards
+        plan = planner.current(database)
+        if plan is not None:
+            env_vars = {**env_vars, "TABLE_STRATEGIES": json.dumps(planner.table_strategies(plan))}
+            shard_table = plan["shard_table"]
+            shard_count = plan["tables"][shard_table]["shards"] if shard_table else 1
+            logger.info(f"Aplicando plan de {database} creado el {plan['created_at']}")
+
+        if shard_table and shard_count > 1:
+            result = await self._run_sharded(image, env_vars, database, shard_table, shard_count)
+        else:
+            # El SDK de Docker es bloqueante: la espera del contenedor va en un hilo para
+            # no detener el event loop (y las demás peticiones) mientras corre
+            result = await asyncio.to_thread(self._run_container, image, env_vars, database)
+        if plan is not None:
+            result["plan"] = {
+                "created_at": plan["created_at"],
+                "strategies": {table: info.get("strategy") for table, info in plan["tables"].items()},
+            }
+        return result
+
+    async def collect_catalog_stats(self, database: str) -> Dict[str, Any]:
+        """Ejecuta el script de la fuente en modo CATALOG_STATS (sin leer filas)."""
+        env_vars = {**self._source_env(database), "CATALOG_STATS": "1"}
+        return await asyncio.to_thread(self._run_container, IMAGES[database], env_vars, database)
+
+    async def _run_shard(self, image: str, env_vars: Dict[str, str], database: str, index: int) -> Dict[str, Any]:
+        """Ejecuta un shard, reintentándolo por separado hasta SHARD_MAX_RETRIES veces."""
+        intentos = settings.SHARD_MAX_RETRIES + 1
+        for intento in range(1, intentos + 1):
+            result = await asyncio.to_thread(self._run_container, image, env_vars, database)
+            result["attempts"] = intento
+            if not _has_table_errors(result):
+                return result
+            error = result.get("error") or json.dumps(result.get("result"), default=str)
+            logger.warning(f"Shard {index} de {database} falló (intento {intento}/{intentos}): {error}")
+        return result
+
+    async def _run_sharded(self, image: str, env_vars: Dict[str, str], database: str,
+                           table: str, count: int) -> Dict[str, Any]:
+        """
+        Reparte una tabla grande entre varios contenedores en paralelo.
+
+        Un primer contenedor calcula los límites de cada shard (modo plan); luego se
+        lanzan a la vez el contenedor normal (sin esa tabla) y un contenedor por shard.
+        Si todos los shards terminan bien, un último contenedor sube el manifiesto
+        combinado con las partes de la tabla.
+
+        Cada shard abre su propia conexión y su propio snapshot de lectura, así que la
+        tabla combinada no corresponde a un único instante: una fila que cambia de rango
+        de clave mientras corren los shards puede aparecer dos veces o ninguna. Un
+        snapshot compartido (pg_export_snapshot) exigiría mantener abierta la transacción
+        del contenedor de plan mientras duran los shards; el manifiesto lo deja indicado
+        en "consistencia".
+        """
+        started_at = datetime.now(timezone.utc)
+        inicio = time.perf_counter()
+        shard_env = {**env_vars, "SHARD_TABLE": table}
+
+        plan = await asyncio.to_thread(
+            self._run_container, image, {**shard_env, "SHARD_MODE": "plan", "SHARD_COUNT": str(count)}, database
+        )
+        if plan["status"] != "success" or "shards" not in plan["result"]:
+            error = plan.get("error") or plan["result"].get("error", "resultado sin shards")
+            return {"status": "error", "database": database, "error": f"No se pudo planificar shards de {table}: {error}"}
+
+        shards = plan["result"]["shards"]
+        logger.info(f"Repartiendo {database}/{table} en {len(shards)} shards")
+
+        shard_runs = [
+            self._run_shard(image, {
+                **shard_env,
+                "SHARD_MODE": "export",
+                "SHARD_INDEX": str(index),
+                "SHARD_COUNT": str(len(shards)),
+                "SHARD_LOWER": bounds["lower"] or "",
+                "SHARD_UPPER": bounds["upper"] or "",
+            }, database, index)
+            for index, bounds in enumerate(shards)
+        ]
+        main_result, *shard_results = await asyncio.gather(
+            asyncio.to_thread(self._run_container, image, {**env_vars, "EXCLUDE_TABLES": table}, database),
+            *shard_runs,
+        )
+        if main_result["status"] != "success":
+            return main_result
+
+        manifest = {
+            "database": database,
+            "table": table,
+            "created_at": started_at.isoformat(),
+            "consistencia": "por_shard",
+            "shards": [
+                {
+                    "index": index,
+                    "lower": bounds["lower"],
+                    "upper": bounds["upper"],
+                    "attempts": shard_result.get("attempts"),
+                    "status": "error" if _has_table_errors(shard_result) else "success",
+                    "result": shard_result.get("result") or {"error": shard_result.get("error")},
+                }
+                for index, (bounds, shard_result) in enumerate(zip(shards, shard_results))
+            ],
+        }
+
+        failed = [shard["index"] for shard in manifest["shards"] if shard["status"] == "error"]
+        if failed:
+            merged = {table: {"error": f"Shards fallidos tras reintentos: {failed}", "shards": manifest["shards"]}}
+        else:
+            merged = _merge_shards(shard_results)
+            upload = await asyncio.to_thread(
+                self._run_container, image,
+                {**shard_env, "SHARD_MODE": "manifest", "SHARD_MANIFEST": json.dumps(manifest)}, database
+            )
+            for entry in merged.values():
+                if upload["status"] == "success":
+                    entry["manifest"] = upload["result"].get("manifest")
+                else:
+                    entry["manifest_error"] = upload.get("error")
+
+        all_runs = [plan, main_result, *shard_results]
+        return {
+            "status": "success",
+            "database": database,
+            "result": {**main_result["result"], **merged},
+            "timings": {
+                "started_at": started_at.isoformat(),
+                "duration_s": round(time.perf_counter() - inicio, 3),
+                "container_s": round(sum((run.get("timings") or {}).get("container_s") or 0 for run in all_runs), 3),
+            },
+        }
+
+    def _source_env(self, database: str) -> Dict[str, str]:
+        """Variables de entorno del script de una fuente."""
+        return getattr(self, f"_{database}_env")()
+
+    def _mongodb_env(self) -> Dict[str, str]:
         env_vars = self._get_common_env()
         env_vars.update({
             "MONGO_HOST": settings.MONGO_HOST,
@@ -155,10 +491,14 @@ class DockerOrchestrator:
             "MONGO_USER": settings.MONGO_USER,
             "MONGO_PASSWORD": settings.MONGO_PASSWORD,
             "MONGO_DATABASE": settings.MONGO_DATABASE,
+            "MONGO_PARALLEL_WORKERS": str(settings.MONGO_PARALLEL_WORKERS),
+            "OUTPUT_FORMAT": settings.MONGO_OUTPUT_FORMAT,
+            "JSON_COMPACT": "1" if settings.MONGO_JSON_COMPACT else "0",
+            "MONGO_READER": settings.MONGO_READER,
         })
-        return self._run_container("pharmavida-ingesta-mongodb:latest", env_vars, "mongodb")
+        return env_vars
 
-    async def run_mysql_script(self) -> Dict[str, Any]:
+    def _mysql_env(self) -> Dict[str, str]:
         env_vars = self._get_common_env()
         env_vars.update({
             "MYSQL_HOST": settings.MYSQL_HOST,
@@ -166,10 +506,17 @@ class DockerOrchestrator:
             "MYSQL_USER": settings.MYSQL_USER,
             "MYSQL_PASSWORD": settings.MYSQL_PASSWORD,
             "MYSQL_DATABASE": settings.MYSQL_DATABASE,
+            "MYSQL_MAX_REPLICA_LAG": str(settings.MYSQL_MAX_REPLICA_LAG),
+            "SQL_EXTRACT_ENGINE": settings.SQL_EXTRACT_ENGINE,
+            "OUTPUT_FORMAT": settings.SQL_OUTPUT_FORMAT,
         })
-        return self._run_container("pharmavida-ingesta-mysql:latest", env_vars, "mysql")
+        if settings.MYSQL_REPLICA_HOSTS:
+            env_vars["MYSQL_REPLICA_HOSTS"] = settings.MYSQL_REPLICA_HOSTS
+        if settings.MYSQL_DELTA_TABLES:
+            env_vars["DELTA_TABLES"] = settings.MYSQL_DELTA_TABLES
+        return env_vars
 
-    async def run_postgresql_script(self) -> Dict[str, Any]:
+    def _postgresql_env(self) -> Dict[str, str]:
         env_vars = self._get_common_env()
         env_vars.update({
             "POSTGRES_HOST": settings.POSTGRES_HOST,
@@ -177,5 +524,45 @@ class DockerOrchestrator:
             "POSTGRES_USER": settings.POSTGRES_USER,
             "POSTGRES_PASSWORD": settings.POSTGRES_PASSWORD,
             "POSTGRES_DATABASE": settings.POSTGRES_DATABASE,
+            "POSTGRES_MAX_REPLICA_LAG": str(settings.POSTGRES_MAX_REPLICA_LAG),
+            "COMPRAS_DETALLE": "1" if settings.POSTGRES_COMPRAS_DETALLE else "0",
+            "COMPRAS_DETALLE_PRECIOS": "1" if settings.POSTGRES_COMPRAS_DETALLE_PRECIOS else "0",
+            "SQL_EXTRACT_ENGINE": settings.SQL_EXTRACT_ENGINE,
+            "OUTPUT_FORMAT": settings.SQL_OUTPUT_FORMAT,
         })
-        return self._run_container("pharmavida-ingesta-postgresql:latest", env_vars, "postgresql")
\ No newline at end of file
+        if settings.POSTGRES_REPLICA_HOSTS:
+            env_vars["POSTGRES_REPLICA_HOSTS"] = settings.POSTGRES_REPLICA_HOSTS
+        if settings.POSTGRES_DELTA_TABLES:
+            env_vars["DELTA_TABLES"] = settings.POSTGRES_DELTA_TABLES
+        if settings.POSTGRES_COMPRAS_DETALLE_ORDER_COLUMN:
+            env_vars["COMPRAS_DETALLE_ORDER_COLUMN"] = settings.POSTGRES_COMPRAS_DETALLE_ORDER_COLUMN
+        return env_vars
+
+    async def run_compaction(self, tables: Optional[List[str]] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Compacta los exports de cada tabla en un Parquet, actualiza su puntero
+        <tabla>/_latest.json y aplica la retención a los archivos reemplazados.
+
+        Args:
+            tables: Tablas a compactar (por defecto COMPACTION_TABLES o todas)
+            dry_run: Solo reporta qué se compactaría y borraría
+        """
+        env_vars = self._get_common_env()
+        env_vars.update({
+            "COMPACTION_RETENTION_DAYS": str(settings.COMPACTION_RETENTION_DAYS),
+            "COMPACTION_KEEP_VERSIONS": str(settings.COMPACTION_KEEP_VERSIONS),
+            "COMPACTION_DRY_RUN": "1" if dry_run else "0",
+        })
+        tables = tables or [t.strip() for t in (settings.COMPACTION_TABLES or "").split(",") if t.strip()]
+        if tables:
+            env_vars["COMPACTION_TABLES"] = ",".join(tables)
+        return await asyncio.to_thread(self._run_container, IMAGES["compaction"], env_vars, "compaction")
+
+    async def run_mongodb_script(self, queries: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return await self._run(IMAGES["mongodb"], self._mongodb_env(), "mongodb", queries)
+
+    async def run_mysql_script(self, queries: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return await self._run(IMAGES["mysql"], self._mysql_env(), "mysql", queries)
+
+    async def run_postgresql_script(self, queries: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return await self._run(IMAGES["postgresql"], self._postgresql_env(), "postgresql", queries)
\ No newline at end of file
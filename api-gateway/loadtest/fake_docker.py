@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+import json
+import random
+import threading
+import time
+
+# Datasets que publica cada imagen de script (resultado por defecto del contenedor)
+DATASETS = {
+    "mongodb": ["medicos", "recetas", "recetas_productos"],
+    "mysql": ["productos", "ofertas", "ofertas_detalle"],
+    "postgresql": ["usuarios", "compras", "compra_productos", "compra_cantidades"],
+}
+
+
+def _source(image: str) -> str:
+    for source in DATASETS:
+        if source in image:
+            return source
+    raise ValueError(f"Imagen desconocida: {image}")
+
+
+def _docker_time(value: datetime) -> str:
+    """Timestamp en el formato de Docker (RFC 3339 con nanosegundos)."""
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f") + "000Z"
+
+
+def default_output(image: str, environment: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Resultado que imprimiría el script según el modo del contenedor (normal,
+    CATALOG_STATS o shards), con registros y bytes verosímiles.
+    """
+    if "compaction" in image:
+        return {
+            name: {"estado": "compactada", "modo": "snapshot", "registros": 1000,
+                   "url": f"s3://loadtest/{name}/compacted/{name}.parquet"}
+            for names in DATASETS.values() for name in names
+        }
+
+    source = _source(image)
+    if environment.get("CATALOG_STATS") == "1":
+        return {"tablas": {
+            name: {"filas": 100000, "bytes": 64 * 1024 ** 2, "bytes_datos": 48 * 1024 ** 2, "divisible": True}
+            for name in DATASETS[source]
+        }}
+
+    mode = environment.get("SHARD_MODE")
+    table = environment.get("SHARD_TABLE")
+    if mode == "plan":
+        count = int(environment.get("SHARD_COUNT", 2))
+        bounds = [None] + [str(1000 * k) for k in range(1, count)] + [None]
+        return {"shards": [{"lower": lower, "upper": upper} for lower, upper in zip(bounds, bounds[1:])]}
+    if mode == "manifest":
+        return {"manifest": f"s3://loadtest/{table}/{table}_manifest.json"}
+
+    excluded = set(filter(None, environment.get("EXCLUDE_TABLES", "").split(",")))
+    names = [table] if mode == "export" else [name for name in DATASETS[source] if name not in excluded]
+    return {
+        name: {"url": f"s3://loadtest/{name}/{name}.csv", "registros": 1000, "bytes": 256 * 1024,
+               "duracion_s": 0.5, "formato": "CSV"}
+        for name in names
+    }
+
+
+def progress_lines(image: str, environment: Dict[str, str]) -> bytes:
+    """Mensajes de progreso que los scripts escriben en stderr antes del resultado."""
+    lines = [f"✓ Conectado a {environment.get('SHARD_TABLE') or image}"]
+    if environment.get("MEMORY_BUDGET_MB"):
+        lines.append(f"↪ tabla: supera {environment['MEMORY_BUDGET_MB']} MB, volcando a disco")
+    lines.append("↕ tabla: lote 10000 → 20000 filas")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class FakeContainer:
+    """
+    Contenedor terminado con el código de salida, salida estándar, stderr y estado
+    indicados. logs() mezcla ambos flujos como docker-py salvo que se filtren.
+    Con client, wait() cuenta el contenedor en running/max_running mientras corre,
+    termine bien, con error u OOMKilled.
+    """
+
+    def __init__(self, latency: float, status_code: int, logs: bytes, oom_killed: bool, stderr: bytes = b"",
+                 client: Optional["FakeDockerClient"] = None):
+        self.latency = latency
+        self.client = client
+        self.status_code = status_code
+        self._stdout = logs
+        self._stderr = stderr
+        self.attrs: Dict[str, Any] = {}
+        self._oom_killed = oom_killed
+
+    def wait(self) -> Dict[str, Any]:
+        if self.client is not None:
+            with self.client._lock:
+                self.client.running += 1
+                self.client.max_running = max(self.client.max_running, self.client.running)
+        try:
+            # Bloquea como el SDK real: la espera ocurre en el hilo que llama
+            started = datetime.now(timezone.utc)
+            time.sleep(self.latency)
+            self.attrs = {"State": {
+                "OOMKilled": self._oom_killed,
+                "StartedAt": _docker_time(started),
+                "FinishedAt": _docker_time(started + timedelta(seconds=self.latency)),
+            }}
+            return {"StatusCode": self.status_code}
+        finally:
+            if self.client is not None:
+                with self.client._lock:
+                    self.client.running -= 1
+
+    def logs(self, stdout: bool = True, stderr: bool = True, **kwargs) -> bytes:
+        # Los mensajes de progreso se escriben antes que el JSON final
+        return (self._stderr if stderr else b"") + (self._stdout if stdout else b"")
+
+    def reload(self) -> None:
+        pass
+
+    def remove(self) -> None:
+        pass
+
+
+class FakeContainers:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+
+    def run(self, image: str, environment: Optional[Dict[str, str]] = None, **kwargs) -> FakeContainer:
+        return self.client._start(image, environment or {})
+
+
+class FakeDockerClient:
+    """
+    Reemplazo en proceso de docker.DockerClient para pruebas de carga del gateway.
+
+    Cada contenedor tarda `latency` segundos (± `jitter`) y falla con probabilidad
+    `failure_rate` (código de salida 1) u `oom_rate` (OOMKilled). `output` genera el
+    JSON que imprime el contenedor a partir de la imagen y sus variables de entorno;
+    antes escribe en stderr mensajes de progreso, como los scripts reales.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, failure_rate: float = 0.0,
+                 oom_rate: float = 0.0, ping_latency: float = 0.0,
+                 output: Callable[[str, Dict[str, str]], Dict[str, Any]] = default_output, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.oom_rate = oom_rate
+        self.ping_latency = ping_latency
+        self.output = output
+        self.containers = FakeContainers(self)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.started = 0
+        self.running = 0
+        self.max_running = 0
+
+    def ping(self) -> bool:
+        if self.ping_latency:
+            time.sleep(self.ping_latency)
+        return True
+
+    def _start(self, image: str, environment: Dict[str, str]) -> FakeContainer:
+        with self._lock:
+            sorteo = self._random.random()
+            latency = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            self.started += 1
+
+        stderr = progress_lines(image, environment)
+        if sorteo < self.oom_rate:
+            return FakeContainer(latency, 137, b"", oom_killed=True, stderr=stderr + b"Killed\n", client=self)
+        if sorteo < self.oom_rate + self.failure_rate:
+            error = {"error": f"Error general simulado en {image}"}
+            return FakeContainer(latency, 1, json.dumps(error).encode("utf-8"), oom_killed=False, stderr=stderr,
+                                 client=self)
+        logs = json.dumps(self.output(image, environment)).encode("utf-8")
+        return FakeContainer(latency, 0, logs, oom_killed=False, stderr=stderr, client=self)
@@ -0,0 +1,319 @@
+"""
+Prueba de carga del API Gateway con un cliente Docker simulado en proceso.
+
+Lanza las rutas de app/api/routes/ingesta.py con la concurrencia indicada, sin Docker
+ni bases de datos: cada contenedor es un FakeDockerClient con latencia, salida y tasas
+de falla configurables. Reporta latencia p50/p99 y throughput por ruta y el tiempo que
+el event loop estuvo bloqueado (por ejemplo, por llamadas síncronas al SDK de Docker).
+
+Uso (desde api-gateway/):
+    pip install -r loadtest/requirements.txt
+    python -m loadtest.run --scenario mixed --requests 200 --concurrency 20 --latency 0.5
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Configuración mínima para importar la app sin .env, sin credenciales AWS ni historial real
+_WORKDIR = tempfile.mkdtemp(prefix="loadtest_")
+_DEFAULT_ENV = {
+    "MONGO_HOST": "loadtest", "MONGO_PORT": "27017", "MONGO_USER": "loadtest",
+    "MONGO_PASSWORD": "loadtest", "MONGO_DATABASE": "loadtest",
+    "MYSQL_HOST": "loadtest", "MYSQL_PORT": "3306", "MYSQL_USER": "loadtest",
+    "MYSQL_PASSWORD": "loadtest", "MYSQL_DATABASE": "loadtest",
+    "POSTGRES_HOST": "loadtest", "POSTGRES_PORT": "5432", "POSTGRES_USER": "loadtest",
+    "POSTGRES_PASSWORD": "loadtest", "POSTGRES_DATABASE": "loadtest",
+    "AWS_BUCKET_NAME": "loadtest",
+    "STORAGE_BACKEND": "local",
+    "LOCAL_STORAGE_HOST_PATH": tempfile.gettempdir(),
+    "HISTORY_DB_PATH": os.path.join(_WORKDIR, "history.db"),
+    "JOB_STORE_PATH": os.path.join(_WORKDIR, "jobs.db"),
+}
+for _key, _value in _DEFAULT_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+import docker  # noqa: E402
+import httpx  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.run_history import percentile  # noqa: E402
+from loadtest.fake_docker import DATASETS, FakeDockerClient, default_output  # noqa: E402
+
+SOURCES = tuple(DATASETS)
+
+
+class LoopMonitor:
+    """
+    Mide el bloqueo del event loop: una tarea duerme `interval` segundos y registra
+    cuánto se atrasa al despertar. Un atraso sostenido significa trabajo síncrono en
+    el loop (ninguna otra petición avanza mientras tanto).
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+        self._inicio = 0.0
+
+    async def _watch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._inicio = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - self._inicio - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        # Si el loop estuvo tomado hasta el final, la última espera nunca despertó
+        atraso = asyncio.get_running_loop().time() - self._inicio - self.interval
+        if atraso > 0:
+            self.lags.append(atraso)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        blocked = sum(self.lags)
+        return {
+            "samples": len(self.lags),
+            "max_lag_ms": round(max(self.lags, default=0) * 1000, 1),
+            "p99_lag_ms": round((percentile(self.lags, 99) or 0) * 1000, 1),
+            "blocked_s": round(blocked, 3),
+            "blocked_ratio": round(blocked / elapsed, 3) if elapsed else 0,
+        }
+
+
+# Escenarios: función que devuelve la siguiente petición (método, ruta, cuerpo, etiqueta)
+Request = Tuple[str, str, Optional[Dict[str, Any]], str]
+
+
+def _ingest(source: str) -> Request:
+    return "POST", f"/api/ingesta/{source}", None, f"POST /{source}"
+
+
+def _query(source: str) -> Request:
+    table = DATASETS[source][0]
+    body = {"tables": {table: {"filters": [{"column": "_id" if source == "mongodb" else "id",
+                                            "op": "gte", "value": 1}]}}}
+    return "POST", f"/api/ingesta/{source}", body, f"POST /{source} (consulta)"
+
+
+def _scenario(name: str, source: Optional[str], rng: random.Random) -> Callable[[], Request]:
+    def pick_source() -> str:
+        return source or rng.choice(SOURCES)
+
+    if name == "health":
+        return lambda: ("GET", "/api/ingesta/health", None, "GET /health")
+    if name == "ingest":
+        return lambda: _ingest(pick_source())
+    if name == "query":
+        return lambda: _query(pick_source())
+
+    def mixed() -> Request:
+        sorteo, elegida = rng.random(), pick_source()
+        if sorteo < 0.4:
+            return _ingest(elegida)
+        if sorteo < 0.55:
+            return _query(elegida)
+        if sorteo < 0.85:
+            table = rng.choice(DATASETS[elegida])
+            return "GET", f"/api/ingesta/{elegida}/{table}/latest", None, "GET /{source}/{table}/latest"
+        if sorteo < 0.95:
+            return "GET", "/api/ingesta/history", None, "GET /history"
+        return "GET", "/api/ingesta/health", None, "GET /health"
+    return mixed
+
+
+async def run_load(app, next_request: Callable[[], Request], total: int, concurrency: int) -> Dict[str, Any]:
+    """Ejecuta `total` peticiones con `concurrency` clientes simultáneos."""
+    samples: Dict[str, List[Tuple[float, int]]] = {}
+    unparsed: Dict[str, int] = {}
+    pendientes = iter(range(total))
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        async def worker() -> None:
+            for _ in pendientes:
+                method, path, body, label = next_request()
+                inicio = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                samples.setdefault(label, []).append((time.perf_counter() - inicio, response.status_code))
+                # Un 200 cuyo resultado no es el JSON del script: el gateway no separó stdout de stderr
+                if method == "POST" and response.status_code == 200 and "output" in response.json().get("result", {}):
+                    unparsed[label] = unparsed.get(label, 0) + 1
+
+        monitor = LoopMonitor()
+        monitor.start()
+        inicio = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - inicio
+        await monitor.stop()
+
+    return {"elapsed_s": elapsed, "samples": samples, "unparsed": unparsed, "loop": monitor.report(elapsed)}
+
+
+def _route_stats(values: List[Tuple[float, int]], elapsed: float) -> Dict[str, Any]:
+    latencies = [latency for latency, _ in values]
+    codes: Dict[str, int] = {}
+    for _, code in values:
+        codes[str(code)] = codes.get(str(code), 0) + 1
+    return {
+        "requests": len(values),
+        "status": codes,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "rps": round(len(values) / elapsed, 2),
+    }
+
+
+def build_report(run: Dict[str, Any], fake: FakeDockerClient, args: argparse.Namespace) -> Dict[str, Any]:
+    elapsed = run["elapsed_s"]
+    todas = [sample for values in run["samples"].values() for sample in values]
+    return {
+        "scenario": args.scenario,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "container": {"latency_s": args.latency, "jitter_s": args.jitter,
+                      "failure_rate": args.failure_rate, "oom_rate": args.oom_rate},
+        "elapsed_s": round(elapsed, 3),
+        "total": _route_stats(todas, elapsed),
+        "routes": {label: _route_stats(values, elapsed) for label, values in sorted(run["samples"].items())},
+        "containers": {"started": fake.started, "max_running": fake.max_running},
+        "unparsed": run["unparsed"],
+        "event_loop": run["loop"],
+    }
+
+
+def check_published(run: Dict[str, Any], fake: FakeDockerClient) -> List[str]:
+    """
+    Verifica que las ingestas completas exitosas publicaron sus tablas en la caché de
+    snapshots (GET .../latest y max_age) y dejaron rendimiento por tabla en el historial
+    (línea base de regresiones y planificador), leyendo el resultado real del contenedor.
+    """
+    from app.core.run_history import run_history
+    from app.core.snapshot_cache import snapshot_cache
+    from app.orchestrator.docker_runner import IMAGES
+
+    fallas = []
+    for source in SOURCES:
+        if not any(code == 200 for _, code in run["samples"].get(f"POST /{source}", [])):
+            continue
+        tables = [table for table, info in fake.output(IMAGES[source], {}).items()
+                  if isinstance(info, dict) and "error" not in info]
+        sin_snapshot = [table for table in tables if snapshot_cache.get(source, table) is None]
+        if sin_snapshot:
+            fallas.append(f"{source}: tablas sin snapshot publicado {sin_snapshot}")
+        throughput = run_history.throughput(source)
+        sin_historial = [table for table in tables if table not in throughput]
+        if sin_historial:
+            fallas.append(f"{source}: tablas sin rendimiento en el historial {sin_historial}")
+    return fallas
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Escenario {report['scenario']}: {report['requests']} peticiones, "
+          f"concurrencia {report['concurrency']}, {report['elapsed_s']}s")
+    print(f"{'ruta':<34}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>9}  códigos")
+    for label, stats in [*report["routes"].items(), ("TOTAL", report["total"])]:
+        codes = " ".join(f"{code}×{count}" for code, count in sorted(stats["status"].items()))
+        print(f"{label:<34}{stats['requests']:>6}{stats['p50_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['max_ms']:>10}{stats['rps']:>9}  {codes}")
+    loop = report["event_loop"]
+    print(f"Contenedores: {report['containers']['started']} lanzados, "
+          f"máximo {report['containers']['max_running']} a la vez")
+    print(f"Event loop: bloqueado {loop['blocked_s']}s ({loop['blocked_ratio']:.1%}), "
+          f"atraso máximo {loop['max_lag_ms']} ms, p99 {loop['p99_lag_ms']} ms")
+
+
+def _load_outputs(path: Optional[str]) -> Callable[[str, Dict[str, str]], Dict[str, Any]]:
+    """Salidas por fuente desde un JSON {"mongodb": {...}}; el resto usa la salida por defecto."""
+    if not path:
+        return default_output
+    with open(path) as f:
+        outputs = json.load(f)
+
+    def output(image: str, environment: Dict[str, str]) -> Dict[str, Any]:
+        for source, result in outputs.items():
+            if source in image and "SHARD_MODE" not in environment and "CATALOG_STATS" not in environment:
+                return result
+        return default_output(image, environment)
+    return output
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Prueba de carga del API Gateway con Docker simulado")
+    parser.add_argument("--scenario", choices=("health", "ingest", "query", "mixed"), default="mixed")
+    parser.add_argument("--source", choices=SOURCES, help="Fuente fija (por defecto, al azar)")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5, help="Segundos por contenedor")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Variación ± de la latencia")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fracción de contenedores con código 1")
+    parser.add_argument("--oom-rate", type=float, default=0.0, help="Fracción de contenedores OOMKilled")
+    parser.add_argument("--ping-latency", type=float, default=0.0, help="Segundos de docker ping")
+    parser.add_argument("--outputs", help="JSON con la salida de los contenedores por fuente")
+    parser.add_argument("--shard", nargs=2, metavar=("TABLA", "N"),
+                        help="Reparte la tabla en N shards (<FUENTE>_SHARD_TABLE/COUNT de --source o mongodb)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="Imprime el reporte como JSON")
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs del gateway")
+    parser.add_argument("--max-p99-ms", type=float, help="Falla si el p99 total lo supera")
+    parser.add_argument("--max-blocked-ratio", type=float,
+                        help="Falla si el event loop estuvo bloqueado más de esta fracción del tiempo")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.shard:
+        prefix = {"mongodb": "MONGO", "mysql": "MYSQL", "postgresql": "POSTGRES"}[args.source or "mongodb"]
+        setattr(settings, f"{prefix}_SHARD_TABLE", args.shard[0])
+        setattr(settings, f"{prefix}_SHARD_COUNT", int(args.shard[1]))
+
+    fake = FakeDockerClient(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                            oom_rate=args.oom_rate, ping_latency=args.ping_latency,
+                            output=_load_outputs(args.outputs), seed=args.seed)
+    # El orquestador crea su cliente con docker.DockerClient(...): se reemplaza por el simulado
+    docker.DockerClient = lambda *a, **kw: fake
+
+    from app.main import app
+    # Los errores simulados se ven en el reporte (códigos de estado), no en los logs
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    run = asyncio.run(run_load(app, _scenario(args.scenario, args.source, rng), args.requests, args.concurrency))
+    report = build_report(run, fake, args)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    fallas = []
+    if args.max_p99_ms is not None and report["total"]["p99_ms"] > args.max_p99_ms:
+        fallas.append(f"p99 {report['total']['p99_ms']} ms > {args.max_p99_ms} ms")
+    if args.max_blocked_ratio is not None and report["event_loop"]["blocked_ratio"] > args.max_blocked_ratio:
+        fallas.append(f"event loop bloqueado {report['event_loop']['blocked_ratio']:.1%} > "
+                      f"{args.max_blocked_ratio:.1%}")
+    fallas.extend(check_published(run, fake))
+    if report["unparsed"]:
+        fallas.append(f"resultados sin parsear: {report['unparsed']}")
+    for falla in fallas:
+        print(f"⚠ {falla}", file=sys.stderr)
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -47,6 +47,17 @@ else
 fi
 echo ""
 
+# Construir imagen de compactación
+echo "📦 Construyendo imagen de compactación..."
+docker build -t pharmavida-ingesta-compaction:latest ./scripts/compaction
+if [ $? -eq 0 ]; then
+    echo "✅ Imagen de compactación construida exitosamente"
+else
+    echo "❌ Error construyendo imagen de compactación"
+    exit 1
+fi
+echo ""
+
 echo "✅ Todas las imágenes han sido construidas exitosamente!"
 echo ""
 echo "📋 Imágenes disponibles:"
@@ -0,0 +1,366 @@
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+from storage import get_storage_backend
+
+# Puntero a la versión compactada vigente de cada tabla: <tabla>/_latest.json
+POINTER_NAME = "_latest.json"
+COMPACTED_FOLDER = "compacted"
+# Exports delta: carpeta <tabla>_delta/ e índice del último snapshot en _delta/<tabla>.parquet
+DELTA_SUFFIX = "_delta"
+DELTA_STATE_PREFIX = "_delta"
+HASH_COLUMN = "_hash"
+OP_COLUMN = "_op"
+
+CONTENT_TYPE = 'application/vnd.apache.parquet'
+# Archivos de un export: <tabla>[_variante]_<YYYYmmdd_HHMMSS>.<extensión>
+EXPORT_NAME = (r"^{tabla}(?:_(shard\d{{3}}|part\d{{3}}|manifest|consulta))?"
+               r"_(\d{{8}}_\d{{6}})\.(csv|parquet|json|ndjson)$")
+COMPACTED_NAME = r"^{tabla}_(\d{{8}}_\d{{6}})\.parquet$"
+VARIANTES = {None: 'snapshot', 'manifest': 'manifest', 'consulta': 'consulta'}
+# Tipos de archivo que una versión compactada reemplaza y que la retención puede borrar
+REEMPLAZABLES = ('snapshot', 'parte', 'manifest', 'consulta', 'delta', 'compactado')
+
+
+def compaction_tables(storage):
+    """
+    Tablas a compactar (COMPACTION_TABLES, separadas por coma); sin la variable, todas
+    las carpetas del bucket salvo las internas (_delta, _checkpoints, .multipart).
+    """
+    tablas = {t.strip() for t in os.getenv("COMPACTION_TABLES", "").split(",") if t.strip()}
+    if tablas:
+        return sorted(tablas)
+    carpetas = [c for c in storage.list_folders() if not c.startswith(('_', '.'))]
+    return sorted({c[:-len(DELTA_SUFFIX)] if c.endswith(DELTA_SUFFIX) else c for c in carpetas})
+
+
+def classify(tabla, objetos):
+    """
+    Agrega a cada objeto de la tabla su tipo y timestamp. Los objetos con nombre
+    desconocido no se tocan.
+    """
+    export = re.compile(EXPORT_NAME.format(tabla=re.escape(tabla)))
+    delta = re.compile(EXPORT_NAME.format(tabla=re.escape(tabla + DELTA_SUFFIX)))
+    compactado = re.compile(COMPACTED_NAME.format(tabla=re.escape(tabla)))
+
+    clasificados = []
+    for obj in objetos:
+        carpeta, _, nombre = obj['Key'].rpartition('/')
+        if carpeta == f"{tabla}/{COMPACTED_FOLDER}" and compactado.match(nombre):
+            tipo, ts = 'compactado', compactado.match(nombre).group(1)
+        elif carpeta == tabla and export.match(nombre):
+            variante, ts, _ = export.match(nombre).groups()
+            tipo = VARIANTES.get(variante, 'parte')
+        elif carpeta == f"{tabla}{DELTA_SUFFIX}" and delta.match(nombre):
+            variante, ts, _ = delta.match(nombre).groups()
+            if variante is not None:
+                continue
+            tipo = 'delta'
+        else:
+            continue
+        clasificados.append({**obj, 'tipo': tipo, 'ts': ts})
+    return clasificados
+
+
+def _manifest_parts(storage, tabla, obj):
+    """Claves de las partes de la tabla en un manifiesto de shards o de lectura paralela"""
+    manifest = json.loads(storage.get_bytes(obj['Key']))
+    claves = []
+    for shard in manifest.get('shards', []):
+        info = (shard.get('result') or {}).get(tabla)
+        if shard.get('status') != 'success' or not isinstance(info, dict) or not info.get('url'):
+            return None
+        # La URL depende del backend; la clave es la carpeta de la tabla y el nombre del archivo
+        claves.append(f"{tabla}/{info['url'].rstrip('/').rsplit('/', 1)[-1]}")
+    return claves or None
+
+
+def latest_snapshot(storage, tabla, objetos):
+    """
+    Último snapshot completo de la tabla: un archivo único o las partes listadas en un
+    manifiesto (las partes sin manifiesto son de una ejecución incompleta).
+
+    Returns:
+        Diccionario {'ts', 'claves'} o None
+    """
+    candidatos = sorted((o for o in objetos if o['tipo'] in ('snapshot', 'manifest')),
+                        key=lambda o: o['ts'], reverse=True)
+    for obj in candidatos:
+        if obj['tipo'] == 'snapshot':
+            return {'ts': obj['ts'], 'claves': [obj['Key']]}
+        partes = _manifest_parts(storage, tabla, obj)
+        if partes is not None:
+            return {'ts': obj['ts'], 'claves': partes}
+        print(f"⚠ {tabla}: manifiesto {obj['Key']} sin todas sus partes, se omite", file=sys.stderr)
+    return None
+
+
+def read_export(storage, key, tmp_dir):
+    """Lee un export (CSV, Parquet, JSON o NDJSON) como tabla de Arrow"""
+    path = os.path.join(tmp_dir, os.path.basename(key))
+    storage.download(key, path)
+    try:
+        extension = key.rsplit('.', 1)[-1]
+        if extension == 'parquet':
+            return pq.read_table(path)
+        if extension == 'csv':
+            # El hash de fila es hexadecimal: sin forzar texto, los que solo tienen dígitos serían enteros
+            opciones = pa_csv.ConvertOptions(column_types={HASH_COLUMN: pa.string(), OP_COLUMN: pa.string()})
+            return pa_csv.read_csv(path, convert_options=opciones)
+        if extension == 'ndjson':
+            return pa_json.read_json(path)
+        return pa.Table.from_pandas(pd.read_json(path, orient='records'), preserve_index=False)
+    finally:
+        os.remove(path)
+
+
+def read_exports(storage, claves, tmp_dir):
+    tablas = [read_export(storage, key, tmp_dir) for key in claves]
+    # Las partes pueden inferir tipos distintos (int/double, null): se unifican al más amplio
+    return tablas[0] if len(tablas) == 1 else pa.concat_tables(tablas, promote_options='permissive')
+
+
+def delta_keys(storage, tabla, cambios):
+    """
+    Columnas que identifican una fila en los exports delta de la tabla: la clave
+    primaria del índice delta o, en tablas sin clave, el hash de la fila.
+    """
+    data = storage.get_bytes(f"{DELTA_STATE_PREFIX}/{tabla}.parquet")
+    if data is not None:
+        columnas = [c for c in pq.read_schema(io.BytesIO(data)).names if c != HASH_COLUMN]
+    elif HASH_COLUMN in cambios.columns:
+        columnas = ['_fila', '_ocurrencia']
+    else:
+        raise ValueError(f"No hay índice delta de '{tabla}' para identificar la clave de sus filas")
+    return [HASH_COLUMN] if columnas == ['_fila', '_ocurrencia'] else columnas
+
+
+def _key_index(df, keys):
+    # Comparación como texto: la clave puede llegar como entero, texto o nullable según el archivo
+    return pd.MultiIndex.from_frame(df[keys].astype(str))
+
+
+def apply_changes(base, cambios, keys):
+    """
+    Aplica un export delta (columna _op) sobre la tabla: 'I' y 'U' reemplazan la fila
+    con la misma clave y 'D' la elimina. Sin clave, cada 'D' elimina una ocurrencia
+    de la fila con ese hash.
+    """
+    ops = cambios[OP_COLUMN].astype(str)
+    filas = cambios[ops != 'D'].drop(columns=[OP_COLUMN])
+    eliminadas = cambios.loc[ops == 'D', keys]
+
+    if base is None:
+        base = filas.iloc[0:0]
+    if keys == [HASH_COLUMN]:
+        por_eliminar = eliminadas[HASH_COLUMN].astype(str).value_counts()
+        hashes = base[HASH_COLUMN].astype(str)
+        limite = hashes.map(por_eliminar).fillna(0).to_numpy()
+        base = base[base.groupby(hashes).cumcount().to_numpy() >= limite]
+    else:
+        reemplazadas = pd.concat([filas[keys], eliminadas], ignore_index=True)
+        base = base[~_key_index(base, keys).isin(_key_index(reemplazadas, keys))]
+
+    # Las filas 'D' dejan columnas solo con nulos en el archivo de cambios: no cambian el tipo
+    columnas = [c for c in filas.columns if c in base.columns or filas[c].notna().any()]
+    return pd.concat([base, filas[columnas]], ignore_index=True)
+
+
+def compact_deltas(storage, tabla, puntero, deltas, tmp_dir):
+    """Versión compactada anterior (o vacía) con los exports delta pendientes aplicados en orden"""
+    base = None
+    if puntero is not None:
+        base = read_export(storage, puntero['key'], tmp_dir).to_pandas(types_mapper=pd.ArrowDtype)
+
+    keys = None
+    for obj in deltas:
+        cambios = read_export(storage, obj['Key'], tmp_dir).to_pandas(types_mapper=pd.ArrowDtype)
+        if keys is None:
+            keys = delta_keys(storage, tabla, cambios)
+            if base is not None and not set(keys) <= set(base.columns):
+                raise ValueError(f"La versión compactada de '{tabla}' no tiene las columnas {keys} "
+                                 f"para aplicar cambios delta")
+        base = apply_changes(base, cambios, keys)
+    return pa.Table.from_pandas(base, preserve_index=False)
+
+
+def plan_table(storage, tabla, objetos, puntero):
+    """
+    Decide qué compactar: el último snapshot completo, o los exports delta nuevos si
+    son posteriores (una tabla en modo delta no genera snapshots completos).
+
+    Returns:
+        Diccionario {'modo', 'hasta', 'claves'} o None si la versión vigente está al día
+    """
+    hasta_actual = puntero['hasta'] if puntero else ''
+    snapshot = latest_snapshot(storage, tabla, objetos)
+    deltas = sorted((o for o in objetos if o['tipo'] == 'delta'), key=lambda o: o['ts'])
+
+    if deltas and (snapshot is None or deltas[-1]['ts'] > snapshot['ts']):
+        pendientes = [o for o in deltas if o['ts'] > hasta_actual]
+        if not pendientes:
+            return None
+        return {'modo': 'delta', 'hasta': pendientes[-1]['ts'], 'claves': [o['Key'] for o in pendientes]}
+    if snapshot is None or snapshot['ts'] <= hasta_actual:
+        return None
+    return {'modo': 'snapshot', 'hasta': snapshot['ts'], 'claves': snapshot['claves']}
+
+
+def compact_table(storage, tabla, objetos, puntero, plan, tmp_dir):
+    """
+    Escribe la versión compactada (Parquet) y luego el puntero: quien lee el puntero
+    siempre encuentra un archivo completo.
+
+    Returns:
+        Nuevo puntero de la tabla
+    """
+    if plan['modo'] == 'delta':
+        por_clave = {o['Key']: o for o in objetos}
+        tabla_arrow = compact_deltas(storage, tabla, puntero, [por_clave[key] for key in plan['claves']], tmp_dir)
+    else:
+        tabla_arrow = read_exports(storage, plan['claves'], tmp_dir)
+
+    key = f"{tabla}/{COMPACTED_FOLDER}/{tabla}_{plan['hasta']}.parquet"
+    path = os.path.join(tmp_dir, os.path.basename(key))
+    pq.write_table(tabla_arrow, path, compression='zstd')
+    size = os.path.getsize(path)
+    storage.put_file(key, path, CONTENT_TYPE)
+    os.remove(path)
+
+    nuevo = {
+        'table': tabla,
+        'key': key,
+        'url': storage.url(key),
+        'formato': 'PARQUET',
+        'registros': tabla_arrow.num_rows,
+        'bytes': size,
+        'modo': plan['modo'],
+        'hasta': plan['hasta'],
+        'fuentes': plan['claves'],
+        'anterior': puntero['key'] if puntero else None,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+    # Un PUT reemplaza el objeto completo (atómico en S3; rename en el backend local)
+    storage.put_bytes(f"{tabla}/{POINTER_NAME}", json.dumps(nuevo, indent=2).encode('utf-8'), 'application/json')
+    print(f"✓ {tabla}: {tabla_arrow.num_rows} registros compactados en {key} "
+          f"desde {len(plan['claves'])} archivos", file=sys.stderr)
+    return nuevo
+
+
+def published_keys(storage, tabla, objetos, puntero):
+    """
+    Archivos que el gateway puede seguir sirviendo como último snapshot de la tabla
+    (GET .../latest y max_age guardan su URL): las fuentes de la versión vigente, el
+    último snapshot completo con su manifiesto y el último export delta.
+    """
+    claves = set(puntero.get('fuentes') or [])
+    snapshot = latest_snapshot(storage, tabla, objetos)
+    if snapshot is not None:
+        claves.update(snapshot['claves'])
+        claves.update(o['Key'] for o in objetos if o['tipo'] == 'manifest' and o['ts'] == snapshot['ts'])
+    deltas = [o for o in objetos if o['tipo'] == 'delta']
+    if deltas:
+        claves.add(max(deltas, key=lambda o: o['ts'])['Key'])
+    return claves
+
+
+def enforce_retention(storage, objetos, puntero, retention_days, keep_versions, dry_run):
+    """
+    Borra los archivos reemplazados por la versión vigente (hasta su timestamp) con más
+    de retention_days días. Se conservan las últimas keep_versions versiones compactadas,
+    todo lo posterior a la versión vigente y lo que el gateway aún publica como último
+    snapshot (ver published_keys).
+    """
+    limite = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    compactados = sorted((o for o in objetos if o['tipo'] == 'compactado'), key=lambda o: o['ts'], reverse=True)
+    conservar = {o['Key'] for o in compactados[:keep_versions]} | {puntero['key']}
+    conservar |= published_keys(storage, puntero['table'], objetos, puntero)
+
+    reemplazados = [o for o in objetos
+                    if o['tipo'] in REEMPLAZABLES and o['ts'] <= puntero['hasta'] and o['Key'] not in conservar]
+    vencidos = [o for o in reemplazados if o['LastModified'] < limite]
+    for obj in vencidos:
+        if not dry_run:
+            storage.delete(obj['Key'])
+    if vencidos:
+        accion = "se eliminarían" if dry_run else "eliminados"
+        print(f"✗ {puntero['table']}: {len(vencidos)} archivos reemplazados {accion}", file=sys.stderr)
+    return {
+        'eliminados': len(vencidos),
+        'liberados_bytes': sum(o['Size'] for o in vencidos),
+        'en_retencion': len(reemplazados) - len(vencidos),
+    }
+
+
+def load_pointer(storage, tabla):
+    data = storage.get_bytes(f"{tabla}/{POINTER_NAME}")
+    return json.loads(data) if data is not None else None
+
+
+def process_table(storage, tabla, retention_days, keep_versions, dry_run, tmp_dir):
+    objetos = classify(tabla, storage.list(f"{tabla}/") + storage.list(f"{tabla}{DELTA_SUFFIX}/"))
+    puntero = load_pointer(storage, tabla)
+    plan = plan_table(storage, tabla, objetos, puntero)
+
+    if plan is None:
+        resultado = {'estado': 'sin cambios' if puntero else 'sin exports'}
+    elif dry_run:
+        resultado = {'estado': 'pendiente', 'modo': plan['modo'], 'hasta': plan['hasta'],
+                     'fuentes': len(plan['claves'])}
+        # La retención se evalúa como si la versión nueva ya estuviera publicada
+        puntero = {'table': tabla, 'key': None, 'hasta': plan['hasta']}
+    else:
+        puntero = compact_table(storage, tabla, objetos, puntero, plan, tmp_dir)
+        objetos = classify(tabla, storage.list(f"{tabla}/") + storage.list(f"{tabla}{DELTA_SUFFIX}/"))
+        resultado = {'estado': 'compactada', 'modo': plan['modo'], 'fuentes': len(plan['claves'])}
+
+    if puntero is not None:
+        resultado.update({key: puntero[key] for key in ('url', 'registros', 'bytes', 'hasta') if key in puntero})
+        resultado['retencion'] = enforce_retention(storage, objetos, puntero, retention_days, keep_versions, dry_run)
+    return resultado
+
+
+def main():
+    """Función principal"""
+    try:
+        storage = get_storage_backend()
+        retention_days = float(os.getenv("COMPACTION_RETENTION_DAYS", 7))
+        keep_versions = max(int(os.getenv("COMPACTION_KEEP_VERSIONS", 2)), 1)
+        dry_run = os.getenv("COMPACTION_DRY_RUN", "0") == "1"
+
+        resultados = {}
+        with tempfile.TemporaryDirectory(dir=os.getenv("SPILL_DIR") or None) as tmp_dir:
+            for tabla in compaction_tables(storage):
+                try:
+                    resultados[tabla] = process_table(storage, tabla, retention_days, keep_versions, dry_run,
+                                                      tmp_dir)
+                except Exception as e:
+                    resultados[tabla] = {
+                        'error': str(e)
+                    }
+
+        # Imprimir resultado en JSON para que el orquestador lo capture
+        print(json.dumps(resultados))
+        sys.exit(0)
+
+    except Exception as e:
+        error_result = {
+            'error': f"Error general en compactación: {str(e)}"
+        }
+        print(json.dumps(error_result))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import boto3
+import os
+import shutil
+import sys
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+
+class StorageBackend(ABC):
+    """
+    Interfaz de almacenamiento de los exports. Las claves tienen la forma
+    "<carpeta>/<archivo>" igual que en S3.
+    """
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_fileobj(self, key: str, fileobj, content_type: str):
+        raise NotImplementedError
+
+    def put_file(self, key: str, path: str, content_type: str):
+        with open(path, 'rb') as f:
+            self.put_fileobj(key, f, content_type)
+
+    @abstractmethod
+    def put_bytes(self, key: str, data: bytes, content_type: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_bytes(self, key: str):
+        """Contenido del objeto, o None si no existe"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list(self, prefix: str) -> list:
+        """Objetos bajo el prefijo: [{'Key', 'LastModified', 'Size'}]"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_folders(self) -> list:
+        """Carpetas de primer nivel (una por tabla)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def download(self, key: str, path: str):
+        raise NotImplementedError
+
+    # Subidas multiparte (usadas por las subidas reanudables)
+    @abstractmethod
+    def create_multipart(self, key: str, content_type: str) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_parts(self, key: str, upload_id: str) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete_multipart(self, key: str, upload_id: str, parts: list):
+        raise NotImplementedError
+
+    @abstractmethod
+    def abort_multipart(self, key: str, upload_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_multipart_uploads(self, prefix: str) -> list:
+        """Subidas pendientes: [{'Key', 'UploadId', 'Initiated'}]"""
+        raise NotImplementedError
+
+
+class S3Backend(StorageBackend):
+    """
+    Almacenamiento en AWS S3 o en un emulador compatible (AWS_ENDPOINT_URL).
+
+    El cliente se crea y valida de forma diferida, con un head_bucket sobre el bucket
+    de destino en el primer uso, en lugar de listar todos los buckets en cada ejecución.
+    """
+
+    credentials_file = "/root/.aws/credentials"
+
+    def __init__(self, bucket_name: str, region: str, endpoint_url: str = None):
+        self.bucket_name = bucket_name
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        if os.path.exists(self.credentials_file):
+            # Credenciales montadas desde el host (perfil default)
+            if not os.access(self.credentials_file, os.R_OK):
+                raise RuntimeError(f"No hay permisos de lectura en {self.credentials_file}")
+            os.environ["AWS_SHARED_CREDENTIALS_FILE"] = self.credentials_file
+            os.environ["AWS_CONFIG_FILE"] = "/root/.aws/config"
+            os.environ["AWS_PROFILE"] = "default"
+            session = boto3.Session(profile_name='default')
+        else:
+            # Cadena de credenciales estándar (variables de entorno, rol IAM)
+            session = boto3.Session()
+
+        try:
+            client = session.client('s3', region_name=self.region, endpoint_url=self.endpoint_url)
+            client.head_bucket(Bucket=self.bucket_name)
+            destino = self.endpoint_url or f"AWS S3 región {self.region}"
+            print(f"✓ Conexión exitosa a {destino} (bucket {self.bucket_name})", file=sys.stderr)
+        except Exception as e:
+            raise RuntimeError(f"Error al crear cliente S3: {str(e)}")
+        return client
+
+    def url(self, key):
+        return f"s3://{self.bucket_name}/{key}"
+
+    def put_fileobj(self, key, fileobj, content_type):
+        self.client.upload_fileobj(fileobj, self.bucket_name, key, ExtraArgs={'ContentType': content_type})
+
+    def put_file(self, key, path, content_type):
+        self.client.upload_file(path, self.bucket_name, key, ExtraArgs={'ContentType': content_type})
+
+    def put_bytes(self, key, data, content_type):
+        self.client.put_object(Bucket=self.bucket_name, Key=key, Body=data, ContentType=content_type)
+
+    def get_bytes(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def list(self, prefix):
+        objects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                objects.append({'Key': obj['Key'], 'LastModified': obj['LastModified'], 'Size': obj['Size']})
+        return objects
+
+    def list_folders(self):
+        folders = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Delimiter='/'):
+            folders.extend(prefix['Prefix'].rstrip('/') for prefix in page.get('CommonPrefixes', []))
+        return folders
+
+    def download(self, key, path):
+        self.client.download_file(self.bucket_name, key, path)
+
+    def create_multipart(self, key, content_type):
+        response = self.client.create_multipart_upload(Bucket=self.bucket_name, Key=key, ContentType=content_type)
+        return response['UploadId']
+
+    def upload_part(self, key, upload_id, part_number, body):
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+        )
+        return response['ETag']
+
+    def list_parts(self, key, upload_id):
+        parts = []
+        paginator = self.client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket_name, Key=key, UploadId=upload_id):
+            parts.extend({'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in page.get('Parts', []))
+        return parts
+
+    def complete_multipart(self, key, upload_id, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+        )
+
+    def abort_multipart(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+
+    def list_multipart_uploads(self, prefix):
+        uploads = []
+        paginator = self.client.get_paginator('list_multipart_uploads')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            uploads.extend({'Key': u['Key'], 'UploadId': u['UploadId'], 'Initiated': u['Initiated']}
+                           for u in page.get('Uploads', []))
+        return uploads
+
+
+class LocalBackend(StorageBackend):
+    """
+    Almacenamiento en el sistema de archivos local, con la misma estructura de
+    carpetas que el bucket. Útil para staging en disco rápido y para medir la
+    serialización sin depender de la red ni de credenciales.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.multipart_root = os.path.join(self.root, '.multipart')
+        os.makedirs(self.root, exist_ok=True)
+        print(f"✓ Almacenamiento local en {self.root}", file=sys.stderr)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Clave fuera del directorio de almacenamiento: {key}")
+        return path
+
+    def _write_atomic(self, key, write):
+        """Escribe en un temporal y lo renombra para no dejar archivos a medias"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def url(self, key):
+        return f"file://{self._path(key)}"
+
+    def put_fileobj(self, key, fileobj, content_type):
+        self._write_atomic(key, lambda f: shutil.copyfileobj(fileobj, f, 8 * 1024 * 1024))
+
+    def put_bytes(self, key, data, content_type):
+        self._write_atomic(key, lambda f: f.write(data))
+
+    def get_bytes(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        directory = os.path.dirname(self._path(prefix + 'x'))
+        if not os.path.isdir(directory):
+            return []
+
+        objects = []
+        for dirpath, _, filenames in os.walk(directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if key.startswith(prefix) and not name.endswith('.tmp'):
+                    stat = os.stat(path)
+                    objects.append({
+                        'Key': key,
+                        'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+                        'Size': stat.st_size,
+                    })
+        return objects
+
+    def list_folders(self):
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def download(self, key, path):
+        shutil.copyfile(self._path(key), path)
+
+    def _upload_dir(self, upload_id):
+        return os.path.join(self.multipart_root, upload_id)
+
+    def create_multipart(self, key, content_type):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._upload_dir(upload_id))
+        with open(os.path.join(self._upload_dir(upload_id), 'key'), 'w') as f:
+            f.write(key)
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, body):
+        with open(os.path.join(self._upload_dir(upload_id), f"{part_number:05d}.part"), 'wb') as f:
+            f.write(body)
+        return f"{upload_id}-{part_number}"
+
+    def list_parts(self, key, upload_id):
+        directory = self._upload_dir(upload_id)
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"Subida {upload_id} no existe")
+        return [{'PartNumber': int(name.split('.')[0]), 'ETag': f"{upload_id}-{int(name.split('.')[0])}"}
+                for name in sorted(os.listdir(directory)) if name.endswith('.part')]
+
+    def complete_multipart(self, key, upload_id, parts):
+        directory = self._upload_dir(upload_id)
+
+        def _concat(f):
+            for part in sorted(parts, key=lambda p: p['PartNumber']):
+                with open(os.path.join(directory, f"{part['PartNumber']:05d}.part"), 'rb') as src:
+                    shutil.copyfileobj(src, f, 8 * 1024 * 1024)
+
+        self._write_atomic(key, _concat)
+        shutil.rmtree(directory)
+
+    def abort_multipart(self, key, upload_id):
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+
+    def list_multipart_uploads(self, prefix):
+        if not os.path.isdir(self.multipart_root):
+            return []
+
+        uploads = []
+        for upload_id in os.listdir(self.multipart_root):
+            key_file = os.path.join(self._upload_dir(upload_id), 'key')
+            if not os.path.exists(key_file):
+                continue
+            with open(key_file) as f:
+                key = f.read()
+            if key.startswith(prefix):
+                initiated = datetime.fromtimestamp(os.stat(key_file).st_mtime, timezone.utc)
+                uploads.append({'Key': key, 'UploadId': upload_id, 'Initiated': initiated})
+        return uploads
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Crea el backend configurado con STORAGE_BACKEND:
+        s3 (por defecto): AWS S3, o un emulador si AWS_ENDPOINT_URL está definido
+        local: sistema de archivos en LOCAL_STORAGE_PATH
+    """
+    backend = os.getenv("STORAGE_BACKEND", "s3").lower()
+    if backend == 'local':
+        return LocalBackend(os.getenv("LOCAL_STORAGE_PATH", "/data/ingesta"))
+    if backend == 's3':
+        return S3Backend(
+            os.getenv("AWS_BUCKET_NAME"),
+            os.getenv("AWS_REGION", "us-east-1"),
+            os.getenv("AWS_ENDPOINT_URL") or None,
+        )
+    raise ValueError(f"STORAGE_BACKEND no soportado: {backend}")
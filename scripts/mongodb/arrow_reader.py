@@ -0,0 +1,226 @@
+import binascii
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from batching import AdaptiveBatchSizer
+from id_ranges import single_id_class
+from spill import memory_budget_bytes
+
+try:
+    from pymongoarrow.api import Schema, find_arrow_all
+except ImportError:  # pymongoarrow es opcional: sin él se usa el lector de dicts
+    Schema = find_arrow_all = None
+
+# Campos exportados por colección (proyección aplicada en el servidor)
+CAMPOS = {
+    'medicos': ['_id', 'cmp', 'nombre', 'especialidad', 'colegiaturaValida', 'createdAt', 'updatedAt'],
+    'recetas': ['_id', 'pacienteDNI', 'medicoCMP', 'fechaEmision', 'productos', 'archivoPDF',
+                'estadoValidacion', 'createdAt', 'updatedAt'],
+}
+
+# El lector columnar solo escribe Parquet: JSON/NDJSON van por el lector de dicts, que
+# conserva el formato histórico de fechas y no crea objetos por celda para anidados
+ARROW_FORMATS = {'parquet': ('parquet', 'application/vnd.apache.parquet')}
+
+
+def projection(collection_name):
+    """Proyección de MongoDB con solo los campos exportados; None exporta todo"""
+    campos = CAMPOS.get(collection_name)
+    return {campo: 1 for campo in campos} if campos else None
+
+
+def arrow_reader_available():
+    return find_arrow_all is not None
+
+
+def _object_ids_to_hex(chunk):
+    """
+    Convierte un arreglo de ObjectId (12 bytes por valor) en texto hexadecimal
+    armando directamente los buffers del arreglo de strings, sin un objeto por fila.
+    """
+    storage = chunk.storage if isinstance(chunk, pa.ExtensionArray) else chunk
+    if not pa.types.is_fixed_size_binary(storage.type) or storage.null_count:
+        return pa.array([value.hex() if value is not None else None for value in storage.to_pylist()],
+                        type=pa.string())
+
+    n = len(storage)
+    width = storage.type.byte_width
+    raw = storage.buffers()[1].to_pybytes()[storage.offset * width:(storage.offset + n) * width]
+    offsets = np.arange(0, 2 * width * n + 1, 2 * width, dtype=np.int32)
+    return pa.Array.from_buffers(pa.string(), n, [None, pa.py_buffer(offsets), pa.py_buffer(binascii.hexlify(raw))])
+
+
+def _id_as_string(table):
+    """Reemplaza la columna _id por su representación en texto"""
+    if '_id' not in table.column_names:
+        return table
+    column = table.column('_id')
+    if pa.types.is_string(column.type):
+        return table
+    chunks = [_object_ids_to_hex(chunk) for chunk in column.chunks]
+    return table.set_column(table.schema.get_field_index('_id'), '_id', pa.chunked_array(chunks, type=pa.string()))
+
+
+def read_collection(collection, filtro=None, proyeccion=None):
+    """
+    Lee una colección como tabla de Arrow con la proyección indicada (por defecto
+    la de CAMPOS).
+
+    pymongoarrow decodifica los lotes de BSON en C directamente a columnas, sin
+    crear un dict por documento ni pasar por DataFrames.
+    """
+    table = find_arrow_all(collection, filtro or {}, projection=proyeccion or projection(collection.name))
+    return _id_as_string(table)
+
+
+def _fixed_schema(table):
+    """Esquema fijado desde el primer lote (los campos sin valores, como texto)"""
+    return pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                      for field in table.schema])
+
+
+def read_batches(collection, filtro=None, proyeccion=None):
+    """
+    Lee una colección como tablas de Arrow por páginas de _id (WHERE _id > último),
+    con el tamaño de página del AdaptiveBatchSizer, cuando hay presupuesto de memoria
+    (MEMORY_BUDGET_MB). Todas las páginas usan el esquema de la primera.
+
+    Sin presupuesto, o si las páginas no pueden recorrer la colección completa (_id
+    de clases distintas o excluido de la proyección), se lee en una sola tabla.
+
+    Yields:
+        Tablas de Arrow con _id como texto
+    """
+    proyeccion = proyeccion or projection(collection.name)
+    if memory_budget_bytes() is None:
+        yield read_collection(collection, filtro, proyeccion)
+        return
+    if (proyeccion or {}).get('_id', 1) == 0 or not single_id_class(collection):
+        print(f"⚠ {collection.name}: no se puede paginar por _id, se lee en una sola tabla", file=sys.stderr)
+        yield read_collection(collection, filtro, proyeccion)
+        return
+
+    sizer = AdaptiveBatchSizer(collection.name)
+    schema = None
+    ultimo = None
+    while True:
+        condicion = {'_id': {'$gt': ultimo}} if ultimo is not None else {}
+        query = {'$and': [filtro, condicion]} if filtro and condicion else (filtro or condicion)
+        page_rows = sizer.size
+        sizer.start()
+        pagina = find_arrow_all(collection, query, schema=schema, projection=proyeccion,
+                                sort=[('_id', 1)], limit=page_rows)
+        sizer.observe(pagina.num_rows, pagina.nbytes)
+        if pagina.num_rows == 0 and schema is not None:
+            break
+        if schema is None:
+            fijo = _fixed_schema(pagina)
+            pagina = pagina.cast(fijo)
+            schema = Schema.from_arrow(fijo)
+        if pagina.num_rows:
+            ultimo = pagina.column('_id')[-1].as_py()
+        yield _id_as_string(pagina)
+        if pagina.num_rows < page_rows:
+            break
+    sizer.log_summary()
+
+
+def normalize_recetas_arrow(table):
+    """
+    Equivalente columnar de normalize_recetas: separa el arreglo 'productos' en
+    recetas_productos con receta_id y posicion, usando los offsets de la lista.
+
+    Returns:
+        Tupla (recetas sin la columna productos, recetas_productos)
+    """
+    if 'productos' not in table.column_names:
+        return table, pa.table({'receta_id': pa.array([], pa.string()), 'posicion': pa.array([], pa.int64())})
+
+    recetas = table.drop(['productos'])
+    productos = table.column('productos').combine_chunks()
+    if not pa.types.is_list(productos.type):
+        productos = pa.array([None] * len(productos), pa.list_(pa.string()))
+
+    valores = pc.list_flatten(productos)
+    padres = pc.list_parent_indices(productos)
+    # Posición dentro del arreglo: índice plano menos el offset de inicio de su lista
+    inicios = pc.take(productos.offsets, padres)
+    posiciones = pc.subtract(pa.array(np.arange(len(valores), dtype=np.int64)),
+                             pc.subtract(pc.cast(inicios, pa.int64()), productos.offsets[0].cast(pa.int64())))
+
+    validos = pc.is_valid(valores)
+    valores, padres, posiciones = valores.filter(validos), padres.filter(validos), posiciones.filter(validos)
+
+    columnas = {
+        'receta_id': pc.take(recetas.column('_id'), padres),
+        'posicion': posiciones,
+    }
+    if pa.types.is_struct(valores.type):
+        # Subdocumentos: cada campo pasa a ser una columna
+        for campo, columna in zip(valores.type, valores.flatten()):
+            columnas[campo.name] = columna
+    else:
+        # Arreglo de valores simples (ej. ids de productos)
+        columnas['producto'] = _object_ids_to_hex(valores) if pa.types.is_fixed_size_binary(
+            getattr(valores.type, 'storage_type', valores.type)) else pc.cast(valores, pa.string())
+    return recetas, pa.table(columnas)
+
+
+# Transformación columnar por colección: Table -> {nombre_dataset: Table}
+TRANSFORMS = {
+    'medicos': lambda table: {'medicos': table},
+    'recetas': lambda table: dict(zip(['recetas', 'recetas_productos'], normalize_recetas_arrow(table))),
+}
+
+
+def export_arrow(db, collection_name, s3_uploader, output_format, filtro=None, proyeccion=None, sufijo=''):
+    """
+    Exporta una colección con el lector columnar (pymongoarrow) y proyección, como
+    Parquet. Cada lote se escribe al archivo de su dataset con un ParquetWriter en
+    SPILL_DIR, así que con presupuesto de memoria la colección no se carga completa.
+    sufijo se agrega al nombre de cada archivo (ej. exports filtrados).
+
+    Returns:
+        Diccionario {nombre_dataset: {'url', 'registros', 'formato'}}
+    """
+    if collection_name not in db.list_collection_names():
+        raise ValueError(f"La colección '{collection_name}' no existe en MongoDB")
+    if output_format not in ARROW_FORMATS:
+        raise ValueError(f"OUTPUT_FORMAT no soportado con el lector arrow: {output_format}")
+
+    extension, content_type = ARROW_FORMATS[output_format]
+    with tempfile.TemporaryDirectory(dir=os.getenv("SPILL_DIR") or None) as tmp_dir:
+        writers = {}
+        registros = {}
+        documentos = 0
+        try:
+            for table in read_batches(db[collection_name], filtro, proyeccion):
+                documentos += table.num_rows
+                for nombre, parte in TRANSFORMS[collection_name](table).items():
+                    if nombre not in writers:
+                        path = os.path.join(tmp_dir, f"{nombre}.{extension}")
+                        writers[nombre] = pq.ParquetWriter(path, parte.schema, compression='snappy')
+                        registros[nombre] = 0
+                    writers[nombre].write_table(parte.cast(writers[nombre].schema))
+                    registros[nombre] += parte.num_rows
+        finally:
+            for writer in writers.values():
+                writer.close()
+        print(f"✓ {collection_name}: {documentos} documentos leídos con pymongoarrow", file=sys.stderr)
+
+        resultados = {}
+        for nombre in writers:
+            with open(os.path.join(tmp_dir, f"{nombre}.{extension}"), 'rb') as f:
+                url = s3_uploader.upload_fileobj(f, nombre, f"{nombre}{sufijo}", extension, content_type)
+            resultados[nombre] = {
+                'url': url,
+                'registros': registros[nombre],
+                'formato': output_format.upper()
+            }
+    return resultados
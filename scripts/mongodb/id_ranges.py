@@ -0,0 +1,80 @@
+import sys
+
+from bson import Decimal128
+
+
+def id_class(value):
+    """
+    Clase de comparación de un _id en MongoDB: $gt/$gte/$lt solo comparan valores de
+    la misma clase (los números de distinto tipo numérico se comparan entre sí)
+    """
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, (int, float, Decimal128)):
+        return 'numero'
+    return type(value)
+
+
+def id_sort_key(value):
+    return value.to_decimal() if isinstance(value, Decimal128) else value
+
+
+def single_id_class(collection):
+    """
+    True si todos los _id de la colección son de la misma clase, de modo que un
+    filtro por rango de _id puede recorrerla completa. El índice de _id ordena
+    primero por clase: basta comparar el menor y el mayor.
+    """
+    primero = collection.find_one({}, projection={'_id': 1}, sort=[('_id', 1)])
+    ultimo = collection.find_one({}, projection={'_id': 1}, sort=[('_id', -1)])
+    return primero is None or id_class(primero['_id']) == id_class(ultimo['_id'])
+
+
+def compute_id_ranges(collection, partitions, sample_per_partition=20):
+    """
+    Calcula límites de rangos de _id a partir de una muestra aleatoria de la colección.
+
+    Un filtro por rango de _id no incluye documentos con _id de otra clase (ObjectId,
+    texto, números...), así que si la colección mezcla clases se lee en un solo rango.
+
+    Returns:
+        Lista de tuplas (inferior, superior); None indica rango abierto
+    """
+    if partitions <= 1:
+        return [(None, None)]
+    if not single_id_class(collection):
+        print(f"⚠ {collection.name}: _id de tipos distintos, se lee en un solo rango", file=sys.stderr)
+        return [(None, None)]
+
+    pipeline = [
+        {'$sample': {'size': partitions * sample_per_partition}},
+        {'$project': {'_id': 1}},
+    ]
+    try:
+        muestra = sorted((doc['_id'] for doc in collection.aggregate(pipeline)), key=id_sort_key)
+    except TypeError:
+        # _id sin orden en Python (ej. documentos): un solo rango
+        print(f"⚠ {collection.name}: _id sin orden comparable, se lee en un solo rango", file=sys.stderr)
+        return [(None, None)]
+    if not muestra:
+        return [(None, None)]
+
+    limites = []
+    for k in range(1, partitions):
+        limite = muestra[len(muestra) * k // partitions]
+        if not limites or id_sort_key(limite) > id_sort_key(limites[-1]):
+            limites.append(limite)
+
+    inferiores = [None] + limites
+    superiores = limites + [None]
+    return list(zip(inferiores, superiores))
+
+
+def range_filter(lower, upper):
+    """Construye el filtro de MongoDB para un rango [lower, upper) de _id"""
+    condicion = {}
+    if lower is not None:
+        condicion['$gte'] = lower
+    if upper is not None:
+        condicion['$lt'] = upper
+    return {'_id': condicion} if condicion else {}
@@ -2,8 +2,20 @@ import os
 import sys
 import pandas as pd
 from pymongo import MongoClient
-from s3_uploader import S3Uploader
+from s3_uploader import S3Uploader, OUTPUT_FORMATS, dataframe_to_documents
+from serializers import SerializedWriter, get_serializer, log_serializer
+from spill import SpillBuffer, memory_budget_bytes
+from batching import AdaptiveBatchSizer, table_strategies
+from arrow_reader import ARROW_FORMATS, CAMPOS, arrow_reader_available, export_arrow, projection
+from pushdown import QUERY_SUFFIX, apply_query, query_name, table_queries
+from id_ranges import compute_id_ranges, range_filter
+from sharding import (decode_bound, encode_bounds, excluded_tables, shard_config, shard_name, upload_manifest,
+                      write_manifest)
+from bson import json_util
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import json
+import time
 
 
 def get_mongo_connection():
@@ -14,8 +26,11 @@ def get_mongo_connection():
     password = os.getenv("MONGO_PASSWORD")
     database = os.getenv("MONGO_DATABASE")
 
+    # En modo paralelo cada worker necesita su propia conexión del pool
+    workers = int(os.getenv("MONGO_PARALLEL_WORKERS", 1))
+
     mongo_url = f"mongodb://{user}:{password}@{host}:{port}/{database}?authSource=admin"
-    client = MongoClient(mongo_url)
+    client = MongoClient(mongo_url, maxPoolSize=max(workers + 2, 10))
     return client[database]
 
 
@@ -29,11 +44,10 @@ def extract_medicos(db):
     if not collection_exists(db, 'medicos'):
         raise ValueError("La colección 'medicos' no existe en MongoDB")
 
-    medicos = list(db.medicos.find())
+    medicos = list(db.medicos.find(projection=projection('medicos')))
 
     if not medicos:
-        return pd.DataFrame(
-            columns=['_id', 'cmp', 'nombre', 'especialidad', 'colegiaturaValida', 'createdAt', 'updatedAt'])
+        return pd.DataFrame(columns=CAMPOS['medicos'])
 
     df = pd.DataFrame(medicos)
     df['_id'] = df['_id'].astype(str)
@@ -46,31 +60,244 @@ def extract_recetas(db):
     if not collection_exists(db, 'recetas'):
         raise ValueError("La colección 'recetas' no existe en MongoDB")
 
-    recetas = list(db.recetas.find())
+    recetas = list(db.recetas.find(projection=projection('recetas')))
 
     if not recetas:
-        return pd.DataFrame(columns=['_id', 'pacienteDNI', 'medicoCMP', 'fechaEmision',
-                                     'productos', 'archivoPDF', 'estadoValidacion', 'createdAt', 'updatedAt'])
+        return pd.DataFrame(columns=CAMPOS['recetas'])
 
     df = pd.DataFrame(recetas)
     df['_id'] = df['_id'].astype(str)
-    df['productos'] = df['productos'].apply(lambda x: str(x) if isinstance(x, list) else x)
 
     return df
 
 
-def main():
-    """Función principal"""
-    try:
-        # Conectar a MongoDB
-        db = get_mongo_connection()
+def normalize_recetas(df):
+    """
+    Separa el arreglo anidado 'productos' en un dataset hijo 'recetas_productos'
+    con una fila por producto, ligada a la receta mediante 'receta_id'.
 
-        # Inicializar uploader S3
-        s3_uploader = S3Uploader()
+    Returns:
+        Tupla (recetas sin la columna productos, recetas_productos)
+    """
+    recetas = df.drop(columns=['productos'], errors='ignore')
+
+    if 'productos' not in df.columns or df.empty:
+        return recetas, pd.DataFrame(columns=['receta_id', 'posicion'])
+
+    productos = df[['_id', 'productos']].explode('productos')
+    productos = productos[productos['productos'].notna()]
+    if productos.empty:
+        return recetas, pd.DataFrame(columns=['receta_id', 'posicion'])
+
+    detalle = pd.DataFrame({
+        'receta_id': productos['_id'].to_numpy(),
+        'posicion': productos.groupby(level=0).cumcount().to_numpy(),
+    })
+
+    valores = productos['productos']
+    es_documento = valores.map(type).eq(dict)
+    if es_documento.all():
+        # Subdocumentos: cada campo pasa a ser una columna
+        campos = pd.json_normalize(valores.tolist())
+        detalle = pd.concat([detalle, campos], axis=1)
+    else:
+        # Arreglo de valores simples (ej. ids de productos)
+        detalle['producto'] = valores.astype(str).to_numpy()
+
+    return recetas, detalle
+
+
+# Colecciones exportadas y su transformación DataFrame -> {nombre_dataset: DataFrame}
+COLECCIONES = [
+    ('medicos', lambda df: {'medicos': df}),
+    ('recetas', lambda df: dict(zip(['recetas', 'recetas_productos'], normalize_recetas(df)))),
+]
+
+# Datasets que genera cada colección: si la colección falla, se reportan todos con error
+DATASETS = {
+    'medicos': ('medicos',),
+    'recetas': ('recetas', 'recetas_productos'),
+}
+
+
+def collection_error(coleccion, error):
+    """Resultado de error para cada dataset de la colección"""
+    return {nombre: {'error': str(error)} for nombre in DATASETS.get(coleccion, (coleccion,))}
+
+
+def export_parallel(db, collection_name, workers, s3_uploader, transform):
+    """
+    Lee una colección por rangos de _id en paralelo y sube cada rango como una parte.
+
+    Args:
+        db: Base de datos de MongoDB (el cliente comparte su pool entre threads)
+        collection_name: Nombre de la colección
+        workers: Número de rangos y de lecturas simultáneas
+        s3_uploader: Uploader S3
+        transform: Función DataFrame -> {nombre_dataset: DataFrame}
+
+    Returns:
+        Diccionario {nombre_dataset: {'urls', 'registros', 'partes', 'manifest'}}, igual
+        que una tabla repartida en shards por el gateway
+    """
+    if not collection_exists(db, collection_name):
+        raise ValueError(f"La colección '{collection_name}' no existe en MongoDB")
+
+    collection = db[collection_name]
+    rangos = compute_id_ranges(collection, workers)
+    print(f"✓ {collection_name}: {len(rangos)} rangos de _id con {workers} workers", file=sys.stderr)
 
-        resultados = {}
+    def _export_part(indice, rango):
+        documentos = collection.find(range_filter(*rango), projection=projection(collection_name))
+        df = _documents_to_dataframe(list(documentos))
 
-        # Extraer y subir medicos
+        partes = {}
+        for nombre, df_parte in transform(df).items():
+            url = s3_uploader.upload_dataframe(df_parte, nombre, f"{nombre}_part{indice:03d}")
+            partes[nombre] = (url, len(df_parte))
+        return partes
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        partes = list(pool.map(_export_part, range(len(rangos)), rangos))
+
+    # El manifiesto agrupa las partes de esta ejecución (la compactación lo usa para unirlas)
+    manifest_url = write_manifest(s3_uploader, {
+        'database': 'mongodb',
+        'table': collection_name,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'shards': [
+            {
+                'index': indice,
+                'status': 'success',
+                'result': {nombre: {'url': url, 'registros': registros} for nombre, (url, registros) in parte.items()},
+            }
+            for indice, parte in enumerate(partes)
+        ],
+    })
+
+    resultados = {}
+    for parte in partes:
+        for nombre, (url, registros) in parte.items():
+            resultado = resultados.setdefault(nombre, {'urls': [], 'registros': 0, 'partes': 0,
+                                                       'manifest': manifest_url})
+            resultado['urls'].append(url)
+            resultado['registros'] += registros
+            resultado['partes'] += 1
+    return resultados
+
+
+def _documents_to_dataframe(documents):
+    """Convierte un lote de documentos en DataFrame con _id como texto"""
+    df = pd.DataFrame(documents)
+    if '_id' in df.columns:
+        df['_id'] = df['_id'].astype(str)
+    return df
+
+
+def export_streaming(db, collection_name, s3_uploader, transform, batch_size=None):
+    """
+    Exporta una colección lote por lote sin mantenerla completa en memoria.
+
+    Cada dataset producido por transform se serializa en su propio SpillBuffer, que
+    se vuelca a disco al superar MEMORY_BUDGET_MB y se sube desde ahí en streaming.
+    El tamaño de cada lote se ajusta según los bytes serializados por documento y el
+    RSS observados, así las colecciones con arreglos anidados usan lotes más chicos.
+
+    Returns:
+        Diccionario {nombre_dataset: {'url', 'registros'}}
+    """
+    if not collection_exists(db, collection_name):
+        raise ValueError(f"La colección '{collection_name}' no existe en MongoDB")
+
+    batch_size = batch_size or int(os.getenv("JSON_BATCH_SIZE", 1000))
+    output_format = os.getenv("OUTPUT_FORMAT", "json").lower()
+    serializer = get_serializer()
+    log_serializer(serializer, output_format)
+
+    buffers, writers = {}, {}
+
+    def _write(df):
+        for nombre, df_parte in transform(df).items():
+            if nombre not in writers:
+                buffers[nombre] = SpillBuffer(nombre)
+                writers[nombre] = SerializedWriter(buffers[nombre], serializer, output_format)
+            writers[nombre].write_batch(dataframe_to_documents(df_parte))
+
+    def _serialized_bytes():
+        return sum(buffer.size for buffer in buffers.values())
+
+    sizer = AdaptiveBatchSizer(collection_name, initial_rows=batch_size)
+    lote = []
+    sizer.start()
+    for documento in db[collection_name].find(projection=projection(collection_name), batch_size=batch_size):
+        lote.append(documento)
+        if len(lote) >= sizer.size:
+            antes = _serialized_bytes()
+            _write(_documents_to_dataframe(lote))
+            sizer.observe(len(lote), _serialized_bytes() - antes)
+            lote = []
+            sizer.start()
+    if lote or not writers:
+        _write(_documents_to_dataframe(lote))
+    sizer.log_summary()
+
+    extension, content_type = OUTPUT_FORMATS[output_format]
+    resultados = {}
+    for nombre, writer in writers.items():
+        writer.close()
+        with buffers[nombre] as buffer:
+            url = s3_uploader.upload_fileobj(buffer.fileobj(), nombre, nombre, extension, content_type)
+        resultados[nombre] = {
+            'url': url,
+            'registros': writer.count
+        }
+    return resultados
+
+
+def export_query(db, collection_name, s3_uploader, transform, filtro, proyeccion):
+    """
+    Exporta una colección con el filtro y la proyección pedidos al gateway
+    (TABLE_QUERIES); MongoDB aplica ambos y solo viajan los documentos pedidos.
+    Cada archivo se sube como <dataset>_consulta.
+
+    Returns:
+        Diccionario {nombre_dataset: {'url', 'registros', 'consulta'}}
+    """
+    if not collection_exists(db, collection_name):
+        raise ValueError(f"La colección '{collection_name}' no existe en MongoDB")
+
+    df = _documents_to_dataframe(list(db[collection_name].find(filtro, projection=proyeccion)))
+    resultados = {}
+    for nombre, df_parte in transform(df).items():
+        url = s3_uploader.upload_dataframe(df_parte, nombre, query_name(nombre))
+        resultados[nombre] = {
+            'url': url,
+            'registros': len(df_parte),
+            'consulta': True
+        }
+    return resultados
+
+
+def add_run_stats(resultados, s3_uploader, inicio):
+    """Agrega bytes subidos y duración a los datasets exportados sin error"""
+    duracion = round(time.perf_counter() - inicio, 3)
+    for nombre, resultado in resultados.items():
+        if 'error' not in resultado:
+            resultado['bytes'] = s3_uploader.uploaded_bytes.get(nombre, 0)
+            resultado['duracion_s'] = duracion
+    return resultados
+
+
+def export_sequential(db, s3_uploader, excluir=frozenset()):
+    """
+    Lee cada colección con un único cursor y la sube como un solo archivo.
+    Las colecciones en excluir las exporta otro contenedor (shards).
+    """
+    resultados = {}
+
+    # Extraer y subir medicos
+    if 'medicos' not in excluir:
+        inicio = time.perf_counter()
         try:
             df_medicos = extract_medicos(db)
             # Subir directamente a carpeta 'medicos' (sin prefijo mongodb)
@@ -83,20 +310,229 @@ def main():
             resultados['medicos'] = {
                 'error': str(e)
             }
+        add_run_stats(resultados, s3_uploader, inicio)
 
-        # Extraer y subir recetas
-        try:
-            df_recetas = extract_recetas(db)
-            # Subir directamente a carpeta 'recetas' (sin prefijo mongodb)
-            url_recetas = s3_uploader.upload_dataframe(df_recetas, 'recetas', 'recetas')
-            resultados['recetas'] = {
-                'url': url_recetas,
-                'registros': len(df_recetas)
-            }
-        except Exception as e:
-            resultados['recetas'] = {
-                'error': str(e)
+    if 'recetas' in excluir:
+        return resultados
+
+    # Extraer recetas y normalizar productos en un dataset hijo
+    inicio = time.perf_counter()
+    try:
+        df_recetas, df_recetas_productos = normalize_recetas(extract_recetas(db))
+    except Exception as e:
+        df_recetas = df_recetas_productos = None
+        resultados['recetas'] = resultados['recetas_productos'] = {
+            'error': str(e)
+        }
+
+    # Subir directamente a carpetas 'recetas' y 'recetas_productos' (sin prefijo mongodb)
+    if df_recetas is not None:
+        for nombre, df in [('recetas', df_recetas), ('recetas_productos', df_recetas_productos)]:
+            try:
+                url = s3_uploader.upload_dataframe(df, nombre, nombre)
+                resultados[nombre] = {
+                    'url': url,
+                    'registros': len(df)
+                }
+            except Exception as e:
+                resultados[nombre] = {
+                    'error': str(e)
+                }
+    add_run_stats({nombre: resultados[nombre] for nombre in ('recetas', 'recetas_productos')},
+                  s3_uploader, inicio)
+
+    return resultados
+
+
+def catalog_stats(db):
+    """
+    Estadísticas de catálogo de las colecciones exportadas, sin leer documentos
+    (collStats). bytes_datos es el tamaño BSON sin comprimir.
+
+    Returns:
+        Diccionario {coleccion: {'filas', 'bytes', 'bytes_datos', 'divisible'}}
+    """
+    existentes = set(db.list_collection_names())
+    stats = {}
+    for coleccion, _ in COLECCIONES:
+        if coleccion not in existentes:
+            stats[coleccion] = {'error': f"La colección '{coleccion}' no existe en MongoDB"}
+            continue
+        info = db.command('collStats', coleccion)
+        stats[coleccion] = {
+            'filas': info.get('count'),
+            'bytes': info.get('storageSize', 0) + info.get('totalIndexSize', 0),
+            'bytes_datos': info.get('size'),
+            # Toda colección se puede repartir por rangos de _id
+            'divisible': True,
+        }
+    return stats
+
+
+def export_with_strategy(db, coleccion, transform, estrategia, s3_uploader, lector, output_format):
+    """
+    Exporta una colección con la estrategia del plan del gateway:
+    'parallel' (rangos de _id con estrategia['workers']), 'chunked' (lotes con
+    volcado a disco) o 'single' (una sola lectura).
+    """
+    if estrategia['strategy'] == 'parallel':
+        return export_parallel(db, coleccion, int(estrategia.get('workers', 2)), s3_uploader, transform)
+    if estrategia['strategy'] == 'chunked':
+        return export_streaming(db, coleccion, s3_uploader, transform)
+    if lector == 'arrow':
+        return export_arrow(db, coleccion, s3_uploader, output_format)
+    otras = {c for c, _ in COLECCIONES if c != coleccion}
+    return export_sequential(db, s3_uploader, excluir=otras)
+
+
+def run_shard(shard):
+    """
+    Ejecuta el contenedor en modo shard (plan, export o manifest) para la colección
+    SHARD_TABLE. Los límites de _id viajan como JSON extendido (ObjectId incluido).
+
+    Returns:
+        Resultado a imprimir para el orquestador
+    """
+    nombre = shard['table']
+    if shard['mode'] == 'manifest':
+        return upload_manifest(S3Uploader(), nombre)
+
+    transform = dict(COLECCIONES).get(nombre)
+    if transform is None:
+        raise ValueError(f"Colección de shard desconocida: {nombre}")
+
+    db = get_mongo_connection()
+    if not collection_exists(db, nombre):
+        raise ValueError(f"La colección '{nombre}' no existe en MongoDB")
+    collection = db[nombre]
+
+    if shard['mode'] == 'plan':
+        bounds = compute_id_ranges(collection, shard['count'])
+        print(f"✓ {nombre}: {len(bounds)} shards de _id", file=sys.stderr)
+        return {'shards': encode_bounds(bounds, encode=json_util.dumps)}
+
+    inicio = time.perf_counter()
+    s3_uploader = S3Uploader()
+    filtro = range_filter(decode_bound(shard['lower'], decode=json_util.loads),
+                           decode_bound(shard['upper'], decode=json_util.loads))
+    df = _documents_to_dataframe(list(collection.find(filtro, projection=projection(collection.name))))
+
+    resultados = {}
+    for dataset, df_parte in transform(df).items():
+        url = s3_uploader.upload_dataframe(df_parte, dataset, shard_name(dataset, shard['index']))
+        resultados[dataset] = {
+            'url': url,
+            'registros': len(df_parte),
+            'shard': shard['index']
+        }
+    return add_run_stats(resultados, s3_uploader, inicio)
+
+
+def main():
+    """Función principal"""
+    try:
+        # Contenedor lanzado como shard de una colección grande
+        shard = shard_config()
+        if shard is not None:
+            print(json.dumps(run_shard(shard)))
+            sys.exit(0)
+
+        # Conectar a MongoDB
+        db = get_mongo_connection()
+
+        # Contenedor lanzado por el planificador: solo estadísticas de catálogo
+        if os.getenv("CATALOG_STATS", "0") == "1":
+            print(json.dumps({'tablas': catalog_stats(db)}))
+            sys.exit(0)
+
+        # Colecciones repartidas en contenedores shard aparte
+        excluidas = excluded_tables()
+        colecciones = [(c, t) for c, t in COLECCIONES if c not in excluidas]
+        # Campos y filtros por colección: solo se exportan esas colecciones
+        consultas = table_queries()
+        if consultas:
+            colecciones = [(c, t) for c, t in colecciones if c in consultas]
+        # Estrategia por colección según el plan del gateway
+        estrategias = table_strategies()
+
+        # Inicializar uploader S3
+        s3_uploader = S3Uploader()
+
+        workers = int(os.getenv("MONGO_PARALLEL_WORKERS", 1))
+        lector = os.getenv("MONGO_READER", "dict").lower()
+        output_format = os.getenv("OUTPUT_FORMAT", "json").lower()
+        if lector == 'arrow' and not arrow_reader_available():
+            print("⚠ MONGO_READER=arrow sin pymongoarrow instalado, se usa el lector de dicts", file=sys.stderr)
+            lector = 'dict'
+        if lector == 'arrow' and output_format not in ARROW_FORMATS:
+            print(f"⚠ MONGO_READER=arrow solo escribe Parquet, {output_format} usa el lector de dicts",
+                  file=sys.stderr)
+            lector = 'dict'
+
+        if consultas:
+            # Modo consulta: filtro y proyección resueltos por MongoDB
+            resultados = {
+                coleccion: {'error': f"Colección desconocida: {coleccion}"}
+                for coleccion in consultas.keys() - dict(COLECCIONES).keys()
             }
+            for coleccion, transform in colecciones:
+                inicio = time.perf_counter()
+                try:
+                    filtro, proyeccion = apply_query(coleccion, consultas[coleccion])
+                    if lector == 'arrow':
+                        exportados = export_arrow(db, coleccion, s3_uploader, output_format,
+                                                  filtro, proyeccion, sufijo=QUERY_SUFFIX)
+                        for resultado in exportados.values():
+                            resultado['consulta'] = True
+                    else:
+                        exportados = export_query(db, coleccion, s3_uploader, transform, filtro, proyeccion)
+                    resultados.update(add_run_stats(exportados, s3_uploader, inicio))
+                except Exception as e:
+                    resultados.update(collection_error(coleccion, e))
+        elif estrategias:
+            # Modo planificado: cada colección con la estrategia elegida por el gateway
+            resultados = {}
+            for coleccion, transform in colecciones:
+                inicio = time.perf_counter()
+                estrategia = estrategias.get(coleccion, {'strategy': 'single'})
+                try:
+                    exportados = export_with_strategy(db, coleccion, transform, estrategia,
+                                                      s3_uploader, lector, output_format)
+                    resultados.update(add_run_stats(exportados, s3_uploader, inicio))
+                except Exception as e:
+                    resultados.update(collection_error(coleccion, e))
+        elif lector == 'arrow':
+            # Modo columnar: BSON decodificado directo a Arrow, sin dicts por documento
+            resultados = {}
+            for coleccion, _ in colecciones:
+                inicio = time.perf_counter()
+                try:
+                    exportados = export_arrow(db, coleccion, s3_uploader, output_format)
+                    resultados.update(add_run_stats(exportados, s3_uploader, inicio))
+                except Exception as e:
+                    resultados.update(collection_error(coleccion, e))
+        elif workers > 1:
+            # Modo paralelo: una parte por rango de _id
+            resultados = {}
+            for coleccion, transform in colecciones:
+                inicio = time.perf_counter()
+                try:
+                    exportados = export_parallel(db, coleccion, workers, s3_uploader, transform)
+                    resultados.update(add_run_stats(exportados, s3_uploader, inicio))
+                except Exception as e:
+                    resultados.update(collection_error(coleccion, e))
+        elif memory_budget_bytes() is not None:
+            # Modo con presupuesto de memoria: lectura por lotes con volcado a disco
+            resultados = {}
+            for coleccion, transform in colecciones:
+                inicio = time.perf_counter()
+                try:
+                    exportados = export_streaming(db, coleccion, s3_uploader, transform)
+                    resultados.update(add_run_stats(exportados, s3_uploader, inicio))
+                except Exception as e:
+                    resultados.update(collection_error(coleccion, e))
+        else:
+            resultados = export_sequential(db, s3_uploader, excluidas)
 
         # Imprimir resultado en JSON para que el orquestador lo capture
         print(json.dumps(resultados))
@@ -0,0 +1,93 @@
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from arrow_reader import CAMPOS
+
+# Operadores de comparación con su equivalente en MongoDB
+MONGO_OPERATORS = {'eq': '$eq', 'ne': '$ne', 'gt': '$gt', 'gte': '$gte', 'lt': '$lt', 'lte': '$lte'}
+# Sufijo de los archivos de un export filtrado, para no confundirlos con un snapshot completo
+QUERY_SUFFIX = "_consulta"
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?$")
+
+
+def table_queries():
+    """
+    Campos y filtros por colección enviados por el gateway (TABLE_QUERIES, JSON).
+    Con consultas solo se exportan esas colecciones; sin ellas, todas completas.
+    """
+    value = os.getenv("TABLE_QUERIES")
+    return json.loads(value) if value else {}
+
+
+def query_name(nombre):
+    return f"{nombre}{QUERY_SUFFIX}"
+
+
+def _bson_value(campo, valor):
+    """
+    Convierte los valores de JSON a tipos de BSON: fechas ISO a datetime y, en _id,
+    textos hexadecimales a ObjectId (el export escribe _id como texto).
+    """
+    if isinstance(valor, list):
+        return [_bson_value(campo, item) for item in valor]
+    if not isinstance(valor, str):
+        return valor
+    if campo == '_id' and ObjectId.is_valid(valor):
+        return ObjectId(valor)
+    if ISO_DATE.match(valor):
+        return datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    return valor
+
+
+def _check_field(campo, permitidos, nombre, subcampos=False):
+    # En los filtros se aceptan subcampos (productos.sku) de un campo exportado
+    raiz = campo.split('.')[0] if subcampos else campo
+    if raiz not in permitidos:
+        raise ValueError(f"El campo '{campo}' no se exporta en '{nombre}'")
+
+
+def build_filter(filtros, permitidos, nombre):
+    """Traduce los filtros de una colección a un filtro de MongoDB"""
+    condiciones = []
+    for filtro in filtros:
+        campo, op, valor = filtro['column'], filtro['op'], _bson_value(filtro['column'], filtro.get('value'))
+        _check_field(campo, permitidos, nombre, subcampos=True)
+
+        if op in MONGO_OPERATORS:
+            condicion = {MONGO_OPERATORS[op]: valor}
+        elif op == 'in':
+            condicion = {'$in': valor}
+        elif op == 'between':
+            condicion = {'$gte': valor[0], '$lte': valor[1]}
+        elif op == 'last_days':
+            condicion = {'$gte': datetime.now(timezone.utc) - timedelta(days=int(valor))}
+        else:
+            raise ValueError(f"Operador de filtro no soportado: {op}")
+        condiciones.append({campo: condicion})
+
+    if not condiciones:
+        return {}
+    return condiciones[0] if len(condiciones) == 1 else {'$and': condiciones}
+
+
+def apply_query(nombre, consulta):
+    """
+    Aplica la consulta del gateway a una colección.
+
+    Returns:
+        Tupla (filtro, proyección)
+    """
+    permitidos = CAMPOS[nombre]
+    campos = consulta.get('columns') or permitidos
+    for campo in campos:
+        _check_field(campo, permitidos, nombre)
+
+    proyeccion = {campo: 1 for campo in campos}
+    # _id se conserva si se pide o si hace falta para ligar productos con su receta
+    if '_id' not in campos and 'productos' not in campos:
+        proyeccion['_id'] = 0
+    return build_filter(consulta.get('filters', []), permitidos, nombre), proyeccion
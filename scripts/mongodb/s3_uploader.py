@@ -1,58 +1,42 @@
-import boto3
 import os
 from datetime import datetime
 import io
 import sys
-import json
+import threading
+from serializers import get_serializer, iter_serialized, log_serializer, validate_serializer, StdlibSerializer
+from spill import SpillBuffer
+from storage import get_storage_backend
+
+# Formato de salida -> (extensión, Content-Type)
+OUTPUT_FORMATS = {
+    'json': ('json', 'application/json'),
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+}
+
+
+def dataframe_to_documents(df) -> list:
+    """Convierte un DataFrame en lista de documentos; NaN -> null para JSON válido"""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
 
 
 class S3Uploader:
     def __init__(self):
-        self.bucket_name = os.getenv("AWS_BUCKET_NAME")
-        self.region = os.getenv("AWS_REGION", "us-east-1")
-        
-        # Verificar que existe el archivo de credenciales
-        credentials_file = "/root/.aws/credentials"
-        if not os.path.exists(credentials_file):
-            raise RuntimeError(
-                f"Archivo de credenciales no encontrado en {credentials_file}. "
-                f"Asegúrate de que el volumen esté montado correctamente."
-            )
-        
-        # Verificar permisos de lectura
-        if not os.access(credentials_file, os.R_OK):
-            raise RuntimeError(
-                f"No hay permisos de lectura en {credentials_file}"
-            )
-        
-        # Leer y verificar contenido (sin mostrar credenciales)
-        try:
-            with open(credentials_file, 'r') as f:
-                content = f.read()
-                if not content.strip():
-                    raise RuntimeError("El archivo de credenciales está vacío")
-                if '[default]' not in content:
-                    raise RuntimeError("No se encontró el perfil [default] en credenciales")
-                print("✓ Credenciales AWS encontradas y con formato válido", file=sys.stderr)
-        except Exception as e:
-            raise RuntimeError(f"Error leyendo credenciales: {str(e)}")
-        
-        # Configurar boto3 explícitamente
-        os.environ["AWS_SHARED_CREDENTIALS_FILE"] = credentials_file
-        os.environ["AWS_CONFIG_FILE"] = "/root/.aws/config"
-        os.environ["AWS_PROFILE"] = "default"
-        
-        try:
-            # Crear sesión usando el perfil explícito
-            session = boto3.Session(profile_name='default')
-            self.s3_client = session.client('s3', region_name=self.region)
-            
-            # Verificar credenciales haciendo una llamada simple
-            self.s3_client.list_buckets()
-            print(f"✓ Conexión exitosa a AWS S3 en región {self.region}", file=sys.stderr)
-            
-        except Exception as e:
-            raise RuntimeError(f"Error al crear cliente S3: {str(e)}")
+        # Backend según STORAGE_BACKEND (s3 o local); S3 valida credenciales en el primer uso
+        self.storage = get_storage_backend()
+
+        # Bytes subidos por carpeta (colección), reportados en el resultado de la ingesta.
+        # En modo paralelo varias partes se suben a la vez desde distintos threads.
+        self.uploaded_bytes = {}
+        self._bytes_lock = threading.Lock()
+
+    def record_bytes(self, database_name: str, size: int):
+        with self._bytes_lock:
+            self.uploaded_bytes[database_name] = self.uploaded_bytes.get(database_name, 0) + size
+
+    def _build_key(self, database_name: str, collection_name: str, extension: str) -> str:
+        """Clave organizada por carpetas: <carpeta>/<colección>_<timestamp>.<extensión>"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"{database_name}/{collection_name}_{timestamp}.{extension}"
 
     def upload_json(self, json_content: str, database_name: str, collection_name: str) -> str:
         """
@@ -66,43 +50,74 @@ class S3Uploader:
         Returns:
             URL del archivo subido
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        s3_key = f"{database_name}/{collection_name}_{timestamp}.json"
-
         json_buffer = io.BytesIO(json_content.encode('utf-8'))
+        return self.upload_fileobj(json_buffer, database_name, collection_name, 'json', 'application/json')
+
+    def upload_documents(self, documents: list, database_name: str, collection_name: str) -> str:
+        """
+        Sube documentos de MongoDB como JSON (o NDJSON) al bucket S3
+
+        La serialización se hace por lotes hacia un archivo temporal en lugar de
+        construir un único string con toda la colección.
+
+        Args:
+            documents: Lista de documentos (dicts) de MongoDB
+            database_name: Nombre de la base de datos
+            collection_name: Nombre de la colección
+
+        Returns:
+            URL del archivo subido
+        """
+        output_format = os.getenv("OUTPUT_FORMAT", "json").lower()
+        batch_size = int(os.getenv("JSON_BATCH_SIZE", 1000))
 
         try:
-            self.s3_client.upload_fileobj(
-                json_buffer,
-                self.bucket_name,
-                s3_key,
-                ExtraArgs={'ContentType': 'application/json'}
-            )
-            print(f"✓ Archivo JSON subido exitosamente: {s3_key}", file=sys.stderr)
+            serializer = get_serializer()
+            if os.getenv("JSON_VALIDATE", "0") == "1" and not validate_serializer(serializer, documents[:batch_size]):
+                print(f"⚠ {serializer.name} no coincide byte a byte con json estándar, usando stdlib",
+                      file=sys.stderr)
+                serializer = StdlibSerializer(serializer.compact)
+            log_serializer(serializer, output_format)
+
+            buffer = SpillBuffer(f"{database_name}/{collection_name}")
+            for chunk in iter_serialized(documents, serializer, output_format, batch_size):
+                buffer.write(chunk)
         except Exception as e:
-            raise RuntimeError(f"Error subiendo archivo JSON a S3: {str(e)}")
+            raise RuntimeError(f"Error convirtiendo documentos a JSON: {str(e)}")
 
-        s3_url = f"s3://{self.bucket_name}/{s3_key}"
-        return s3_url
+        extension, content_type = OUTPUT_FORMATS[output_format]
+        with buffer:
+            return self.upload_fileobj(buffer.fileobj(), database_name, collection_name, extension, content_type)
 
-    def upload_documents(self, documents: list, database_name: str, collection_name: str) -> str:
+    def upload_fileobj(self, fileobj, database_name: str, collection_name: str, extension: str,
+                       content_type: str) -> str:
         """
-        Sube documentos de MongoDB como JSON al bucket S3
+        Sube un archivo abierto (en memoria o en disco) al bucket S3 en streaming
 
         Args:
-            documents: Lista de documentos (dicts) de MongoDB
+            fileobj: Objeto tipo archivo posicionado al inicio
             database_name: Nombre de la base de datos
             collection_name: Nombre de la colección
+            extension: Extensión del archivo (json, ndjson)
+            content_type: Content-Type del objeto
 
         Returns:
             URL del archivo subido
         """
+        s3_key = self._build_key(database_name, collection_name, extension)
+
         try:
-            # Convertir documentos a JSON string (pretty print para legibilidad)
-            json_content = json.dumps(documents, indent=2, default=str, ensure_ascii=False)
-            return self.upload_json(json_content, database_name, collection_name)
+            fileobj.seek(0, os.SEEK_END)
+            size = fileobj.tell()
+            fileobj.seek(0)
+            self.storage.put_fileobj(s3_key, fileobj, content_type)
+            print(f"✓ Archivo {extension.upper()} subido exitosamente: {s3_key}", file=sys.stderr)
         except Exception as e:
-            raise RuntimeError(f"Error convirtiendo documentos a JSON: {str(e)}")
+            raise RuntimeError(f"Error subiendo archivo {extension.upper()} a S3: {str(e)}")
+
+        self.record_bytes(database_name, size)
+
+        return self.storage.url(s3_key)
 
     def upload_csv(self, csv_content: str, database_name: str, collection_name: str) -> str:
         """
@@ -116,24 +131,8 @@ class S3Uploader:
         Returns:
             URL del archivo subido
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        s3_key = f"{database_name}/{collection_name}_{timestamp}.csv"
-
         csv_buffer = io.BytesIO(csv_content.encode('utf-8'))
-
-        try:
-            self.s3_client.upload_fileobj(
-                csv_buffer,
-                self.bucket_name,
-                s3_key,
-                ExtraArgs={'ContentType': 'text/csv'}
-            )
-            print(f"✓ Archivo CSV subido exitosamente: {s3_key}", file=sys.stderr)
-        except Exception as e:
-            raise RuntimeError(f"Error subiendo archivo CSV a S3: {str(e)}")
-
-        s3_url = f"s3://{self.bucket_name}/{s3_key}"
-        return s3_url
+        return self.upload_fileobj(csv_buffer, database_name, collection_name, 'csv', 'text/csv')
 
     def upload_dataframe(self, df, database_name: str, collection_name: str) -> str:
         """
@@ -148,7 +147,7 @@ class S3Uploader:
             URL del archivo subido
         """
         # Convertir DataFrame a lista de documentos (registros)
-        documents = df.to_dict('records')
+        documents = dataframe_to_documents(df)
         
         # Usar el método upload_documents para subir como JSON
         return self.upload_documents(documents, database_name, collection_name)
\ No newline at end of file
@@ -0,0 +1,186 @@
+import io
+import json
+import os
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: se usa la librería estándar
+    orjson = None
+
+
+def default_handler(obj):
+    """
+    Convierte tipos BSON/Python que JSON no soporta.
+
+    Mantiene el formato histórico de default=str (ej. '2025-01-02 15:30:45') para que
+    los archivos existentes y los nuevos sean comparables.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, (datetime, date, Decimal)):
+        return str(obj)
+    return str(obj)
+
+
+class StdlibSerializer:
+    """Serializador basado en el módulo json de la librería estándar"""
+
+    name = 'stdlib'
+
+    def __init__(self, compact=False):
+        self.compact = compact
+
+    def dumps(self, document) -> bytes:
+        """Serializa un documento; en modo no compacto usa indentación de 2 espacios"""
+        if self.compact:
+            text = json.dumps(document, default=default_handler, ensure_ascii=False, separators=(',', ':'))
+        else:
+            text = json.dumps(document, default=default_handler, ensure_ascii=False, indent=2)
+        return text.encode('utf-8')
+
+
+class OrjsonSerializer(StdlibSerializer):
+    """Serializador nativo con orjson, con los mismos manejadores de tipos BSON"""
+
+    name = 'orjson'
+
+    def __init__(self, compact=False):
+        super().__init__(compact)
+        # Delegar datetime al manejador para producir el mismo texto que la librería estándar
+        self.options = orjson.OPT_PASSTHROUGH_DATETIME
+        if not compact:
+            self.options |= orjson.OPT_INDENT_2
+
+    def dumps(self, document) -> bytes:
+        return orjson.dumps(document, default=default_handler, option=self.options)
+
+
+def get_serializer(backend=None, compact=None):
+    """
+    Retorna el serializador configurado.
+
+    Args:
+        backend: 'orjson', 'stdlib' o 'auto' (por defecto JSON_BACKEND o 'auto')
+        compact: Salida compacta (por defecto JSON_COMPACT)
+    """
+    backend = (backend or os.getenv("JSON_BACKEND", "auto")).lower()
+    if compact is None:
+        compact = os.getenv("JSON_COMPACT", "0") == "1"
+
+    if backend == 'stdlib':
+        return StdlibSerializer(compact)
+    if backend == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_BACKEND=orjson pero orjson no está instalado")
+    if orjson is not None:
+        return OrjsonSerializer(compact)
+    return StdlibSerializer(compact)
+
+
+def validate_serializer(serializer, documents) -> bool:
+    """
+    Verifica que el backend produce exactamente los mismos bytes que la librería
+    estándar en modo compacto para una muestra de documentos.
+    """
+    if serializer.name == StdlibSerializer.name:
+        return True
+
+    candidate = type(serializer)(compact=True)
+    reference = StdlibSerializer(compact=True)
+    return all(candidate.dumps(document) == reference.dumps(document) for document in documents)
+
+
+def _indent(chunk: bytes) -> bytes:
+    """Indenta un documento serializado para anidarlo dentro del arreglo raíz"""
+    return b'  ' + chunk.replace(b'\n', b'\n  ')
+
+
+class SerializedWriter:
+    """
+    Escribe documentos serializados de forma incremental en un archivo, lote por lote,
+    produciendo el mismo resultado que serializar la lista completa de una vez.
+    """
+
+    def __init__(self, fileobj, serializer, output_format='json'):
+        if output_format == 'ndjson' and not serializer.compact:
+            serializer = type(serializer)(compact=True)
+
+        self.fileobj = fileobj
+        self.serializer = serializer
+        self.output_format = output_format
+        self.count = 0
+
+        if output_format == 'ndjson':
+            self.separator, self.opening, self.closing = b'\n', b'', b'\n'
+        elif serializer.compact:
+            self.separator, self.opening, self.closing = b',', b'[', b']'
+        else:
+            self.separator, self.opening, self.closing = b',\n', b'[\n', b'\n]'
+
+    def write_batch(self, documents):
+        """Serializa y escribe un lote de documentos"""
+        if self.serializer.compact:
+            chunks = [self.serializer.dumps(doc) for doc in documents]
+        else:
+            chunks = [_indent(self.serializer.dumps(doc)) for doc in documents]
+        if not chunks:
+            return
+
+        self.fileobj.write((self.opening if self.count == 0 else self.separator) + self.separator.join(chunks))
+        self.count += len(chunks)
+
+    def close(self):
+        """Cierra el arreglo raíz (o termina el NDJSON)"""
+        if self.count == 0:
+            # Igual que json.dumps([]) / archivo NDJSON vacío
+            self.fileobj.write(b'' if self.output_format == 'ndjson' else b'[]')
+        else:
+            self.fileobj.write(self.closing)
+
+
+def iter_serialized(documents, serializer, output_format='json', batch_size=1000):
+    """
+    Serializa los documentos por lotes y genera bloques de bytes.
+
+    Args:
+        documents: Iterable de documentos
+        serializer: Serializador retornado por get_serializer
+        output_format: 'json' (arreglo) o 'ndjson' (un documento compacto por línea)
+        batch_size: Documentos por bloque
+
+    Yields:
+        Bloques de bytes listos para escribir
+    """
+    buffer = io.BytesIO()
+    writer = SerializedWriter(buffer, serializer, output_format)
+
+    def _take():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            writer.write_batch(batch)
+            batch = []
+            yield _take()
+
+    writer.write_batch(batch)
+    writer.close()
+    yield _take()
+
+
+def log_serializer(serializer, output_format):
+    """Registra el serializador elegido en stderr"""
+    modo = 'compacto' if serializer.compact or output_format == 'ndjson' else 'indentado'
+    print(f"✓ Serializador JSON: {serializer.name} ({output_format}, {modo})", file=sys.stderr)
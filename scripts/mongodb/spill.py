@@ -0,0 +1,59 @@
+import io
+import os
+import sys
+import tempfile
+
+# Tamaño en memoria por defecto cuando no hay presupuesto configurado
+DEFAULT_BUFFER_BYTES = 64 * 1024 * 1024
+
+
+def memory_budget_bytes():
+    """Presupuesto de memoria por tabla (MEMORY_BUDGET_MB); None si no está configurado"""
+    budget_mb = int(os.getenv("MEMORY_BUDGET_MB", 0) or 0)
+    return budget_mb * 1024 * 1024 if budget_mb > 0 else None
+
+
+class SpillBuffer:
+    """
+    Buffer de bytes que se mantiene en memoria hasta alcanzar el presupuesto y luego
+    se vuelca a un archivo temporal en SPILL_DIR. La subida se hace en streaming
+    desde el archivo, sin volver a cargar los datos en memoria.
+    """
+
+    def __init__(self, name, budget_bytes=None):
+        self.name = name
+        self.budget_bytes = budget_bytes or memory_budget_bytes() or DEFAULT_BUFFER_BYTES
+        self.spilled = False
+        self.size = 0
+        self._file = io.BytesIO()
+
+    def write(self, data: bytes):
+        if not self.spilled and self.size + len(data) > self.budget_bytes:
+            self._spill()
+        self._file.write(data)
+        self.size += len(data)
+
+    def _spill(self):
+        """Mueve el contenido en memoria a un archivo temporal"""
+        spill_dir = os.getenv("SPILL_DIR") or None
+        disk_file = tempfile.TemporaryFile(dir=spill_dir)
+        disk_file.write(self._file.getbuffer())
+        self._file.close()
+        self._file = disk_file
+        self.spilled = True
+        print(f"↪ {self.name}: supera {self.budget_bytes // (1024 * 1024)} MB, volcando a disco",
+              file=sys.stderr)
+
+    def fileobj(self):
+        """Retorna el archivo subyacente posicionado al inicio, listo para subir"""
+        self._file.seek(0)
+        return self._file
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,175 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from pymysql.constants import FIELD_TYPE, FLAG
+from pymysql.cursors import SSCursor
+
+from batching import AdaptiveBatchSizer
+
+# Tipos de columna de MySQL -> tipo Arrow. Los no listados se infieren del valor.
+MYSQL_TYPES = {
+    FIELD_TYPE.TINY: pa.int64(),
+    FIELD_TYPE.SHORT: pa.int64(),
+    FIELD_TYPE.LONG: pa.int64(),
+    FIELD_TYPE.INT24: pa.int64(),
+    FIELD_TYPE.LONGLONG: pa.int64(),
+    FIELD_TYPE.YEAR: pa.int64(),
+    FIELD_TYPE.FLOAT: pa.float64(),
+    FIELD_TYPE.DOUBLE: pa.float64(),
+    FIELD_TYPE.DATE: pa.date32(),
+    FIELD_TYPE.DATETIME: pa.timestamp('us'),
+    FIELD_TYPE.TIMESTAMP: pa.timestamp('us'),
+    # TIME llega como timedelta (puede ser negativo o pasar de 24 h): se exporta con el
+    # formato de MySQL, ya que el escritor CSV de Arrow no admite duraciones
+    FIELD_TYPE.TIME: pa.string(),
+    FIELD_TYPE.VARCHAR: pa.string(),
+    FIELD_TYPE.VAR_STRING: pa.string(),
+    FIELD_TYPE.STRING: pa.string(),
+    FIELD_TYPE.ENUM: pa.string(),
+    FIELD_TYPE.JSON: pa.string(),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _arrow_type(column, flags=0):
+    """Tipo Arrow para una columna de cursor.description (flags del campo de pymysql)"""
+    name, type_code, _, _, precision, scale, _ = column
+    if type_code in (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+        return pa.decimal128(min(max(precision or 38, 1), 38), scale or 0)
+    if type_code == FIELD_TYPE.LONGLONG and flags & FLAG.UNSIGNED:
+        return pa.uint64()
+    return MYSQL_TYPES.get(type_code, pa.string())
+
+
+def _mysql_time(value):
+    """timedelta de una columna TIME -> texto [-]HH:MM:SS[.ffffff], como lo muestra MySQL"""
+    if value is None or isinstance(value, str):
+        return value
+    total_us = (value.days * 86400 + value.seconds) * 10 ** 6 + value.microseconds
+    signo = "-" if total_us < 0 else ""
+    segundos, micros = divmod(abs(total_us), 10 ** 6)
+    horas, resto = divmod(segundos, 3600)
+    texto = f"{signo}{horas:02d}:{resto // 60:02d}:{resto % 60:02d}"
+    return f"{texto}.{micros:06d}" if micros else texto
+
+
+def _column_array(values, type_code, arrow_type):
+    """Arma la columna Arrow de un lote a partir de los valores de pymysql"""
+    if type_code == FIELD_TYPE.TIME:
+        values = [_mysql_time(value) for value in values]
+    elif pa.types.is_date(arrow_type) or pa.types.is_timestamp(arrow_type):
+        # Las fechas cero (0000-00-00) no son válidas y pymysql las entrega como texto
+        values = [None if isinstance(value, str) else value for value in values]
+    return pa.array(values, type=arrow_type)
+
+
+@contextmanager
+def open_record_batches(conn, query, params=None, sizer=None):
+    """
+    Abre el resultado de una consulta como un lector de RecordBatches de Arrow.
+
+    Usa un cursor sin buffer (SSCursor) sobre la misma conexión, y por lo tanto el
+    mismo snapshot, y arma cada lote columna por columna sin pasar por pandas.
+    pymysql decodifica el protocolo de MySQL fila por fila, así que cada celda sigue
+    siendo un objeto Python mientras se arma su lote: se evitan el DataFrame y la
+    serialización de pandas, no la decodificación por celda del driver.
+
+    Args:
+        conn: Conexión de SQLAlchemy
+        query: Consulta SQL
+        params: Parámetros de la consulta (opcional)
+        sizer: AdaptiveBatchSizer que fija las filas de cada RecordBatch; sin él se
+            usan lotes fijos de CHUNK_ROWS filas
+
+    Yields:
+        Lector iterable de RecordBatches con atributo .schema
+    """
+    dbapi_conn = conn.connection.dbapi_connection
+    cursor = dbapi_conn.cursor(SSCursor)
+    try:
+        cursor.execute(query, params)
+        fields = cursor._result.fields
+        schema = pa.schema([(column[0], _arrow_type(column, field.flags))
+                            for column, field in zip(cursor.description, fields)])
+        type_codes = [column[1] for column in cursor.description]
+
+        batch_rows = int(os.getenv("CHUNK_ROWS", 50000))
+
+        def _batches():
+            while True:
+                if sizer is not None:
+                    sizer.start()
+                rows = cursor.fetchmany(sizer.size if sizer is not None else batch_rows)
+                if not rows:
+                    break
+                columns = zip(*rows)
+                batch = pa.RecordBatch.from_arrays(
+                    [_column_array(values, type_code, field.type)
+                     for values, type_code, field in zip(columns, type_codes, schema)],
+                    schema=schema,
+                )
+                if sizer is not None:
+                    sizer.observe(batch.num_rows, batch.nbytes)
+                yield batch
+
+        yield pa.RecordBatchReader.from_batches(schema, _batches())
+    finally:
+        cursor.close()
+
+
+def write_batches(reader, path, output_format):
+    """
+    Escribe los RecordBatches de un lector en un archivo CSV o Parquet.
+    Si no hay filas se escribe un archivo con solo el esquema.
+
+    Returns:
+        Número de registros escritos
+    """
+    if output_format == 'parquet':
+        writer = pq.ParquetWriter(path, reader.schema, compression='snappy')
+    else:
+        writer = pa_csv.CSVWriter(path, reader.schema)
+
+    registros = 0
+    with writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            registros += batch.num_rows
+    return registros
+
+
+def table_to_csv(table, include_header=True) -> bytes:
+    """Serializa una tabla de Arrow como CSV en memoria"""
+    sink = pa.BufferOutputStream()
+    pa_csv.write_csv(table, sink, write_options=pa_csv.WriteOptions(include_header=include_header))
+    return sink.getvalue().to_pybytes()
+
+
+def export_table_arrow(conn, table_name, query, s3_uploader, output_format='csv', params=None, folder=None):
+    """
+    Exporta una consulta a S3 pasando solo por Arrow (sin DataFrames de pandas).
+    folder indica la carpeta de destino si difiere del nombre del archivo (ej. shards).
+
+    Returns:
+        Tupla (url, registros)
+    """
+    with tempfile.TemporaryDirectory(dir=os.getenv("SPILL_DIR") or None) as tmp_dir:
+        path = os.path.join(tmp_dir, f"{table_name}.{output_format}")
+        sizer = AdaptiveBatchSizer(table_name)
+        with open_record_batches(conn, query, params, sizer) as reader:
+            registros = write_batches(reader, path, output_format)
+        sizer.log_summary()
+
+        print(f"✓ {table_name}: {registros} registros extraídos con Arrow ({output_format})", file=sys.stderr)
+        url = s3_uploader.upload_file(path, folder or table_name, table_name, output_format,
+                                      CONTENT_TYPES[output_format])
+    return url, registros
@@ -0,0 +1,132 @@
+import json
+import os
+import sys
+import time
+
+from spill import memory_budget_bytes
+
+# Archivos de cgroup con el límite de memoria del contenedor (v2 y v1)
+CGROUP_MEMORY_LIMITS = ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+# Fracción del límite del contenedor a partir de la cual se reducen los lotes
+RSS_HIGH_WATERMARK = 0.7
+
+
+def table_strategies():
+    """
+    Estrategia de lectura por tabla elegida por el planificador del gateway
+    (TABLE_STRATEGIES, JSON): {tabla: {'strategy': 'single'|'chunked'|'parallel', 'workers': n}}.
+    Las tablas sin entrada usan la decisión por defecto del script.
+    """
+    value = os.getenv("TABLE_STRATEGIES")
+    return json.loads(value) if value else {}
+
+
+def current_rss_bytes():
+    """RSS actual del proceso (Linux); None si no se puede leer"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def container_memory_limit():
+    """Límite de memoria del contenedor según cgroup; None si no hay límite"""
+    for path in CGROUP_MEMORY_LIMITS:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+class AdaptiveBatchSizer:
+    """
+    Tamaño de lote que se ajusta durante la lectura de una tabla.
+
+    Después de cada lote se mide el tamaño por fila y el tiempo del lote, y el
+    siguiente se dimensiona para acercarse a un tamaño objetivo en memoria
+    (BATCH_TARGET_MB) y a una latencia objetivo (BATCH_TARGET_SECONDS). Si el RSS
+    del proceso se acerca al límite del contenedor, el lote se reduce a la mitad.
+    El crecimiento se limita a 2x por lote para no saltar con una sola muestra.
+    """
+
+    def __init__(self, name, initial_rows=None, min_rows=None, max_rows=None):
+        self.name = name
+        self.size = initial_rows or int(os.getenv("CHUNK_ROWS", 50000))
+        self.min_rows = min_rows or int(os.getenv("BATCH_MIN_ROWS", 500))
+        self.max_rows = max_rows or int(os.getenv("BATCH_MAX_ROWS", 500000))
+        self.size = max(self.min_rows, min(self.size, self.max_rows))
+
+        target_mb = float(os.getenv("BATCH_TARGET_MB", 0) or 0)
+        budget = memory_budget_bytes()
+        # Sin objetivo explícito, un lote usa a lo sumo una cuarta parte del presupuesto por tabla
+        if target_mb > 0:
+            self.target_bytes = target_mb * 1024 * 1024
+        else:
+            self.target_bytes = budget // 4 if budget else 32 * 1024 * 1024
+        self.target_seconds = float(os.getenv("BATCH_TARGET_SECONDS", 2))
+        self.memory_limit = container_memory_limit()
+
+        self.bytes_per_row = None
+        self.lotes = 0
+        self.sizes = []
+        self.max_rss = 0
+        self._started = None
+
+    def start(self):
+        """Marca el inicio de la lectura del siguiente lote"""
+        self._started = time.perf_counter()
+
+    def observe(self, rows, nbytes):
+        """
+        Registra un lote leído y ajusta el tamaño del siguiente.
+
+        Args:
+            rows: Filas del lote
+            nbytes: Bytes del lote (en memoria o serializados)
+
+        Returns:
+            Tamaño en filas para el siguiente lote
+        """
+        seconds = time.perf_counter() - self._started if self._started is not None else None
+        self._started = None
+        self.lotes += 1
+        self.sizes.append(rows)
+        if rows <= 0:
+            return self.size
+
+        # Media móvil del tamaño por fila para suavizar lotes atípicos
+        muestra = nbytes / rows
+        self.bytes_per_row = muestra if self.bytes_per_row is None else 0.7 * self.bytes_per_row + 0.3 * muestra
+
+        candidatos = [self.target_bytes / max(self.bytes_per_row, 1)]
+        if seconds and seconds > 0:
+            candidatos.append(rows * self.target_seconds / seconds)
+        objetivo = min(candidatos)
+
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.max_rss = max(self.max_rss, rss)
+            if self.memory_limit and rss > self.memory_limit * RSS_HIGH_WATERMARK:
+                objetivo = min(objetivo, self.size / 2)
+
+        anterior = self.size
+        nuevo = int(min(objetivo, anterior * 2))
+        self.size = max(self.min_rows, min(nuevo, self.max_rows))
+        if abs(self.size - anterior) >= anterior * 0.25:
+            rss_mb = f"{rss / (1024 * 1024):.0f} MB" if rss is not None else "n/d"
+            print(f"↕ {self.name}: lote {anterior} → {self.size} filas "
+                  f"({self.bytes_per_row:.0f} B/fila, RSS {rss_mb})", file=sys.stderr)
+        return self.size
+
+    def log_summary(self):
+        """Resumen de los tamaños de lote usados en la tabla"""
+        if not self.sizes:
+            return
+        bytes_fila = f"{self.bytes_per_row:.0f}" if self.bytes_per_row is not None else "n/d"
+        print(f"✓ {self.name}: {self.lotes} lotes de {min(self.sizes)}-{max(self.sizes)} filas, "
+              f"{bytes_fila} B/fila, RSS máx {self.max_rss / (1024 * 1024):.0f} MB", file=sys.stderr)
@@ -0,0 +1,275 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from spill import SpillBuffer
+
+DELTA_PREFIX = "_delta"
+HASH_COLUMN = "_hash"
+OP_COLUMN = "_op"
+
+# Enteros representables sin pérdida como float64
+MAX_EXACT_FLOAT = 2 ** 53
+
+# Hash fijo de un valor nulo, igual para cualquier dtype
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+
+def delta_tables():
+    """Tablas a extraer en modo delta (DELTA_TABLES, separadas por coma)"""
+    return {t.strip() for t in os.getenv("DELTA_TABLES", "").split(",") if t.strip()}
+
+
+def _numeric_hashes(column, nulos):
+    """
+    Hash de una columna numérica sobre sus valores de numpy: los enteros (también los
+    nullable, con nulos en 0 y la máscara aparte) como int64, y los float enteros
+    representables como el mismo int64, para que 5.0 y 5 den igual entre lotes.
+    """
+    if pd.api.types.is_integer_dtype(column):
+        if column.dtype.kind == 'u':
+            return pd.util.hash_array(column.to_numpy(dtype=np.uint64, na_value=0).view(np.int64))
+        return pd.util.hash_array(column.to_numpy(dtype=np.int64, na_value=0))
+    valores = column.to_numpy(dtype=np.float64, na_value=np.nan)
+    enteros = ~nulos & (np.floor(valores) == valores) & (np.abs(valores) < MAX_EXACT_FLOAT)
+    como_entero = pd.util.hash_array(np.where(enteros, valores, 0).astype(np.int64))
+    return np.where(enteros, como_entero, pd.util.hash_array(np.where(nulos, 0, valores)))
+
+
+def _datetime_hashes(valores):
+    """Hash de fechas como int64 en microsegundos (sin zona: las aware se pasan a UTC)"""
+    if isinstance(valores, pd.Series):
+        if getattr(valores.dtype, 'tz', None) is not None:
+            valores = valores.dt.tz_convert('UTC').dt.tz_localize(None)
+        valores = valores.to_numpy(dtype='datetime64[us]')
+    return pd.util.hash_array(valores.astype('datetime64[us]').view(np.int64))
+
+
+def _column_hashes(column):
+    """
+    Hash de 64 bits por valor de una columna, independiente del dtype con que la leyó
+    pandas: un entero con nulos llega como float64 en un lote y como int64 en otro, y un
+    booleano con nulos como object; ambos deben dar el mismo hash. Numéricos, fechas y
+    booleanos se hashean sobre numpy; solo las columnas de texto u objetos pasan por str.
+    """
+    nulos = column.isna().to_numpy()
+    if pd.api.types.is_object_dtype(column):
+        # object con valores de un solo tipo escalar (p. ej. enteros o booleanos con nulos)
+        tipo = pd.api.types.infer_dtype(column, skipna=True)
+        if tipo == 'boolean':
+            column = column.astype('boolean')
+        elif tipo in ('integer', 'floating', 'mixed-integer-float'):
+            column = pd.to_numeric(column)
+        elif tipo in ('datetime', 'datetime64'):
+            try:
+                return np.where(nulos, NULL_HASH, _datetime_hashes(column.to_numpy(dtype=object)))
+            except (TypeError, ValueError, OverflowError):
+                pass
+
+    if pd.api.types.is_bool_dtype(column):
+        hashes = pd.util.hash_array(column.to_numpy(dtype=np.uint8, na_value=0))
+    elif pd.api.types.is_numeric_dtype(column):
+        hashes = _numeric_hashes(column, nulos)
+    elif pd.api.types.is_datetime64_any_dtype(column):
+        hashes = _datetime_hashes(column)
+    else:
+        hashes = pd.util.hash_array(column.to_numpy(dtype=object, na_value=None), categorize=False)
+    return np.where(nulos, NULL_HASH, hashes)
+
+
+def row_hashes(df) -> np.ndarray:
+    """Hash de 64 bits por fila combinando el hash de cada columna, estable entre ejecuciones"""
+    por_columna = pd.DataFrame({c: _column_hashes(df[c]) for c in df.columns}, index=df.index)
+    return pd.util.hash_pandas_object(por_columna, index=False).to_numpy(dtype=np.uint64)
+
+
+def build_index(df, key_columns=None, ocurrencias=None):
+    """
+    Construye el índice compacto (clave -> hash) de un snapshot o de un lote.
+
+    Sin clave primaria, la fila se identifica por su propio hash más el número de
+    ocurrencia de ese hash, de modo que las filas repetidas se cuentan por separado.
+    En ese caso los cambios se expresan solo como inserciones y eliminaciones.
+    ocurrencias (hash -> filas vistas en lotes anteriores) se actualiza en el lugar.
+    """
+    hashes = row_hashes(df)
+    if key_columns:
+        index = df[key_columns].reset_index(drop=True)
+    else:
+        index = pd.DataFrame({'_fila': hashes})
+        index['_ocurrencia'] = index.groupby('_fila').cumcount()
+        if ocurrencias is not None:
+            previas = index['_fila'].map(ocurrencias).fillna(0).to_numpy(dtype=np.int64)
+            index['_ocurrencia'] += previas
+            for fila, cantidad in index['_fila'].value_counts().items():
+                ocurrencias[fila] = ocurrencias.get(fila, 0) + cantidad
+    index[HASH_COLUMN] = hashes
+    return index
+
+
+def _state_key(nombre):
+    return f"{DELTA_PREFIX}/{nombre}.parquet"
+
+
+def load_index(storage, nombre):
+    """Índice del snapshot anterior, o None si es la primera ejecución en modo delta"""
+    data = storage.get_bytes(_state_key(nombre))
+    return pd.read_parquet(io.BytesIO(data)) if data is not None else None
+
+
+def save_index(storage, nombre, index):
+    buffer = io.BytesIO()
+    index.to_parquet(buffer, index=False, compression='zstd')
+    storage.put_bytes(_state_key(nombre), buffer.getvalue(), 'application/vnd.apache.parquet')
+
+
+def _hex(hashes):
+    return [format(h, '016x') for h in hashes.tolist()]
+
+
+def _lookup(keys_frame):
+    """Índice de pandas sobre las columnas de clave (MultiIndex si son varias)"""
+    if keys_frame.shape[1] == 1:
+        return pd.Index(keys_frame.iloc[:, 0])
+    return pd.MultiIndex.from_frame(keys_frame)
+
+
+class _ChangeWriter:
+    """
+    Acumula las filas cambiadas de cada lote. En CSV se escriben a un SpillBuffer
+    (se vuelca a disco al superar el presupuesto); en Parquet se concatenan al final.
+    """
+
+    def __init__(self, nombre, output_format):
+        self.output_format = output_format
+        self.columnas = None
+        self.registros = 0
+        self._partes = []
+        self._buffer = SpillBuffer(f"{nombre}_delta") if output_format == 'csv' else None
+
+    def write(self, cambios):
+        if cambios.empty:
+            return
+        if self.columnas is None:
+            self.columnas = list(cambios.columns)
+        cambios = cambios.reindex(columns=self.columnas)
+        if self._buffer is not None:
+            self._buffer.write(cambios.to_csv(index=False, header=self.registros == 0).encode('utf-8'))
+        else:
+            self._partes.append(cambios)
+        self.registros += len(cambios)
+
+    def upload(self, s3_uploader, nombre):
+        # Carpeta propia para no mezclar cambios con los snapshots completos de la tabla
+        folder = f"{nombre}_delta"
+        if self._buffer is not None:
+            return s3_uploader.upload_fileobj(self._buffer.fileobj(), folder, folder, 'csv', 'text/csv')
+        return s3_uploader.upload_dataframe(pd.concat(self._partes, ignore_index=True), folder, folder,
+                                            self.output_format)
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+
+
+def export_delta(chunks, nombre, key_columns, s3_uploader, output_format='csv'):
+    """
+    Exporta solo las filas insertadas, actualizadas o eliminadas desde el último
+    snapshot, detectadas por hash de fila. En la primera ejecución todas las filas
+    salen como inserciones, así el archivo de cambios es la línea base.
+
+    La tabla se recorre lote por lote: en memoria solo quedan el índice compacto
+    (clave -> hash) del snapshot anterior y del actual, no la tabla completa.
+
+    Args:
+        chunks: DataFrames con las filas de la tabla (uno, o lotes de un cursor de servidor)
+        nombre: Nombre de salida de la tabla
+        key_columns: Columnas de la clave primaria (None si la tabla no tiene)
+        s3_uploader: Uploader S3 (su backend guarda el índice)
+        output_format: 'csv' o 'parquet'
+
+    Returns:
+        Diccionario con url, registros (filas del archivo de cambios), leidos
+        (filas de la tabla), modo y conteo de cambios
+    """
+    previous = load_index(s3_uploader.storage, nombre)
+    modo = 'delta' if previous is not None else 'delta_inicial'
+
+    keys = list(key_columns) if key_columns else ['_fila', '_ocurrencia']
+    if previous is not None:
+        anterior = _lookup(previous[keys])
+        hashes_anteriores = previous[HASH_COLUMN].to_numpy(dtype=np.uint64)
+        vistos = np.zeros(len(previous), dtype=bool)
+
+    conteo = {'I': 0, 'U': 0, 'D': 0}
+    partes_indice = []
+    ocurrencias = {}
+    leidos = 0
+    writer = _ChangeWriter(nombre, output_format)
+    try:
+        for df in chunks:
+            df = df.reset_index(drop=True)
+            if writer.columnas is None:
+                writer.columnas = list(df.columns) + ([] if key_columns else [HASH_COLUMN]) + [OP_COLUMN]
+            index = build_index(df, key_columns, ocurrencias)
+            partes_indice.append(index)
+            leidos += len(df)
+
+            hashes = index[HASH_COLUMN].to_numpy(dtype=np.uint64)
+            if previous is not None and len(previous):
+                posiciones = anterior.get_indexer(_lookup(index[keys]))
+                insertados = posiciones == -1
+                vistos[posiciones[~insertados]] = True
+                actualizados = ~insertados & (hashes_anteriores[np.where(insertados, 0, posiciones)] != hashes)
+            else:
+                insertados = np.ones(len(df), dtype=bool)
+                actualizados = np.zeros(len(df), dtype=bool)
+
+            # Enteros como nullable para que las filas 'D' (sin valores) no los conviertan a float
+            df = df.astype({c: 'Int64' for c in df.columns if pd.api.types.is_integer_dtype(df[c])})
+            filas_insertadas = df[insertados]
+            if not key_columns:
+                # Sin clave, cada fila lleva su hash (hex) y las eliminadas se identifican por él
+                filas_insertadas = filas_insertadas.assign(**{HASH_COLUMN: _hex(hashes[insertados])})
+            writer.write(pd.concat([filas_insertadas.assign(**{OP_COLUMN: 'I'}),
+                                    df[actualizados].assign(**{OP_COLUMN: 'U'})], ignore_index=True))
+            conteo['I'] += int(insertados.sum())
+            conteo['U'] += int(actualizados.sum())
+
+        if previous is not None and not vistos.all():
+            eliminados = previous.loc[~vistos, keys]
+            if not key_columns:
+                eliminados = pd.DataFrame({HASH_COLUMN: _hex(eliminados['_fila'].to_numpy(dtype=np.uint64))})
+            writer.write(eliminados.assign(**{OP_COLUMN: 'D'}))
+            conteo['D'] = len(eliminados)
+
+        index = pd.concat(partes_indice, ignore_index=True) if partes_indice else pd.DataFrame(
+            columns=keys + [HASH_COLUMN])
+        resultado = {
+            'registros': writer.registros,
+            'leidos': leidos,
+            'formato': output_format.upper(),
+            'modo': modo,
+            'insertados': conteo['I'],
+            'actualizados': conteo['U'],
+            'eliminados': conteo['D'],
+        }
+        print(f"✓ {nombre}: {resultado['insertados']} insertados, {resultado['actualizados']} actualizados, "
+              f"{resultado['eliminados']} eliminados de {leidos} registros", file=sys.stderr)
+
+        # Sin cambios no se sube archivo (en la primera ejecución se guarda el índice vacío)
+        if writer.registros == 0:
+            if modo == 'delta_inicial':
+                save_index(s3_uploader.storage, nombre, index)
+            resultado['url'] = None
+            return resultado
+
+        resultado['url'] = writer.upload(s3_uploader, nombre)
+    finally:
+        writer.close()
+    # El índice se guarda después de subir los cambios: si falla, se vuelven a emitir
+    save_index(s3_uploader.storage, nombre, index)
+    return resultado
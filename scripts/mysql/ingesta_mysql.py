@@ -1,112 +1,518 @@
 import os
 import sys
 import pandas as pd
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import Integer, create_engine, text, inspect
 from s3_uploader import S3Uploader
+from checkpoint import fingerprint
+from arrow_engine import export_table_arrow, open_record_batches, table_to_csv
+from spill import SpillBuffer, memory_budget_bytes
+from batching import AdaptiveBatchSizer, table_strategies
+from delta import delta_tables, export_delta
+from pushdown import apply_query, query_name, table_queries
+from sharding import (decode_bound, encode_bounds, excluded_tables, shard_config, shard_name,
+                      split_int_range, upload_manifest)
 import json
+import time
+from contextlib import contextmanager
 
 
-def get_mysql_connection():
-    """Establece conexión con MySQL"""
-    host = os.getenv("MYSQL_HOST")
-    port = int(os.getenv("MYSQL_PORT", 3306))
+def _build_engine(host, port):
+    """Crea un engine de SQLAlchemy para un host de MySQL"""
     user = os.getenv("MYSQL_USER")
     password = os.getenv("MYSQL_PASSWORD")
     database = os.getenv("MYSQL_DATABASE")
 
     mysql_url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
-    engine = create_engine(mysql_url)
-    return engine
+    return create_engine(mysql_url)
+
+
+def _parse_replica_hosts(value, default_port):
+    """Convierte "host1:3306,host2" en una lista de tuplas (host, puerto)"""
+    replicas = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(":")
+        replicas.append((host, int(port) if port else default_port))
+    return replicas
+
+
+def get_replica_lag(engine):
+    """
+    Retorna el retraso de replicación en segundos, o None si no se puede determinar
+    (réplica detenida, sin permisos o el host no es réplica).
+    """
+    with engine.connect() as conn:
+        try:
+            row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+            lag_column = 'Seconds_Behind_Source'
+        except Exception:
+            # MySQL < 8.0.22
+            row = conn.execute(text("SHOW SLAVE STATUS")).mappings().first()
+            lag_column = 'Seconds_Behind_Master'
+
+    if row is None or row.get(lag_column) is None:
+        return None
+    return int(row[lag_column])
+
+
+def get_mysql_connection():
+    """
+    Establece conexión con MySQL.
+
+    Si MYSQL_REPLICA_HOSTS está definido, usa la réplica con menor retraso por debajo
+    de MYSQL_MAX_REPLICA_LAG segundos; si ninguna califica, usa el primario.
+    """
+    host = os.getenv("MYSQL_HOST")
+    port = int(os.getenv("MYSQL_PORT", 3306))
+    max_lag = int(os.getenv("MYSQL_MAX_REPLICA_LAG", 30))
+
+    candidates = []
+    for replica_host, replica_port in _parse_replica_hosts(os.getenv("MYSQL_REPLICA_HOSTS"), port):
+        engine = _build_engine(replica_host, replica_port)
+        try:
+            lag = get_replica_lag(engine)
+        except Exception as e:
+            print(f"⚠ Réplica {replica_host}:{replica_port} no disponible: {str(e)}", file=sys.stderr)
+            lag = None
+
+        if lag is not None and lag <= max_lag:
+            candidates.append((lag, replica_host, replica_port, engine))
+        else:
+            engine.dispose()
+
+    if candidates:
+        candidates.sort(key=lambda c: c[0])
+        lag, replica_host, replica_port, engine = candidates[0]
+        for _, _, _, other in candidates[1:]:
+            other.dispose()
+        print(f"✓ Leyendo desde réplica {replica_host}:{replica_port} (retraso {lag}s)", file=sys.stderr)
+        return engine
+
+    print(f"✓ Leyendo desde primario {host}:{port}", file=sys.stderr)
+    return _build_engine(host, port)
+
+
+@contextmanager
+def snapshot_connection(engine):
+    """
+    Abre una conexión con una transacción REPEATABLE READ de solo lectura para que
+    todas las tablas de la ejecución se lean desde el mismo snapshot.
+    """
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        conn.execute(text("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY"))
+        try:
+            yield conn
+        finally:
+            conn.rollback()
 
 
-def table_exists(engine, table_name):
+def table_exists(conn, table_name):
     """Verifica si una tabla existe"""
-    inspector = inspect(engine)
+    inspector = inspect(conn)
     return table_name in inspector.get_table_names()
 
 
-def extract_productos(engine):
-    """Extrae datos de la tabla productos"""
-    if not table_exists(engine, 'productos'):
-        raise ValueError("La tabla 'productos' no existe en MySQL")
+# Tablas exportadas: nombre de salida -> especificación.
+# 'clave' es una columna única y ordenable (permite reanudar por rangos);
+# las tablas sin clave indican solo la columna de 'orden'.
+TABLAS = {
+    'productos': {'tabla': 'productos', 'columnas': '*', 'clave': 'id'},
+    'ofertas': {'tabla': 'ofertas', 'columnas': '*', 'clave': 'id'},
+    'ofertas_detalle': {'tabla': 'ofertas_detalle', 'columnas': '*', 'clave': 'id'},
+}
 
-    query = text("SELECT * FROM productos ORDER BY id")
-    df = pd.read_sql(query, engine)
-    return df
 
+def build_query(spec, where=None, limit=False):
+    """
+    Construye la consulta SELECT de una tabla.
+
+    Args:
+        spec: Especificación de la tabla (ver TABLAS)
+        where: Condición SQL opcional (con parámetros estilo %(nombre)s)
+        limit: Si es True agrega LIMIT %(limite)s
+    """
+    query = f"SELECT {spec['columnas']} FROM {spec['tabla']}"
+    if where:
+        query += f" WHERE {where}"
+    query += f" ORDER BY {spec.get('clave') or spec['orden']}"
+    if limit:
+        query += " LIMIT %(limite)s"
+    return query
 
-def extract_ofertas(engine):
-    """Extrae datos de la tabla ofertas"""
-    if not table_exists(engine, 'ofertas'):
-        raise ValueError("La tabla 'ofertas' no existe en MySQL")
 
-    query = text("SELECT * FROM ofertas ORDER BY id")
-    df = pd.read_sql(query, engine)
+def extract_table(conn, spec):
+    """Extrae una tabla como DataFrame de pandas"""
+    df = pd.read_sql(text(build_query(spec)), conn)
     return df
 
 
-def extract_ofertas_detalle(engine):
-    """Extrae datos de la tabla ofertas_detalle"""
-    if not table_exists(engine, 'ofertas_detalle'):
-        raise ValueError("La tabla 'ofertas_detalle' no existe en MySQL")
+def export_table(conn, nombre, spec, s3_uploader, extract_engine, output_format, estrategia=None):
+    """
+    Extrae y sube una tabla con el motor configurado.
 
-    query = text("SELECT * FROM ofertas_detalle ORDER BY id")
-    df = pd.read_sql(query, engine)
-    return df
+    Con el motor pandas, estrategia ('single' o 'chunked', del plan del gateway) fija
+    si la tabla se lee en una sola pasada o por lotes; sin ella se lee por lotes
+    cuando hay presupuesto de memoria.
+
+    Returns:
+        Tupla (url, registros)
+    """
+    if not table_exists(conn, spec['tabla']):
+        raise ValueError(f"La tabla '{spec['tabla']}' no existe en MySQL")
+
+    if os.getenv("RESUMABLE_UPLOADS", "0") == "1" and spec.get('clave') and output_format == 'csv':
+        return export_table_resumable(conn, nombre, spec, s3_uploader)
+
+    if extract_engine == 'arrow':
+        return export_table_arrow(conn, nombre, build_query(spec), s3_uploader, output_format)
+
+    por_lotes = memory_budget_bytes() is not None if estrategia is None else estrategia == 'chunked'
+    if por_lotes:
+        if output_format != 'csv':
+            # Parquet por lotes requiere un esquema estable: se usa el motor Arrow
+            return export_table_arrow(conn, nombre, build_query(spec), s3_uploader, output_format)
+        return export_table_chunked(conn, nombre, spec, s3_uploader)
+
+    df = extract_table(conn, spec)
+    url = s3_uploader.upload_dataframe(df, nombre, nombre, output_format)
+    return url, len(df)
+
+
+def export_table_delta(conn, nombre, spec, s3_uploader, output_format):
+    """
+    Exporta solo los cambios de una tabla desde la ejecución anterior (hash por fila).
+
+    Returns:
+        Diccionario con url, registros, modo y conteo de cambios
+    """
+    if not table_exists(conn, spec['tabla']):
+        raise ValueError(f"La tabla '{spec['tabla']}' no existe en MySQL")
+
+    key_columns = [spec['clave']] if spec.get('clave') else None
+    # Con presupuesto de memoria la tabla se compara por lotes, sin cargarla completa
+    if memory_budget_bytes() is not None:
+        chunks = read_table_chunks(conn, nombre, spec)
+    else:
+        chunks = [extract_table(conn, spec)]
+    return export_delta(chunks, nombre, key_columns, s3_uploader, output_format)
+
+
+def export_table_query(conn, nombre, spec, consulta, s3_uploader, output_format):
+    """
+    Exporta una tabla con las columnas y filtros pedidos al gateway (TABLE_QUERIES).
+    La condición se resuelve en MySQL con parámetros, por eso se usa el motor Arrow.
+    El archivo se sube como <tabla>_consulta para no confundirlo con un snapshot completo.
+
+    Returns:
+        Tupla (url, registros)
+    """
+    if not table_exists(conn, spec['tabla']):
+        raise ValueError(f"La tabla '{spec['tabla']}' no existe en MySQL")
+
+    spec, where, params = apply_query(conn, nombre, spec, consulta)
+    return export_table_arrow(conn, query_name(nombre), build_query(spec, where=where), s3_uploader,
+                              output_format, params=params or None, folder=nombre)
+
+
+def read_table_chunks(conn, nombre, spec):
+    """
+    Lee una tabla por lotes con un cursor de servidor, como DataFrames de pandas.
+    El tamaño de cada lote se ajusta según los bytes por fila y el RSS observados.
+    """
+    sizer = AdaptiveBatchSizer(nombre)
+    result = conn.execution_options(stream_results=True).execute(text(build_query(spec)))
+    columnas = list(result.keys())
+    while True:
+        sizer.start()
+        rows = result.fetchmany(sizer.size)
+        if not rows:
+            break
+        chunk = pd.DataFrame.from_records(rows, columns=columnas)
+        sizer.observe(len(rows), int(chunk.memory_usage(deep=True).sum()))
+        yield chunk
+    sizer.log_summary()
+
+
+def export_table_chunked(conn, nombre, spec, s3_uploader):
+    """
+    Extrae una tabla por lotes con un cursor de servidor y la escribe como CSV en un
+    buffer que se vuelca a disco al superar MEMORY_BUDGET_MB. El tamaño de cada lote
+    se ajusta según los bytes por fila y el RSS observados (ver AdaptiveBatchSizer).
+
+    Returns:
+        Tupla (url, registros)
+    """
+    sizer = AdaptiveBatchSizer(nombre)
+    stream_conn = conn.execution_options(stream_results=True)
+
+    registros = 0
+    with SpillBuffer(nombre) as buffer:
+        result = stream_conn.execute(text(build_query(spec)))
+        columnas = list(result.keys())
+        # Encabezado aparte: una tabla vacía también queda como CSV con sus columnas
+        buffer.write(pd.DataFrame(columns=columnas).to_csv(index=False).encode('utf-8'))
+        while True:
+            sizer.start()
+            rows = result.fetchmany(sizer.size)
+            if not rows:
+                break
+            chunk = pd.DataFrame.from_records(rows, columns=columnas)
+            data = chunk.to_csv(index=False, header=False).encode('utf-8')
+            buffer.write(data)
+            registros += len(rows)
+            sizer.observe(len(rows), len(data))
+        sizer.log_summary()
+
+        url = s3_uploader.upload_fileobj(buffer.fileobj(), nombre, nombre, 'csv', 'text/csv')
+    return url, registros
+
+
+def export_table_resumable(conn, nombre, spec, s3_uploader):
+    """
+    Extrae una tabla por páginas de clave (WHERE clave > última) y la sube como CSV
+    multiparte con checkpoint. Si una ejecución anterior quedó a medias, continúa
+    desde la última clave confirmada en S3 reutilizando las partes ya subidas.
+
+    Returns:
+        Tupla (url, registros)
+    """
+    sizer = AdaptiveBatchSizer(nombre)
+    clave = spec['clave']
+
+    # Con columnas '*' la consulta no cambia si la tabla cambia: se incluyen las columnas reales
+    columnas = [column['name'] for column in inspect(conn).get_columns(spec['tabla'])]
+    huella = fingerprint(spec, build_query(spec), columnas)
+    upload = s3_uploader.resumable_upload(nombre, nombre, 'csv', 'text/csv', fingerprint=huella).start()
+    ultimo = upload.last_key
+
+    while True:
+        where = f"{clave} > %(ultimo)s" if ultimo is not None else None
+        query = build_query(spec, where=where, limit=True)
+        page_rows = sizer.size
+        sizer.start()
+        with open_record_batches(conn, query, {'ultimo': ultimo, 'limite': page_rows}) as reader:
+            pagina = reader.read_all()
+        sizer.observe(pagina.num_rows, pagina.nbytes)
+
+        if pagina.num_rows == 0:
+            if upload.needs_header:
+                upload.write(table_to_csv(pagina, include_header=True), ultimo, 0)
+            break
+
+        ultimo = pagina.column(clave)[-1].as_py()
+        upload.write(table_to_csv(pagina, include_header=upload.needs_header), ultimo, pagina.num_rows)
+        if pagina.num_rows < page_rows:
+            break
+
+    sizer.log_summary()
+    url = upload.complete()
+    s3_uploader.record_bytes(nombre, upload.bytes)
+    return url, upload.registros
+
+
+def _integer_key(inspector, spec):
+    """True si la tabla tiene clave entera (se puede repartir en shards por rango)"""
+    clave = spec.get('clave')
+    if not clave:
+        return False
+    tipos = {column['name']: column['type'] for column in inspector.get_columns(spec['tabla'])}
+    return isinstance(tipos.get(clave), Integer)
+
+
+def catalog_stats(conn):
+    """
+    Estadísticas de catálogo de las tablas exportadas, sin leer sus filas. Filas y
+    bytes salen de information_schema.TABLES (estimados por InnoDB).
+
+    Returns:
+        Diccionario {tabla: {'filas', 'bytes', 'bytes_datos', 'divisible'}}
+    """
+    catalogo = {
+        tabla: (filas, datos, indices)
+        for tabla, filas, datos, indices in conn.execute(text(
+            "SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH "
+            "FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"
+        ))
+    }
+    inspector = inspect(conn)
+
+    stats = {}
+    for nombre, spec in TABLAS.items():
+        if spec['tabla'] not in catalogo:
+            stats[nombre] = {'error': f"La tabla '{spec['tabla']}' no existe en MySQL"}
+            continue
+        filas, datos, indices = catalogo[spec['tabla']]
+        stats[nombre] = {
+            'filas': filas,
+            'bytes': (datos or 0) + (indices or 0),
+            'bytes_datos': datos,
+            'divisible': _integer_key(inspector, spec),
+        }
+    return stats
+
+
+def plan_shards(conn, nombre, spec, count):
+    """
+    Calcula rangos contiguos de clave para repartir una tabla entre varios contenedores.
+
+    Returns:
+        Diccionario {'shards': [{'lower', 'upper'}]} con límites serializados
+    """
+    clave = spec.get('clave')
+    if not clave:
+        raise ValueError(f"La tabla '{nombre}' no tiene clave para dividirla en shards")
+
+    minimo, maximo = conn.execute(text(f"SELECT MIN({clave}), MAX({clave}) FROM {spec['tabla']}")).one()
+    if minimo is not None and not isinstance(minimo, int):
+        raise ValueError(f"La clave '{clave}' de '{nombre}' no es entera, no se puede dividir en rangos")
+
+    bounds = split_int_range(minimo, maximo, count)
+    print(f"✓ {nombre}: {len(bounds)} shards entre {minimo} y {maximo}", file=sys.stderr)
+    return {'shards': encode_bounds(bounds)}
+
+
+def export_shard(conn, nombre, spec, s3_uploader, shard, output_format):
+    """
+    Exporta el rango [lower, upper) de clave de una tabla como una parte propia.
+    Se usa el motor Arrow, que acepta la consulta con parámetros.
+
+    Returns:
+        Tupla (url, registros)
+    """
+    clave = spec['clave']
+    condiciones, params = [], {}
+    lower, upper = decode_bound(shard['lower']), decode_bound(shard['upper'])
+    if lower is not None:
+        condiciones.append(f"{clave} >= %(shard_lower)s")
+        params['shard_lower'] = lower
+    if upper is not None:
+        condiciones.append(f"{clave} < %(shard_upper)s")
+        params['shard_upper'] = upper
+
+    query = build_query(spec, where=" AND ".join(condiciones) or None)
+    return export_table_arrow(conn, shard_name(nombre, shard['index']), query, s3_uploader,
+                              output_format, params=params or None, folder=nombre)
+
+
+def run_shard(shard):
+    """
+    Ejecuta el contenedor en modo shard (plan, export o manifest) para SHARD_TABLE.
+
+    Returns:
+        Resultado a imprimir para el orquestador
+    """
+    nombre = shard['table']
+    if shard['mode'] == 'manifest':
+        return upload_manifest(S3Uploader(), nombre)
+
+    spec = TABLAS.get(nombre)
+    if spec is None:
+        raise ValueError(f"Tabla de shard desconocida: {nombre}")
+
+    engine = get_mysql_connection()
+    try:
+        with snapshot_connection(engine) as conn:
+            if not table_exists(conn, spec['tabla']):
+                raise ValueError(f"La tabla '{spec['tabla']}' no existe en MySQL")
+            if shard['mode'] == 'plan':
+                return plan_shards(conn, nombre, spec, shard['count'])
+
+            inicio = time.perf_counter()
+            s3_uploader = S3Uploader()
+            output_format = os.getenv("OUTPUT_FORMAT", "csv").lower()
+            url, registros = export_shard(conn, nombre, spec, s3_uploader, shard, output_format)
+            return {
+                nombre: {
+                    'url': url,
+                    'registros': registros,
+                    'formato': output_format.upper(),
+                    'shard': shard['index'],
+                    'bytes': s3_uploader.uploaded_bytes.get(nombre, 0),
+                    'duracion_s': round(time.perf_counter() - inicio, 3)
+                }
+            }
+    finally:
+        engine.dispose()
 
 
 def main():
     """Función principal"""
     try:
-        # Conectar a MySQL
+        # Contenedor lanzado como shard de una tabla grande
+        shard = shard_config()
+        if shard is not None:
+            print(json.dumps(run_shard(shard)))
+            sys.exit(0)
+
+        # Conectar a MySQL (réplica si está disponible)
         engine = get_mysql_connection()
 
+        # Contenedor lanzado por el planificador: solo estadísticas de catálogo
+        if os.getenv("CATALOG_STATS", "0") == "1":
+            with engine.connect() as conn:
+                stats = catalog_stats(conn)
+            engine.dispose()
+            print(json.dumps({'tablas': stats}))
+            sys.exit(0)
+
         # Inicializar uploader S3
         s3_uploader = S3Uploader()
 
         resultados = {}
 
-        # Extraer y subir productos
-        try:
-            df_productos = extract_productos(engine)
-            url_productos = s3_uploader.upload_dataframe(df_productos, 'productos', 'productos')
-            resultados['productos'] = {
-                'url': url_productos,
-                'registros': len(df_productos),
-                'formato': 'CSV'
-            }
-        except Exception as e:
-            resultados['productos'] = {
-                'error': str(e)
+        # Motor de extracción: 'arrow' (columnar) o 'pandas'
+        extract_engine = os.getenv("SQL_EXTRACT_ENGINE", "arrow").lower()
+        output_format = os.getenv("OUTPUT_FORMAT", "csv").lower()
+        # Tablas sin marca de actualización: se exportan solo los cambios por hash de fila
+        tablas_delta = delta_tables()
+        # Tablas repartidas en contenedores shard aparte
+        tablas_excluidas = excluded_tables()
+        # Estrategia de lectura por tabla según el plan del gateway
+        estrategias = table_strategies()
+        # Columnas y filtros por tabla: solo se exportan esas tablas
+        consultas = table_queries()
+        for tabla in consultas.keys() - TABLAS.keys():
+            resultados[tabla] = {
+                'error': f"Tabla desconocida: {tabla}"
             }
 
-        # Extraer y subir ofertas
-        try:
-            df_ofertas = extract_ofertas(engine)
-            url_ofertas = s3_uploader.upload_dataframe(df_ofertas, 'ofertas', 'ofertas')
-            resultados['ofertas'] = {
-                'url': url_ofertas,
-                'registros': len(df_ofertas),
-                'formato': 'CSV'
-            }
-        except Exception as e:
-            resultados['ofertas'] = {
-                'error': str(e)
-            }
-
-        # Extraer y subir ofertas_detalle
-        try:
-            df_ofertas_detalle = extract_ofertas_detalle(engine)
-            url_ofertas_detalle = s3_uploader.upload_dataframe(df_ofertas_detalle, 'ofertas_detalle', 'ofertas_detalle')
-            resultados['ofertas_detalle'] = {
-                'url': url_ofertas_detalle,
-                'registros': len(df_ofertas_detalle),
-                'formato': 'CSV'
-            }
-        except Exception as e:
-            resultados['ofertas_detalle'] = {
-                'error': str(e)
-            }
+        # Todas las tablas se leen desde el mismo snapshot
+        with snapshot_connection(engine) as conn:
+            for tabla, spec in TABLAS.items():
+                if tabla in tablas_excluidas or (consultas and tabla not in consultas):
+                    continue
+                inicio = time.perf_counter()
+                try:
+                    if tabla in consultas:
+                        url, registros = export_table_query(conn, tabla, spec, consultas[tabla], s3_uploader,
+                                                            output_format)
+                        resultados[tabla] = {
+                            'url': url,
+                            'registros': registros,
+                            'formato': output_format.upper(),
+                            'consulta': True
+                        }
+                    elif tabla in tablas_delta:
+                        resultados[tabla] = export_table_delta(conn, tabla, spec, s3_uploader, output_format)
+                    else:
+                        url, registros = export_table(conn, tabla, spec, s3_uploader, extract_engine,
+                                                      output_format, estrategias.get(tabla, {}).get('strategy'))
+                        resultados[tabla] = {
+                            'url': url,
+                            'registros': registros,
+                            'formato': output_format.upper()
+                        }
+                    resultados[tabla].update({
+                        'bytes': (s3_uploader.uploaded_bytes.get(tabla, 0)
+                                  + s3_uploader.uploaded_bytes.get(f"{tabla}_delta", 0)),
+                        'duracion_s': round(time.perf_counter() - inicio, 3)
+                    })
+                except Exception as e:
+                    resultados[tabla] = {
+                        'error': str(e)
+                    }
 
         # Cerrar conexión
         engine.dispose()
@@ -0,0 +1,134 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+NUMERIC_OID = 1700
+
+# OID de tipos de PostgreSQL -> tipo Arrow. Los no listados se leen como texto;
+# numeric se resuelve con su precisión y escala (ver _arrow_type).
+PG_TYPES = {
+    16: pa.bool_(),              # bool
+    20: pa.int64(),              # int8
+    21: pa.int16(),              # int2
+    23: pa.int32(),              # int4
+    700: pa.float32(),           # float4
+    701: pa.float64(),           # float8
+    1082: pa.date32(),           # date
+    1114: pa.timestamp('us'),    # timestamp
+    1184: pa.timestamp('us', tz='UTC'),  # timestamptz
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _arrow_type(column):
+    """Tipo Arrow para una columna de cursor.description"""
+    if column.type_code == NUMERIC_OID:
+        # Decimal exacto como en MySQL; numeric sin precisión declarada (o mayor a 38
+        # dígitos) se conserva como texto para no perder dígitos
+        if column.precision and column.scale is not None and column.precision <= 38:
+            return pa.decimal128(column.precision, column.scale)
+        return pa.string()
+    return PG_TYPES.get(column.type_code, pa.string())
+
+
+def _query_schema(cursor, query):
+    """Obtiene nombres y tipos Arrow de las columnas de la consulta sin leer filas"""
+    cursor.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+    return {column.name: _arrow_type(column) for column in cursor.description}
+
+
+@contextmanager
+def open_record_batches(conn, query, params=None, block_size=8 * 1024 * 1024):
+    """
+    Abre el resultado de una consulta como un lector de RecordBatches de Arrow.
+
+    Usa COPY ... TO STDOUT sobre la misma conexión (y por lo tanto el mismo snapshot)
+    y el lector CSV multihilo de Arrow, sin crear objetos Python por celda.
+
+    Args:
+        conn: Conexión de SQLAlchemy
+        query: Consulta SQL
+        params: Parámetros de la consulta (opcional)
+        block_size: Bytes de CSV por RecordBatch
+
+    Yields:
+        Lector iterable de RecordBatches con atributo .schema
+    """
+    dbapi_conn = conn.connection.dbapi_connection
+    with dbapi_conn.cursor() as cursor, tempfile.TemporaryFile(dir=os.getenv("SPILL_DIR") or None) as raw:
+        sql = cursor.mogrify(query, params).decode('utf-8') if params else query
+        column_types = _query_schema(cursor, sql)
+
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", raw)
+        raw.seek(0)
+
+        yield pa_csv.open_csv(
+            raw,
+            read_options=pa_csv.ReadOptions(block_size=block_size),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=column_types,
+                true_values=['t'],
+                false_values=['f'],
+                # COPY escribe NULL como campo vacío sin comillas y '' como "";
+                # sin null_values propios, Arrow tomaría "NA", "null", "nan"... como nulos
+                null_values=[''],
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+
+
+def write_batches(reader, path, output_format):
+    """
+    Escribe los RecordBatches de un lector en un archivo CSV o Parquet.
+    Si no hay filas se escribe un archivo con solo el esquema.
+
+    Returns:
+        Número de registros escritos
+    """
+    if output_format == 'parquet':
+        writer = pq.ParquetWriter(path, reader.schema, compression='snappy')
+    else:
+        writer = pa_csv.CSVWriter(path, reader.schema)
+
+    registros = 0
+    with writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            registros += batch.num_rows
+    return registros
+
+
+def table_to_csv(table, include_header=True) -> bytes:
+    """Serializa una tabla de Arrow como CSV en memoria"""
+    sink = pa.BufferOutputStream()
+    pa_csv.write_csv(table, sink, write_options=pa_csv.WriteOptions(include_header=include_header))
+    return sink.getvalue().to_pybytes()
+
+
+def export_table_arrow(conn, table_name, query, s3_uploader, output_format='csv', params=None, folder=None):
+    """
+    Exporta una consulta a S3 pasando solo por Arrow (sin DataFrames de pandas).
+    folder indica la carpeta de destino si difiere del nombre del archivo (ej. shards).
+
+    Returns:
+        Tupla (url, registros)
+    """
+    with tempfile.TemporaryDirectory(dir=os.getenv("SPILL_DIR") or None) as tmp_dir:
+        path = os.path.join(tmp_dir, f"{table_name}.{output_format}")
+        with open_record_batches(conn, query, params) as reader:
+            registros = write_batches(reader, path, output_format)
+
+        print(f"✓ {table_name}: {registros} registros extraídos con Arrow ({output_format})", file=sys.stderr)
+        url = s3_uploader.upload_file(path, folder or table_name, table_name, output_format,
+                                      CONTENT_TYPES[output_format])
+    return url, registros
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# S3 exige al menos 5 MB por parte (excepto la última)
+MIN_PART_SIZE = 5 * 1024 * 1024
+CHECKPOINT_PREFIX = "_checkpoints"
+
+
+def fingerprint(*partes) -> str:
+    """Huella de lo que define el contenido de una subida (especificación, consulta, columnas)"""
+    payload = json.dumps(partes, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+class ResumableUpload:
+    """
+    Subida multiparte con checkpoint persistido en el propio almacenamiento.
+
+    Cada parte enviada se registra junto con la última clave leída de la tabla, de modo
+    que si la subida o el contenedor fallan, la siguiente ejecución continúa desde esa
+    clave reutilizando las partes ya enviadas en lugar de volver a leer la tabla.
+
+    El checkpoint guarda la huella de la consulta que produjo las partes: si la
+    especificación, la consulta o las columnas de la tabla cambiaron, se descarta en
+    lugar de mezclar en un mismo archivo filas con formas distintas.
+    """
+
+    def __init__(self, storage, database_name, table_name, extension, content_type,
+                 part_size=None, max_age_hours=None, fingerprint=None):
+        self.storage = storage
+        self.database_name = database_name
+        self.table_name = table_name
+        self.extension = extension
+        self.content_type = content_type
+        part_size_mb = int(os.getenv("UPLOAD_PART_SIZE_MB", 16))
+        self.part_size = max(part_size or part_size_mb * 1024 * 1024, MIN_PART_SIZE)
+        self.max_age = timedelta(hours=max_age_hours or float(os.getenv("CHECKPOINT_MAX_AGE_HOURS", 24)))
+        self.checkpoint_key = f"{CHECKPOINT_PREFIX}/{database_name}/{table_name}.json"
+        self.fingerprint = fingerprint
+
+        self.state = None
+        self._buffer = bytearray()
+        self._pending_key = None
+        self._pending_registros = 0
+
+    @property
+    def last_key(self):
+        """Última clave de la tabla cuyo contenido ya está en S3 (None si empieza de cero)"""
+        return self.state['last_key']
+
+    @property
+    def registros(self):
+        """Registros ya subidos"""
+        return self.state['registros']
+
+    @property
+    def bytes(self):
+        """Bytes ya subidos"""
+        return self.state.get('bytes', 0)
+
+    @property
+    def needs_header(self):
+        """True si aún no se subió ninguna parte (el encabezado CSV va en la primera)"""
+        return not self.state['parts'] and not self._buffer
+
+    def start(self):
+        """Retoma la subida pendiente si sigue siendo válida, o inicia una nueva"""
+        self.abort_stale_uploads()
+
+        checkpoint = self._load_checkpoint()
+        if checkpoint and self._is_resumable(checkpoint):
+            self.state = checkpoint
+            print(f"↻ {self.table_name}: retomando subida desde clave {self.last_key} "
+                  f"({len(self.state['parts'])} partes, {self.registros} registros)", file=sys.stderr)
+            return self
+
+        if checkpoint:
+            self._abort(checkpoint['key'], checkpoint['upload_id'])
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        s3_key = f"{self.database_name}/{self.table_name}_{timestamp}.{self.extension}"
+        self.state = {
+            'key': s3_key,
+            'upload_id': self.storage.create_multipart(s3_key, self.content_type),
+            'parts': [],
+            'last_key': None,
+            'registros': 0,
+            'bytes': 0,
+            'fingerprint': self.fingerprint,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        }
+        self._save_checkpoint()
+        return self
+
+    def write(self, data: bytes, last_key, registros: int):
+        """
+        Agrega datos al buffer de la parte actual.
+
+        Args:
+            data: Bytes a subir
+            last_key: Última clave de la tabla incluida en data
+            registros: Registros incluidos en data
+        """
+        self._buffer.extend(data)
+        self._pending_key = last_key
+        self._pending_registros += registros
+        if len(self._buffer) >= self.part_size:
+            self._flush()
+
+    def _flush(self):
+        """Sube el buffer como una parte y actualiza el checkpoint"""
+        if not self._buffer:
+            return
+
+        part_number = len(self.state['parts']) + 1
+        etag = self.storage.upload_part(self.state['key'], self.state['upload_id'], part_number, bytes(self._buffer))
+        self.state['parts'].append({'PartNumber': part_number, 'ETag': etag})
+        self.state['last_key'] = self._pending_key
+        self.state['registros'] += self._pending_registros
+        self.state['bytes'] = self.bytes + len(self._buffer)
+        self._buffer = bytearray()
+        self._pending_registros = 0
+        self._save_checkpoint()
+
+    def complete(self) -> str:
+        """Envía la última parte, cierra la subida y elimina el checkpoint"""
+        self._flush()
+        if not self.state['parts']:
+            # Sin datos: S3 no permite completar una subida sin partes
+            etag = self.storage.upload_part(self.state['key'], self.state['upload_id'], 1, b'')
+            self.state['parts'].append({'PartNumber': 1, 'ETag': etag})
+
+        self.storage.complete_multipart(self.state['key'], self.state['upload_id'], self.state['parts'])
+        self.storage.delete(self.checkpoint_key)
+        print(f"✓ Archivo subido exitosamente: {self.state['key']}", file=sys.stderr)
+        return self.storage.url(self.state['key'])
+
+    def _load_checkpoint(self):
+        data = self.storage.get_bytes(self.checkpoint_key)
+        return json.loads(data) if data is not None else None
+
+    def _save_checkpoint(self):
+        self.storage.put_bytes(self.checkpoint_key, json.dumps(self.state, default=str).encode('utf-8'),
+                               'application/json')
+
+    def _is_resumable(self, checkpoint) -> bool:
+        """
+        Una subida se puede retomar si corresponde a la misma consulta, no expiró y el
+        almacenamiento aún conserva sus partes
+        """
+        if checkpoint.get('fingerprint') != self.fingerprint:
+            print(f"⚠ {self.table_name}: la consulta o las columnas cambiaron desde el checkpoint, "
+                  f"se descarta la subida pendiente", file=sys.stderr)
+            return False
+        created_at = datetime.fromisoformat(checkpoint['created_at'])
+        if datetime.now(timezone.utc) - created_at > self.max_age:
+            return False
+        try:
+            parts = self.storage.list_parts(checkpoint['key'], checkpoint['upload_id'])
+        except Exception:
+            return False
+        uploaded = {part['PartNumber'] for part in parts}
+        return all(part['PartNumber'] in uploaded for part in checkpoint['parts'])
+
+    def _abort(self, key, upload_id):
+        try:
+            self.storage.abort_multipart(key, upload_id)
+            print(f"✗ Subida abandonada eliminada: {key}", file=sys.stderr)
+        except Exception:
+            pass
+
+    def abort_stale_uploads(self):
+        """Aborta subidas multiparte de esta tabla más antiguas que CHECKPOINT_MAX_AGE_HOURS"""
+        prefix = f"{self.database_name}/{self.table_name}_"
+        limite = datetime.now(timezone.utc) - self.max_age
+        for upload in self.storage.list_multipart_uploads(prefix):
+            if upload['Initiated'] < limite:
+                self._abort(upload['Key'], upload['UploadId'])
@@ -0,0 +1,157 @@
+import os
+import sys
+import tempfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from sqlalchemy import inspect
+
+from arrow_engine import CONTENT_TYPES, open_record_batches
+
+TABLAS_ORIGEN = ('compras', 'compra_productos', 'compra_cantidades')
+
+
+def _value_columns(inspector, table_name, order_column):
+    """Columnas de una tabla de colección distintas de compra_id y de la columna de orden"""
+    return [c['name'] for c in inspector.get_columns(table_name) if c['name'] not in ('compra_id', order_column)]
+
+
+def _aliases(columnas, prefijo, usados):
+    """Nombre de salida de cada columna; las que ya están en usados llevan prefijo. Actualiza usados."""
+    alias = {}
+    for columna in columnas:
+        nombre = columna if columna not in usados else f"{prefijo}_{columna}"
+        if nombre in usados:
+            raise ValueError(f"compras_detalle: la columna {columna} repite el nombre {nombre}")
+        alias[columna] = nombre
+        usados.add(nombre)
+    return alias
+
+
+def _select(tabla, columna, alias):
+    return f'{tabla}."{columna}"' if columna == alias else f'{tabla}."{columna}" AS "{alias}"'
+
+
+def build_compras_detalle_query(conn, order_column):
+    """
+    Construye el JOIN que PostgreSQL ejecuta para armar una fila por línea de compra.
+
+    Cada producto se empareja con su cantidad por posición dentro de la misma compra,
+    numerando ambas listas por order_column (una columna que exista en compra_productos
+    y compra_cantidades y refleje el orden de inserción, p. ej. un id serial). No se
+    usa ctid: es la ubicación física de la fila y cambia con UPDATE, VACUUM FULL o
+    CLUSTER, lo que emparejaría mal las filas sin ningún error.
+
+    Returns:
+        Tupla (consulta, columna de producto, columna de cantidad)
+    """
+    if not order_column:
+        raise ValueError("compras_detalle requiere COMPRAS_DETALLE_ORDER_COLUMN (columna de orden "
+                         "de compra_productos y compra_cantidades)")
+
+    inspector = inspect(conn)
+    faltantes = [t for t in TABLAS_ORIGEN if t not in inspector.get_table_names()]
+    if faltantes:
+        raise ValueError(f"Tablas requeridas no existen en PostgreSQL: {', '.join(faltantes)}")
+    for tabla in ('compra_productos', 'compra_cantidades'):
+        if order_column not in [c['name'] for c in inspector.get_columns(tabla)]:
+            raise ValueError(f"La columna de orden {order_column} no existe en {tabla}")
+
+    columnas_producto = _value_columns(inspector, 'compra_productos', order_column)
+    columnas_cantidad = _value_columns(inspector, 'compra_cantidades', order_column)
+    for tabla, columnas in (('compra_productos', columnas_producto), ('compra_cantidades', columnas_cantidad)):
+        if not columnas:
+            raise ValueError(f"{tabla} no tiene columnas además de compra_id y {order_column}")
+
+    # Cada columna de salida tiene un nombre único: las de producto o cantidad que
+    # repiten una columna de compras (o linea, o una anterior) llevan prefijo
+    usados = {c['name'] for c in inspector.get_columns('compras')} | {'linea'}
+    alias_producto = _aliases(columnas_producto, 'producto', usados)
+    alias_cantidad = _aliases(columnas_cantidad, 'cantidad', usados)
+    select_producto = ", ".join(_select('p', c, alias_producto[c]) for c in columnas_producto)
+    select_cantidad = ", ".join(_select('q', c, alias_cantidad[c]) for c in columnas_cantidad)
+
+    query = f"""
+        SELECT c.*, p.linea, {select_producto}, {select_cantidad}
+        FROM compras c
+        JOIN (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY compra_id ORDER BY "{order_column}") AS linea
+            FROM compra_productos
+        ) p ON p.compra_id = c.id
+        LEFT JOIN (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY compra_id ORDER BY "{order_column}") AS linea
+            FROM compra_cantidades
+        ) q ON q.compra_id = p.compra_id AND q.linea = p.linea
+        ORDER BY c.id, p.linea
+    """
+    columna_producto = alias_producto[columnas_producto[0]] if len(columnas_producto) == 1 else None
+    columna_cantidad = alias_cantidad[columnas_cantidad[0]] if len(columnas_cantidad) == 1 else None
+    return query, columna_producto, columna_cantidad
+
+
+def _read_table(path):
+    """Lee un export previo (CSV o Parquet) como tabla de Arrow"""
+    if path.endswith('.parquet'):
+        return pq.read_table(path)
+    return pa_csv.read_csv(path)
+
+
+def enrich_with_prices(detalle, productos, columna_producto, columna_cantidad):
+    """
+    Agrega nombre y precio de productos (export de MySQL) y el subtotal de cada línea,
+    con un join vectorizado de Arrow.
+    """
+    columnas = [c for c in ('id', 'nombre', 'precio') if c in productos.column_names]
+    productos = productos.select(columnas).rename_columns(
+        ['producto_ref'] + [f"producto_{c}" for c in columnas[1:]]
+    )
+    # Alinear tipos de la clave de join (el CSV puede inferir otro tipo entero)
+    productos = productos.set_column(
+        0, 'producto_ref', productos.column('producto_ref').cast(detalle.schema.field(columna_producto).type)
+    )
+
+    detalle = detalle.join(productos, keys=columna_producto, right_keys='producto_ref', join_type='left outer')
+    if 'producto_precio' in detalle.column_names and columna_cantidad:
+        subtotal = pc.multiply(pc.cast(detalle.column('producto_precio'), pa.float64()),
+                               pc.cast(detalle.column(columna_cantidad), pa.float64()))
+        detalle = detalle.append_column('subtotal', subtotal)
+    return detalle.sort_by([('id', 'ascending'), ('linea', 'ascending')])
+
+
+def export_compras_detalle(conn, s3_uploader, order_column, enrich=False):
+    """
+    Genera el dataset derivado compras_detalle (una fila por producto comprado) en
+    Parquet dentro del mismo snapshot que las tablas de origen.
+
+    Args:
+        conn: Conexión del snapshot
+        s3_uploader: Uploader S3
+        order_column: Columna que ordena las líneas de cada compra en ambas tablas
+        enrich: Si es True agrega precios del último export de productos (MySQL)
+
+    Returns:
+        Tupla (url, registros)
+    """
+    query, columna_producto, columna_cantidad = build_compras_detalle_query(conn, order_column)
+
+    with open_record_batches(conn, query) as reader:
+        detalle = reader.read_all()
+
+    with tempfile.TemporaryDirectory(dir=os.getenv("SPILL_DIR") or None) as tmp_dir:
+        if enrich:
+            productos_path = s3_uploader.download_latest('productos', 'productos', tmp_dir)
+            if productos_path is None or columna_producto is None:
+                print("⚠ compras_detalle: sin export de productos o columna de producto ambigua, "
+                      "se omiten precios", file=sys.stderr)
+            else:
+                detalle = enrich_with_prices(detalle, _read_table(productos_path),
+                                             columna_producto, columna_cantidad)
+
+        path = os.path.join(tmp_dir, 'compras_detalle.parquet')
+        pq.write_table(detalle, path, compression='snappy')
+        print(f"✓ compras_detalle: {detalle.num_rows} líneas", file=sys.stderr)
+        url = s3_uploader.upload_file(path, 'compras_detalle', 'compras_detalle', 'parquet',
+                                      CONTENT_TYPES['parquet'])
+    return url, detalle.num_rows
@@ -0,0 +1,91 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import inspect
+
+# Operadores de comparación con su equivalente SQL
+SQL_OPERATORS = {'eq': '=', 'ne': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+def table_queries():
+    """
+    Columnas y filtros por tabla enviados por el gateway (TABLE_QUERIES, JSON).
+    Con consultas solo se exportan esas tablas; sin ellas, todas las tablas completas.
+    """
+    value = os.getenv("TABLE_QUERIES")
+    return json.loads(value) if value else {}
+
+
+def query_name(nombre):
+    """Nombre de archivo de un export filtrado, para no confundirlo con un snapshot completo"""
+    return f"{nombre}_consulta"
+
+
+def exported_columns(conn, spec):
+    """Columnas que exporta la tabla: las de la especificación o todas si es '*'"""
+    if spec['columnas'].strip() == '*':
+        return [column['name'] for column in inspect(conn).get_columns(spec['tabla'])]
+    return [column.strip() for column in spec['columnas'].split(',')]
+
+
+def _check_column(columna, permitidas, nombre):
+    # Los nombres se validan contra las columnas exportadas antes de entrar al SQL
+    if columna not in permitidas:
+        raise ValueError(f"La columna '{columna}' no se exporta en '{nombre}'")
+
+
+def build_where(filtros, permitidas, nombre):
+    """
+    Traduce los filtros de una tabla a una condición SQL con parámetros %(nombre)s.
+
+    Returns:
+        Tupla (condición o None, parámetros)
+    """
+    condiciones, params = [], {}
+    for i, filtro in enumerate(filtros):
+        columna, op, valor = filtro['column'], filtro['op'], filtro.get('value')
+        _check_column(columna, permitidas, nombre)
+        param = f"f{i}"
+
+        if op in ('eq', 'ne') and valor is None:
+            condiciones.append(f"{columna} IS {'NOT ' if op == 'ne' else ''}NULL")
+        elif op in SQL_OPERATORS:
+            condiciones.append(f"{columna} {SQL_OPERATORS[op]} %({param})s")
+            params[param] = valor
+        elif op == 'in':
+            marcadores = []
+            for j, item in enumerate(valor):
+                params[f"{param}_{j}"] = item
+                marcadores.append(f"%({param}_{j})s")
+            condiciones.append(f"{columna} IN ({', '.join(marcadores)})")
+        elif op == 'between':
+            condiciones.append(f"{columna} BETWEEN %({param}_desde)s AND %({param}_hasta)s")
+            params[f"{param}_desde"], params[f"{param}_hasta"] = valor
+        elif op == 'last_days':
+            # Fecha de corte en UTC, sin zona para compararla con columnas DATETIME/TIMESTAMP
+            desde = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=int(valor))
+            condiciones.append(f"{columna} >= %({param})s")
+            params[param] = desde
+        else:
+            raise ValueError(f"Operador de filtro no soportado: {op}")
+
+    return " AND ".join(condiciones) or None, params
+
+
+def apply_query(conn, nombre, spec, consulta):
+    """
+    Aplica la consulta del gateway a la especificación de una tabla.
+
+    Returns:
+        Tupla (especificación con las columnas pedidas, condición o None, parámetros)
+    """
+    permitidas = exported_columns(conn, spec)
+    columnas = consulta.get('columns')
+    if columnas:
+        for columna in columnas:
+            _check_column(columna, permitidas, nombre)
+        spec = {**spec, 'columnas': ', '.join(columnas)}
+
+    where, params = build_where(consulta.get('filters', []), permitidas, nombre)
+    return spec, where, params
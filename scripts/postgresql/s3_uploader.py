@@ -1,57 +1,28 @@
-import boto3
 import os
 from datetime import datetime
 import io
+import re
 import sys
+import tempfile
+from checkpoint import ResumableUpload
+from storage import get_storage_backend
 
 
 class S3Uploader:
     def __init__(self):
-        self.bucket_name = os.getenv("AWS_BUCKET_NAME")
-        self.region = os.getenv("AWS_REGION", "us-east-1")
-        
-        # Verificar que existe el archivo de credenciales
-        credentials_file = "/root/.aws/credentials"
-        if not os.path.exists(credentials_file):
-            raise RuntimeError(
-                f"Archivo de credenciales no encontrado en {credentials_file}. "
-                f"Asegúrate de que el volumen esté montado correctamente."
-            )
-        
-        # Verificar permisos de lectura
-        if not os.access(credentials_file, os.R_OK):
-            raise RuntimeError(
-                f"No hay permisos de lectura en {credentials_file}"
-            )
-        
-        # Leer y verificar contenido (sin mostrar credenciales)
-        try:
-            with open(credentials_file, 'r') as f:
-                content = f.read()
-                if not content.strip():
-                    raise RuntimeError("El archivo de credenciales está vacío")
-                if '[default]' not in content:
-                    raise RuntimeError("No se encontró el perfil [default] en credenciales")
-                print("✓ Credenciales AWS encontradas y con formato válido", file=sys.stderr)
-        except Exception as e:
-            raise RuntimeError(f"Error leyendo credenciales: {str(e)}")
-        
-        # Configurar boto3 explícitamente
-        os.environ["AWS_SHARED_CREDENTIALS_FILE"] = credentials_file
-        os.environ["AWS_CONFIG_FILE"] = "/root/.aws/config"
-        os.environ["AWS_PROFILE"] = "default"
-        
-        try:
-            # Crear sesión usando el perfil explícito
-            session = boto3.Session(profile_name='default')
-            self.s3_client = session.client('s3', region_name=self.region)
-            
-            # Verificar credenciales haciendo una llamada simple
-            self.s3_client.list_buckets()
-            print(f"✓ Conexión exitosa a AWS S3 en región {self.region}", file=sys.stderr)
-            
-        except Exception as e:
-            raise RuntimeError(f"Error al crear cliente S3: {str(e)}")
+        # Backend según STORAGE_BACKEND (s3 o local); S3 valida credenciales en el primer uso
+        self.storage = get_storage_backend()
+
+        # Bytes subidos por carpeta (tabla), reportados en el resultado de la ingesta
+        self.uploaded_bytes = {}
+
+    def record_bytes(self, database_name: str, size: int):
+        self.uploaded_bytes[database_name] = self.uploaded_bytes.get(database_name, 0) + size
+
+    def _build_key(self, database_name: str, table_name: str, extension: str) -> str:
+        """Clave organizada por carpetas: <carpeta>/<tabla>_<timestamp>.<extensión>"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"{database_name}/{table_name}_{timestamp}.{extension}"
 
     def upload_csv(self, csv_content: str, database_name: str, table_name: str) -> str:
         """
@@ -65,36 +36,130 @@ class S3Uploader:
         Returns:
             URL del archivo subido
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        s3_key = f"{database_name}/{table_name}_{timestamp}.csv"
-
         csv_buffer = io.BytesIO(csv_content.encode('utf-8'))
+        return self.upload_fileobj(csv_buffer, database_name, table_name, 'csv', 'text/csv')
+
+    def upload_fileobj(self, fileobj, database_name: str, table_name: str, extension: str,
+                       content_type: str) -> str:
+        """
+        Sube un archivo abierto (en memoria o en disco) al bucket S3 en streaming
+
+        Args:
+            fileobj: Objeto tipo archivo posicionado al inicio
+            database_name: Nombre de la base de datos
+            table_name: Nombre de la tabla o colección
+            extension: Extensión del archivo (csv, parquet)
+            content_type: Content-Type del objeto
+
+        Returns:
+            URL del archivo subido
+        """
+        s3_key = self._build_key(database_name, table_name, extension)
+
+        try:
+            fileobj.seek(0, os.SEEK_END)
+            size = fileobj.tell()
+            fileobj.seek(0)
+            self.storage.put_fileobj(s3_key, fileobj, content_type)
+            print(f"✓ Archivo subido exitosamente: {s3_key}", file=sys.stderr)
+        except Exception as e:
+            raise RuntimeError(f"Error subiendo archivo a S3: {str(e)}")
+
+        self.record_bytes(database_name, size)
+
+        return self.storage.url(s3_key)
+
+    def upload_file(self, path: str, database_name: str, table_name: str, extension: str,
+                    content_type: str) -> str:
+        """
+        Sube un archivo local al bucket S3 (transferencia multiparte en streaming)
+
+        Args:
+            path: Ruta del archivo local
+            database_name: Nombre de la base de datos
+            table_name: Nombre de la tabla o colección
+            extension: Extensión del archivo (csv, parquet)
+            content_type: Content-Type del objeto
+
+        Returns:
+            URL del archivo subido
+        """
+        s3_key = self._build_key(database_name, table_name, extension)
 
         try:
-            self.s3_client.upload_fileobj(
-                csv_buffer,
-                self.bucket_name,
-                s3_key,
-                ExtraArgs={'ContentType': 'text/csv'}
-            )
+            self.storage.put_file(s3_key, path, content_type)
             print(f"✓ Archivo subido exitosamente: {s3_key}", file=sys.stderr)
         except Exception as e:
             raise RuntimeError(f"Error subiendo archivo a S3: {str(e)}")
 
-        s3_url = f"s3://{self.bucket_name}/{s3_key}"
-        return s3_url
+        self.record_bytes(database_name, os.path.getsize(path))
+
+        return self.storage.url(s3_key)
+
+    def resumable_upload(self, database_name: str, table_name: str, extension: str,
+                         content_type: str, fingerprint: str = None) -> ResumableUpload:
+        """
+        Crea una subida multiparte con checkpoint para la tabla
+
+        Args:
+            database_name: Nombre de la base de datos
+            table_name: Nombre de la tabla o colección
+            extension: Extensión del archivo
+            content_type: Content-Type del objeto
+            fingerprint: Huella de la consulta; un checkpoint con otra huella se descarta
+
+        Returns:
+            ResumableUpload (llamar a start() antes de escribir)
+        """
+        return ResumableUpload(self.storage, database_name, table_name, extension, content_type,
+                               fingerprint=fingerprint)
+
+    def download_latest(self, database_name: str, table_name: str, dest_dir: str):
+        """
+        Descarga el export más reciente (CSV o Parquet) de una tabla, incluida su
+        versión compactada (la retención borra los exports que esta reemplaza)
+
+        Args:
+            database_name: Nombre de la base de datos (carpeta)
+            table_name: Nombre de la tabla
+            dest_dir: Directorio local de destino
 
-    def upload_dataframe(self, df, database_name: str, table_name: str) -> str:
+        Returns:
+            Ruta del archivo descargado, o None si no hay exports
         """
-        Sube un DataFrame de pandas como CSV al bucket S3
+        # Sólo snapshots completos (<tabla>_<timestamp>.<ext>): el prefijo también
+        # abarca consultas, shards y partes multipart de la misma tabla
+        snapshot = re.compile(rf"^{re.escape(table_name)}_\d{{8}}_\d{{6}}\.(csv|parquet)$")
+        prefixes = [f"{database_name}/{table_name}_", f"{database_name}/compacted/{table_name}_"]
+        objects = [obj for prefix in prefixes for obj in self.storage.list(prefix)
+                   if snapshot.match(os.path.basename(obj['Key']))]
+        if not objects:
+            return None
+
+        latest = max(objects, key=lambda obj: obj['LastModified'])
+        path = os.path.join(dest_dir, os.path.basename(latest['Key']))
+        self.storage.download(latest['Key'], path)
+        print(f"✓ Descargado {latest['Key']}", file=sys.stderr)
+        return path
+
+    def upload_dataframe(self, df, database_name: str, table_name: str, output_format: str = 'csv') -> str:
+        """
+        Sube un DataFrame de pandas como CSV (o Parquet) al bucket S3
 
         Args:
             df: DataFrame de pandas
             database_name: Nombre de la base de datos
             table_name: Nombre de la tabla o colección
+            output_format: 'csv' o 'parquet'
 
         Returns:
             URL del archivo subido
         """
+        if output_format == 'parquet':
+            with tempfile.NamedTemporaryFile(suffix='.parquet') as tmp:
+                df.to_parquet(tmp.name, index=False)
+                return self.upload_file(tmp.name, database_name, table_name, 'parquet',
+                                        'application/vnd.apache.parquet')
+
         csv_content = df.to_csv(index=False)
-        return self.upload_csv(csv_content, database_name, table_name)
\ No newline at end of file
+        return self.upload_csv(csv_content, database_name, table_name)
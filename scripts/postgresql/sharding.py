@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import sys
+
+# Modos de un contenedor shard (SHARD_MODE):
+#   plan: calcula los límites de cada shard de SHARD_TABLE
+#   export: exporta solo el rango [SHARD_LOWER, SHARD_UPPER) de SHARD_TABLE
+#   manifest: sube el manifiesto combinado (SHARD_MANIFEST) de los shards
+SHARD_MODES = ('plan', 'export', 'manifest')
+
+
+def shard_config():
+    """Configuración de shard desde el entorno; None si el contenedor no es un shard"""
+    mode = os.getenv("SHARD_MODE")
+    if not mode:
+        return None
+    if mode not in SHARD_MODES:
+        raise ValueError(f"SHARD_MODE no soportado: {mode}")
+
+    return {
+        'mode': mode,
+        'table': os.getenv("SHARD_TABLE"),
+        'index': int(os.getenv("SHARD_INDEX", 0)),
+        'count': int(os.getenv("SHARD_COUNT", 1)),
+        'lower': os.getenv("SHARD_LOWER") or None,
+        'upper': os.getenv("SHARD_UPPER") or None,
+    }
+
+
+def excluded_tables():
+    """Tablas que exporta otro contenedor (EXCLUDE_TABLES, separadas por coma)"""
+    return {t.strip() for t in os.getenv("EXCLUDE_TABLES", "").split(",") if t.strip()}
+
+
+def split_int_range(minimo, maximo, count):
+    """
+    Divide [minimo, maximo] en count rangos contiguos de clave entera.
+    El primero y el último quedan abiertos para no perder filas nuevas.
+
+    Returns:
+        Lista de tuplas (inferior, superior); None indica rango abierto
+    """
+    if minimo is None or count <= 1:
+        return [(None, None)]
+
+    paso = max((maximo - minimo + 1) // count, 1)
+    limites = sorted({minimo + paso * k for k in range(1, count) if minimo + paso * k <= maximo})
+    return list(zip([None] + limites, limites + [None]))
+
+
+def encode_bounds(bounds, encode=json.dumps):
+    """Serializa los límites de cada shard para pasarlos como variables de entorno"""
+    return [
+        {
+            'lower': encode(lower) if lower is not None else None,
+            'upper': encode(upper) if upper is not None else None,
+        }
+        for lower, upper in bounds
+    ]
+
+
+def decode_bound(value, decode=json.loads):
+    return decode(value) if value is not None else None
+
+
+def shard_name(table_name, index):
+    return f"{table_name}_shard{index:03d}"
+
+
+def write_manifest(s3_uploader, manifest):
+    """
+    Sube el manifiesto de una tabla exportada en partes a la carpeta de cada dataset
+    con partes en él (una colección de MongoDB puede generar varios datasets), para
+    que cada carpeta tenga la lista completa de las partes de esa ejecución.
+
+    Returns:
+        URL del manifiesto en la carpeta de la tabla
+    """
+    table_name = manifest['table']
+    datasets = {table_name}
+    for shard in manifest.get('shards', []):
+        datasets.update(dataset for dataset, info in (shard.get('result') or {}).items()
+                        if isinstance(info, dict) and info.get('url'))
+
+    data = json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8')
+    urls = {}
+    for dataset in sorted(datasets):
+        urls[dataset] = s3_uploader.upload_fileobj(io.BytesIO(data), dataset, f"{dataset}_manifest",
+                                                   'json', 'application/json')
+    print(f"✓ {table_name}: manifiesto de {len(manifest.get('shards', []))} partes", file=sys.stderr)
+    return urls[table_name]
+
+
+def upload_manifest(s3_uploader, table_name):
+    """
+    Sube el manifiesto combinado de los shards de una tabla (SHARD_MANIFEST).
+
+    Returns:
+        Diccionario {'manifest': url}
+    """
+    manifest = json.loads(os.environ["SHARD_MANIFEST"])
+    return {'manifest': write_manifest(s3_uploader, {**manifest, 'table': table_name})}